@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from pitch_path.model.inference import (MODEL_DIR, MODEL_FILE, SCALER_FILE, VERSIONS_DIR, LATEST_FILE, PitchPathModel,
+                                        get_latest_version, get_version_dir, save_model_arrays)
+from pitch_path.utils.cache import write_atomic
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_DIR = "partitions"
+STATE_FILE = "state.json"
+DEFAULT_DRIFT_THRESHOLD = 0.05
+SEED = 42
+MAX_ITER = 100
+
+
+def get_partition_path(training_dir: str, sched_id: int) -> str:
+    return os.path.join(training_dir, PARTITIONS_DIR, f"sched_id={sched_id}")
+
+def get_partition_sched_ids(training_dir: str) -> list:
+    """Helper function to list the sched_ids that already have a training partition.
+
+    Args:
+        training_dir (str): training data directory
+
+    Returns:
+        list: sorted sched_ids
+    """
+    partitions_dir = os.path.join(training_dir, PARTITIONS_DIR)
+    if not os.path.isdir(partitions_dir):
+        return []
+    return sorted(int(f.split('=', 1)[1]) for f in os.listdir(partitions_dir) if f.startswith('sched_id='))
+
+def append_training_partitions(features_df: pd.DataFrame, training_dir: str, overwrite: bool=False) -> pd.DataFrame:
+    """Function to append pitcher features to the training data, partitioned by game, instead of concatenating every features
+    file into one training file. Games that already have a partition are skipped, since their pitches have already been counted
+    in the model, unless `overwrite` is set.
+
+    Args:
+        features_df (pd.DataFrame): pitcher features for one or more games
+        training_dir (str): training data directory
+        overwrite (bool, optional): replace the partitions of games that are already in the training data. Defaults to False.
+
+    Returns:
+        pd.DataFrame: the pitches that were added
+    """
+    os.makedirs(os.path.join(training_dir, PARTITIONS_DIR), exist_ok=True)
+    existing = set(get_partition_sched_ids(training_dir))
+    added = []
+    for sched_id, game_df in features_df.groupby('sched_id', sort=True):
+        if sched_id in existing and not overwrite:
+            logger.warning(f"sched_id {sched_id} is already in the training data, skipping it.")
+            continue
+        game_df = game_df.reset_index(drop=True)
+        write_atomic(get_partition_path(training_dir, sched_id), lambda path: game_df.to_feather(path=path))
+        added.append(game_df)
+    logger.info(f"Added {len(added)} games to the training data in {training_dir}")
+    return pd.concat(added, ignore_index=True) if added else features_df.iloc[:0]
+
+def read_training_partitions(training_dir: str, sched_ids: list=None, columns: list=None) -> pd.DataFrame:
+    """Function to read the partitioned training data back into a single table.
+
+    Args:
+        training_dir (str): training data directory
+        sched_ids (list, optional): games to read. Defaults to every game.
+        columns (list, optional): columns to read. Defaults to every column.
+
+    Returns:
+        pd.DataFrame: training data
+    """
+    sched_ids = get_partition_sched_ids(training_dir) if sched_ids is None else sched_ids
+    dfs = [pd.read_feather(get_partition_path(training_dir, sched_id), columns=columns) for sched_id in sched_ids]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=columns)
+
+def load_version(model_dir: str=MODEL_DIR, version: str=None) -> tuple:
+    """Function to load a model version with its incremental state. With no versions yet, the bundled model is loaded with no state.
+
+    Args:
+        model_dir (str, optional): model directory. Defaults to the bundled model directory.
+        version (str, optional): version to load. Defaults to the latest version.
+
+    Returns:
+        tuple: (model, scaler, state dict or None)
+    """
+    version = version or get_latest_version(model_dir)
+    version_dir = model_dir if version is None else get_version_dir(model_dir, version)
+    with open(os.path.join(version_dir, MODEL_FILE), 'rb') as f:
+        model = pickle.load(f)
+    with open(os.path.join(version_dir, SCALER_FILE), 'rb') as f:
+        scaler = pickle.load(f)
+    state = None
+    if version is not None:
+        with open(os.path.join(version_dir, STATE_FILE)) as f:
+            state = json.load(f)
+    return model, scaler, state
+
+def make_state(model_dir: str, feature_cols: list, counts: np.ndarray, n_samples: int, refit_centroids: np.ndarray, full_refit: bool,
+               drift: float=None, added_sched_ids: list=()) -> dict:
+    """Helper function to build the incremental state saved with a model version, see `update_model`.
+
+    Args:
+        model_dir (str): model directory the version is saved to, its latest version is the parent
+        feature_cols (list): feature columns in model order
+        counts (np.ndarray): pitches assigned to each centroid
+        n_samples (int): pitches the model has seen
+        refit_centroids (np.ndarray): centroids of the last full refit in feature units
+        full_refit (bool): whether this version is a full refit
+        drift (float, optional): largest centroid movement since the last full refit. Defaults to None.
+        added_sched_ids (list, optional): games added to the training data by this version. Defaults to none.
+
+    Returns:
+        dict: incremental state
+    """
+    return {
+        'parent': get_latest_version(model_dir),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'feature_cols': list(feature_cols),
+        'counts': np.asarray(counts).tolist(),
+        'n_samples': int(n_samples),
+        # centroids of the last full refit in feature units, drift is measured from these
+        'refit_centroids': np.asarray(refit_centroids).tolist(),
+        'full_refit': bool(full_refit),
+        'drift': drift,
+        'added_sched_ids': sorted(int(s) for s in added_sched_ids),
+    }
+
+def save_version(model_dir: str, model, scaler, state: dict) -> str:
+    """Function to save a new model version and point LATEST at it. The version directory is written under a temporary name and
+    renamed into place, so a reader never sees a partial version.
+
+    Args:
+        model_dir (str): model directory
+        model: fitted KMeans model
+        scaler: fitted MinMaxScaler
+        state (dict): incremental state, see `update_model`
+
+    Returns:
+        str: the new version
+    """
+    versions_dir = os.path.join(model_dir, VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+    existing = [int(v[1:]) for v in os.listdir(versions_dir) if v.startswith('v') and v[1:].isdigit()]
+    version = f"v{max(existing, default=0) + 1:04d}"
+    state = {**state, 'version': version}
+
+    tmp_dir = tempfile.mkdtemp(dir=versions_dir, prefix=".tmp_")
+    try:
+        with open(os.path.join(tmp_dir, MODEL_FILE), 'wb') as f:
+            pickle.dump(model, f)
+        with open(os.path.join(tmp_dir, SCALER_FILE), 'wb') as f:
+            pickle.dump(scaler, f)
+        with open(os.path.join(tmp_dir, STATE_FILE), 'w') as f:
+            json.dump(state, f, indent=2)
+        save_model_arrays(tmp_dir, model, scaler)
+        os.rename(tmp_dir, get_version_dir(model_dir, version))
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+    def write_latest(path: str) -> None:
+        with open(path, 'w') as f:
+            f.write(version)
+    write_atomic(os.path.join(versions_dir, LATEST_FILE), write_latest)
+    logger.info(f"Saved model version {version} to {get_version_dir(model_dir, version)}")
+    return version
+
+def rescale_centroids(centroids: np.ndarray, old_scaler, new_scaler) -> np.ndarray:
+    """Helper function to re-express centroids fit in one scaler's [0, 1] space in another scaler's space, by going back to the
+    original feature units.
+
+    Args:
+        centroids (np.ndarray): (clusters, features) centroids scaled with `old_scaler`
+        old_scaler: scaler the centroids were fit with
+        new_scaler: scaler to express the centroids in
+
+    Returns:
+        np.ndarray: centroids scaled with `new_scaler`
+    """
+    raw_centroids = (centroids - old_scaler.min_) / old_scaler.scale_
+    return raw_centroids * new_scaler.scale_ + new_scaler.min_
+
+def update_centroids(centroids: np.ndarray, counts: np.ndarray, X: np.ndarray) -> tuple:
+    """Function to fold new pitches into the centroids. Each new pitch is assigned to its nearest centroid and every centroid
+    moves to the mean of its old pitches (kept as the centroid and a count) and its new ones, like a single mini-batch KMeans
+    step with a 1 / count learning rate. The cost only depends on the new pitches.
+
+    Args:
+        centroids (np.ndarray): (clusters, features) current centroids
+        counts (np.ndarray): pitches already assigned to each centroid
+        X (np.ndarray): (new pitches, features) scaled features
+
+    Returns:
+        tuple: (updated centroids, updated counts, labels of the new pitches)
+    """
+    distances = (centroids ** 2).sum(axis=1) - 2 * X @ centroids.T
+    labels = distances.argmin(axis=1)
+    k = centroids.shape[0]
+    new_counts = np.bincount(labels, minlength=k)
+    new_sums = np.zeros_like(centroids)
+    np.add.at(new_sums, labels, X)
+    total_counts = counts + new_counts
+    updated = np.where((total_counts > 0)[:, None], (centroids * counts[:, None] + new_sums) / np.maximum(total_counts, 1)[:, None], centroids)
+    return updated, total_counts, labels
+
+def fit_full(X_train: pd.DataFrame, k: int) -> tuple:
+    """Function to refit the scaler and KMeans from scratch, with the same settings as nbs/modeling.ipynb.
+
+    Args:
+        X_train (pd.DataFrame): training features
+        k (int): number of clusters
+
+    Returns:
+        tuple: (model, scaler, counts per cluster)
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import MinMaxScaler
+    scaler = MinMaxScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    model = KMeans(n_clusters=k, n_init='auto', max_iter=MAX_ITER, random_state=SEED).fit(X_train_scaled)
+    return model, scaler, np.bincount(model.labels_, minlength=k)
+
+def match_centroids(old_centroids: np.ndarray, new_centroids: np.ndarray) -> np.ndarray:
+    """Helper function to line up refit centroids with the ones they replace, since KMeans numbers its clusters arbitrarily and a
+    refit would otherwise shuffle the labels downstream results are keyed by. Each new centroid is paired with an old one so the
+    total distance between the pairs is the smallest possible (Hungarian assignment).
+
+    Args:
+        old_centroids (np.ndarray): (clusters, features) centroids before the refit
+        new_centroids (np.ndarray): (clusters, features) refit centroids, in the same space as `old_centroids`
+
+    Returns:
+        np.ndarray: order of the new centroids so that `new_centroids[order][i]` takes over cluster i
+    """
+    from scipy.optimize import linear_sum_assignment
+    distances = np.linalg.norm(old_centroids[:, None, :] - new_centroids[None, :, :], axis=2)
+    _, order = linear_sum_assignment(distances)
+    return order
+
+def update_model(new_features_df: pd.DataFrame, training_dir: str, model_dir: str=MODEL_DIR, drift_threshold: float=DEFAULT_DRIFT_THRESHOLD,
+                 force_refit: bool=False, overwrite: bool=False) -> str:
+    """Function to add new games to the training data and update the model without refitting on the whole history.
+
+    The new pitches are written to the partitioned training data (see `append_training_partitions`). The scaler's min and max are
+    widened with the new pitches (`MinMaxScaler.partial_fit`), the centroids are re-expressed under the new scaler, and the new
+    pitches are folded into the centroids with their stored counts (see `update_centroids`). If any centroid has moved more than
+    `drift_threshold` (in the scaled feature space) from where the last full refit put it, the scaler and model are refit from
+    scratch on every partition instead, and the refit clusters are renumbered to match the previous version (see
+    `match_centroids`). The result is saved as a new version under `model_dir/versions`.
+
+    The first update from the bundled model, which has no stored counts, counts the pitches already in the training partitions
+    once by assigning them to the centroids. With no partitions yet it does a full refit.
+
+    Args:
+        new_features_df (pd.DataFrame): pitcher features for the new games
+        training_dir (str): partitioned training data directory
+        model_dir (str, optional): model directory to read the latest version from and write the new version to. Defaults to the
+            bundled model directory.
+        drift_threshold (float, optional): largest centroid movement since the last full refit before refitting. Defaults to
+            DEFAULT_DRIFT_THRESHOLD.
+        force_refit (bool, optional): always refit from scratch. Defaults to False.
+        overwrite (bool, optional): replace games that are already in the training data. Their old pitches stay counted in the
+            centroids until the next full refit. Defaults to False.
+
+    Raises:
+        Exception: the new features are missing model feature columns, or a full refit has fewer pitches than clusters
+
+    Returns:
+        str: the new model version, or None if there was nothing new
+    """
+    model, scaler, state = load_version(model_dir)
+    pitch_path_model = PitchPathModel(model, scaler)
+    feature_cols = list(pitch_path_model.feature_cols)
+    k = model.cluster_centers_.shape[0]
+
+    # check everything before any partitions are written, so a failed update doesn't leave games in the training data that
+    # were never counted in the model
+    old_sched_ids = get_partition_sched_ids(training_dir)
+    new_df = new_features_df if overwrite else new_features_df[~new_features_df['sched_id'].isin(old_sched_ids)]
+    pitch_path_model.validate_features(new_df)
+    X_new = new_df[feature_cols].dropna()
+    if X_new.shape[0] == 0 and not force_refit:
+        logger.info("No new pitches with every model feature, the model is unchanged.")
+        return None
+    if force_refit or state is None:
+        replaced_sched_ids = set(new_df['sched_id'])
+        kept_sched_ids = [sched_id for sched_id in old_sched_ids if sched_id not in replaced_sched_ids]
+        n_train = X_new.shape[0] + read_training_partitions(training_dir, kept_sched_ids, feature_cols).dropna().shape[0]
+        if n_train < k:
+            raise Exception(f"Refitting {k} clusters needs at least {k} pitches with every model feature, "
+                            f"the training data in {training_dir} would have {n_train}.")
+
+    added_df = append_training_partitions(new_features_df, training_dir, overwrite)
+
+    if state is None and old_sched_ids:
+        logger.info(f"Counting the {len(old_sched_ids)} games already in the training data for the first incremental update")
+        old_X = read_training_partitions(training_dir, old_sched_ids, feature_cols).dropna()
+        _, counts, _ = update_centroids(model.cluster_centers_.astype(np.float64), np.zeros(k, dtype=np.int64),
+                                        scaler.transform(old_X).astype(np.float64))
+        state = {'counts': counts.tolist(), 'n_samples': int(old_X.shape[0]),
+                 'refit_centroids': ((model.cluster_centers_ - scaler.min_) / scaler.scale_).tolist()}
+
+    drift = None
+    full_refit = force_refit or state is None
+    if not full_refit:
+        # X_new is never empty here, only a forced refit goes on without new pitches
+        new_scaler = pickle.loads(pickle.dumps(scaler))
+        new_scaler.partial_fit(X_new)
+        centroids = rescale_centroids(model.cluster_centers_.astype(np.float64), scaler, new_scaler)
+        centroids, counts, _ = update_centroids(centroids, np.asarray(state['counts'], dtype=np.int64),
+                                                new_scaler.transform(X_new).astype(np.float64))
+        refit_centroids = np.asarray(state['refit_centroids']) * new_scaler.scale_ + new_scaler.min_
+        drift = float(np.linalg.norm(centroids - refit_centroids, axis=1).max())
+        logger.info(f"Centroids have moved {drift:.4f} since the last full refit (threshold {drift_threshold})")
+        full_refit = drift > drift_threshold
+
+    if full_refit:
+        logger.info("Refitting the model on the full training data")
+        X_train = read_training_partitions(training_dir, columns=feature_cols).dropna()
+        old_centroids = model.cluster_centers_.astype(np.float64)
+        old_scaler = scaler
+        model, new_scaler, counts = fit_full(X_train, k)
+
+        # keep the cluster ids of the previous version, matched in the refit's scaled space
+        order = match_centroids(rescale_centroids(old_centroids, old_scaler, new_scaler), model.cluster_centers_.astype(np.float64))
+        new_labels = np.empty(k, dtype=np.int64)
+        new_labels[order] = np.arange(k)
+        model.cluster_centers_ = model.cluster_centers_[order]
+        model.labels_ = new_labels[model.labels_].astype(model.labels_.dtype)
+        counts = counts[order]
+        refit_centroids = (model.cluster_centers_ - new_scaler.min_) / new_scaler.scale_
+        n_samples = int(X_train.shape[0])
+    else:
+        model.cluster_centers_ = centroids.astype(model.cluster_centers_.dtype)
+        refit_centroids = np.asarray(state['refit_centroids'])
+        n_samples = int(state['n_samples'] + X_new.shape[0])
+
+    new_state = make_state(model_dir, feature_cols, counts, n_samples, refit_centroids, full_refit, drift, added_df['sched_id'].unique())
+    return save_version(model_dir, model, new_scaler, new_state)
@@ -0,0 +1,225 @@
+from functools import lru_cache
+import hashlib
+import logging
+import os
+import pickle
+import numpy as np
+import pitch_path.model as model_files
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = model_files.__path__[0]
+MODEL_FILE = "pitch_path.pkl"
+SCALER_FILE = "pitch_path_scaler.pkl"
+# the arrays PitchPathModel needs from the pickles, so serving doesn't have to import sklearn to unpickle them
+ARRAYS_FILE = "pitch_path_model.npz"
+# model versions written by `pitch_path.model.incremental`, LATEST names the current one
+VERSIONS_DIR = "versions"
+LATEST_FILE = "LATEST"
+FEATURE_COLS = ['wrist_x_release', 'wrist_z_release', 'elbow_x_release', 'elbow_z_release']
+NO_LABEL = -1
+
+
+def hash_file(file_name: str) -> str:
+    """Helper function to get the sha256 of a file's contents.
+
+    Args:
+        file_name (str): file to hash
+
+    Returns:
+        str: sha256 hex digest
+    """
+    with open(file_name, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def get_latest_version(model_dir: str=MODEL_DIR) -> str:
+    """Helper function to get the latest model version, or None if there aren't any versions yet."""
+    latest_path = os.path.join(model_dir, VERSIONS_DIR, LATEST_FILE)
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path) as f:
+        return f.read().strip()
+
+def get_version_dir(model_dir: str, version: str) -> str:
+    """Helper function to get the directory of a model version. It holds a model and scaler pair `PitchPathModel.from_dir` can load."""
+    return os.path.join(model_dir, VERSIONS_DIR, version)
+
+def save_model_arrays(model_dir: str, model, scaler, feature_cols: list=None) -> None:
+    """Function to write the scaler and centroid arrays of a model and scaler pair next to their pickles, see `PitchPathModel.from_dir`.
+    The pickles have to be written first, their hashes are stored with the arrays so a stale arrays file can be detected.
+
+    Args:
+        model_dir (str): directory with the model and scaler pickles
+        model: fitted KMeans model
+        scaler: fitted MinMaxScaler
+        feature_cols (list, optional): feature columns in model order. Defaults to the columns the scaler was fit on.
+    """
+    if feature_cols is None:
+        feature_cols = list(getattr(scaler, 'feature_names_in_', FEATURE_COLS))
+    with open(os.path.join(model_dir, ARRAYS_FILE), 'wb') as f:
+        np.savez(f, scale=np.asarray(scaler.scale_, dtype=np.float64), min=np.asarray(scaler.min_, dtype=np.float64),
+                 centroids=np.asarray(model.cluster_centers_, dtype=np.float64), feature_cols=np.array(feature_cols),
+                 model_sha256=np.array(hash_file(os.path.join(model_dir, MODEL_FILE))),
+                 scaler_sha256=np.array(hash_file(os.path.join(model_dir, SCALER_FILE))))
+
+
+class PitchPathModel:
+    """Class used to assign arm path clusters with the bundled KMeans model and scaler. The scaler and cluster centers are pulled
+    out of the pickled sklearn objects once, so assigning clusters to a batch of pitches is a single vectorized min max transform
+    and nearest centroid lookup.
+    """
+    def __init__(self, model, scaler, feature_cols: list=None) -> None:
+        if feature_cols is None:
+            feature_cols = list(getattr(scaler, 'feature_names_in_', FEATURE_COLS))
+        self.set_arrays(scaler.scale_, scaler.min_, model.cluster_centers_, feature_cols)
+        self.model = model
+        self.scaler = scaler
+
+    def set_arrays(self, scale: np.ndarray, min: np.ndarray, centroids: np.ndarray, feature_cols: list) -> None:
+        self.model = None
+        self.scaler = None
+        self.feature_cols = list(feature_cols)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.min = np.asarray(min, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.centroid_norms = (self.centroids ** 2).sum(axis=1)
+
+        if self.centroids.shape[1] != len(self.feature_cols):
+            raise Exception(f"Model expects {self.centroids.shape[1]} features but {len(self.feature_cols)} feature columns were given.")
+
+    @classmethod
+    def from_arrays(cls, scale: np.ndarray, min: np.ndarray, centroids: np.ndarray, feature_cols: list=FEATURE_COLS) -> "PitchPathModel":
+        """Build a model from the min max scaler `scale_` and `min_` arrays and the cluster centers, without the sklearn objects.
+        `model` and `scaler` are None on a model built this way.
+        """
+        pitch_path_model = cls.__new__(cls)
+        pitch_path_model.set_arrays(scale, min, centroids, feature_cols)
+        return pitch_path_model
+
+    @classmethod
+    def from_dir(cls, model_dir: str=MODEL_DIR, model_file: str=MODEL_FILE, scaler_file: str=SCALER_FILE,
+                 arrays_file: str=ARRAYS_FILE) -> "PitchPathModel":
+        """Load a model from a directory. If the directory has model versions (see `pitch_path.model.incremental`), the version
+        `versions/LATEST` names is loaded instead of the model at the top of the directory. If the directory has the arrays written by `save_model_arrays` they are loaded instead of
+        the pickles, which needs only numpy, otherwise the model and scaler are unpickled (and sklearn imported). The arrays are only
+        used if the pickle hashes stored with them match the pickles in the directory, so arrays left over from an older model fall
+        back to the pickles with a warning.
+
+        Args:
+            model_dir (str, optional): model directory. Defaults to the bundled model.
+            model_file (str, optional): model pickle. Defaults to MODEL_FILE.
+            scaler_file (str, optional): scaler pickle. Defaults to SCALER_FILE.
+            arrays_file (str, optional): model arrays. Defaults to ARRAYS_FILE.
+
+        Returns:
+            PitchPathModel: loaded model
+        """
+        version = get_latest_version(model_dir)
+        if version is not None:
+            model_dir = get_version_dir(model_dir, version)
+        logger.info(f"Loading pitch path model from {model_dir}")
+        arrays_path = os.path.join(model_dir, arrays_file)
+        model_path = os.path.join(model_dir, model_file)
+        scaler_path = os.path.join(model_dir, scaler_file)
+        if os.path.exists(arrays_path):
+            with np.load(arrays_path) as arrays:
+                has_pickles = os.path.exists(model_path) and os.path.exists(scaler_path)
+                if not has_pickles or ('model_sha256' in arrays and 'scaler_sha256' in arrays and
+                                       str(arrays['model_sha256']) == hash_file(model_path) and
+                                       str(arrays['scaler_sha256']) == hash_file(scaler_path)):
+                    return cls.from_arrays(arrays['scale'], arrays['min'], arrays['centroids'], arrays['feature_cols'].tolist())
+            logger.warning(f"{arrays_path} doesn't match the model and scaler pickles, loading the pickles instead. "
+                           "Rewrite it with `save_model_arrays` to serve without sklearn.")
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        return cls(model, scaler)
+
+    def validate_features(self, df) -> None:
+        """Check that all the feature columns the model was trained on are in the dataframe.
+
+        Args:
+            df (pd.DataFrame): pitcher features dataframe
+
+        Raises:
+            Exception: missing feature columns
+        """
+        missing_cols = [col for col in self.feature_cols if col not in df.columns]
+        if missing_cols:
+            raise Exception(f"Missing feature columns required by the model: {missing_cols}")
+
+    def get_feature_array(self, features) -> np.ndarray:
+        """Helper function to get the model features as a (pitches, features) array in the order the model expects.
+
+        Args:
+            features: pitcher features dataframe, list of feature dicts, or an array with the columns already in model order
+
+        Returns:
+            np.ndarray: feature array
+        """
+        # dataframes are recognized by their columns so pandas doesn't have to be imported to serve the model
+        if hasattr(features, 'columns'):
+            self.validate_features(features)
+            return features[self.feature_cols].to_numpy(dtype=np.float64)
+        if len(features) > 0 and isinstance(features[0], dict):
+            missing_cols = [col for col in self.feature_cols if col not in features[0]]
+            if missing_cols:
+                raise Exception(f"Missing feature columns required by the model: {missing_cols}")
+            return np.array([[row[col] for col in self.feature_cols] for row in features], dtype=np.float64).reshape(-1, len(self.feature_cols))
+        X = np.asarray(features, dtype=np.float64).reshape(-1, len(self.feature_cols))
+        return X
+
+    def predict(self, features) -> np.ndarray:
+        """Assign a cluster to every pitch. Pitches with a missing feature value are labeled -1.
+
+        Args:
+            features: pitcher features dataframe, list of feature dicts, or an array with the columns already in model order
+
+        Returns:
+            np.ndarray: cluster label for every pitch
+        """
+        X = self.get_feature_array(features)
+        X_scaled = X * self.scale + self.min
+        # squared distance to every centroid without the per pitch norm, which doesn't change the argmin
+        distances = self.centroid_norms - 2 * X_scaled @ self.centroids.T
+        labels = distances.argmin(axis=1)
+        labels[np.isnan(X).any(axis=1)] = NO_LABEL
+        return labels
+
+    def get_centroids_df(self):
+        """Get the cluster centers in the original feature units.
+
+        Returns:
+            pd.DataFrame: cluster centers with a label column
+        """
+        import pandas as pd
+        centroids_df = pd.DataFrame((self.centroids - self.min) / self.scale, columns=self.feature_cols)
+        centroids_df.insert(0, 'label', np.arange(self.centroids.shape[0]))
+        return centroids_df
+
+
+@lru_cache(maxsize=None)
+def load_model(model_dir: str=MODEL_DIR) -> PitchPathModel:
+    """Load the model and scaler once per process. Later calls with the same directory return the cached model, so a version
+    saved after the first call is only picked up once `load_model.cache_clear()` is called or the process restarts.
+
+    Args:
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+
+    Returns:
+        PitchPathModel: loaded model
+    """
+    return PitchPathModel.from_dir(model_dir)
+
+def predict_clusters(features, model_dir: str=MODEL_DIR) -> np.ndarray:
+    """Assign clusters to a batch of pitches with the cached model.
+
+    Args:
+        features: pitcher features dataframe, list of feature dicts, or an array with the columns already in model order
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+
+    Returns:
+        np.ndarray: cluster label for every pitch
+    """
+    return load_model(model_dir).predict(features)
@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+from multiprocessing import shared_memory
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+from pitch_path.model.inference import MODEL_FILE, SCALER_FILE, get_latest_version, save_model_arrays
+from pitch_path.model.incremental import make_state, save_version
+
+logger = logging.getLogger(__name__)
+
+ID_COLS = ['pitcher_id', 'sched_id', 'astros_pitch_id']
+RESULTS_FILE = "model_selection_results.csv"
+DEFAULT_K_VALUES = list(range(2, 8))
+DEFAULT_SEEDS = [42]
+DEFAULT_SAMPLE_SIZE = 10000
+MAX_ITER = 100
+
+# feature groups compared in nbs/modeling.ipynb, the production model uses wrist_elbow_release_xz
+CLUSTER_COLS = {
+    'wrist_cols': ['distance_traveled_wrist', 'wrist_x_start', 'wrist_y_start', 'wrist_z_start', 'wrist_x_time_25', 'wrist_y_time_25',
+                   'wrist_z_time_25', 'wrist_x_time_5', 'wrist_y_time_5', 'wrist_z_time_5', 'wrist_x_time_75', 'wrist_y_time_75',
+                   'wrist_z_time_75', 'wrist_x_release', 'wrist_y_release', 'wrist_z_release'],
+    'wrist_and_elbow_cols': ['distance_traveled_wrist', 'wrist_x_start', 'wrist_y_start', 'wrist_z_start', 'wrist_x_time_5', 'wrist_y_time_5',
+                             'wrist_z_time_5', 'wrist_x_release', 'wrist_y_release', 'wrist_z_release', 'elbow_x_start', 'elbow_y_start',
+                             'elbow_z_start', 'elbow_x_time_5', 'elbow_y_time_5', 'elbow_z_time_5', 'elbow_x_release', 'elbow_y_release',
+                             'elbow_z_release'],
+    'release_cols': ['wrist_x_release', 'wrist_y_release', 'wrist_z_release', 'elbow_x_release', 'elbow_y_release', 'elbow_z_release'],
+    'wrist_elbow_midpt_release': ['wrist_x_time_5', 'wrist_y_time_5', 'wrist_z_time_5', 'wrist_x_release', 'wrist_y_release', 'wrist_z_release',
+                                  'elbow_x_time_5', 'elbow_y_time_5', 'elbow_z_time_5', 'elbow_x_release', 'elbow_y_release', 'elbow_z_release'],
+    'wrist_elbow_midpt_release_xz': ['wrist_x_time_5', 'wrist_z_time_5', 'wrist_x_release', 'wrist_z_release', 'elbow_x_time_5', 'elbow_z_time_5',
+                                     'elbow_x_release', 'elbow_z_release'],
+    'wrist_elbow_release_xz': ['wrist_x_release', 'wrist_z_release', 'elbow_x_release', 'elbow_z_release'],
+    'wrist_and_elbow_cols_xz': ['wrist_x_start', 'wrist_z_start', 'wrist_x_time_5', 'wrist_z_time_5', 'wrist_x_release', 'wrist_z_release',
+                                'elbow_x_start', 'elbow_z_start', 'elbow_x_time_5', 'elbow_z_time_5', 'elbow_x_release', 'elbow_z_release'],
+    'all_joints_midpt_release_xz': ['wrist_x_time_5', 'wrist_z_time_5', 'wrist_x_release', 'wrist_z_release', 'elbow_x_time_5', 'elbow_z_time_5',
+                                    'elbow_x_release', 'elbow_z_release', 'shoulder_x_time_5', 'shoulder_z_time_5', 'shoulder_x_release',
+                                    'shoulder_z_release'],
+    'all_joints_release_xz': ['wrist_x_release', 'wrist_z_release', 'elbow_x_release', 'elbow_z_release', 'shoulder_x_release', 'shoulder_z_release'],
+    'all_joints_cols_xz': ['wrist_x_start', 'wrist_z_start', 'wrist_x_time_5', 'wrist_z_time_5', 'wrist_x_release', 'wrist_z_release',
+                           'elbow_x_start', 'elbow_z_start', 'elbow_x_time_5', 'elbow_z_time_5', 'elbow_x_release', 'elbow_z_release',
+                           'shoulder_x_start', 'shoulder_z_start', 'shoulder_x_time_25', 'shoulder_z_time_25', 'shoulder_x_time_5',
+                           'shoulder_z_time_5', 'shoulder_x_time_75', 'shoulder_z_time_75', 'shoulder_x_release', 'shoulder_z_release'],
+}
+
+# scaled training matrix shared with the worker processes, set by `init_worker`
+_shared = {}
+
+
+def get_cluster_cols(df: pd.DataFrame, feature_sets: list=None) -> dict:
+    """Helper function to get the feature groups to compare, including `all` for every feature column like the notebook.
+
+    Args:
+        df (pd.DataFrame): training data
+        feature_sets (list, optional): names of the feature groups to keep. Defaults to every group.
+
+    Raises:
+        Exception: unknown feature group or a feature group column isn't in the training data
+
+    Returns:
+        dict: feature group name to columns
+    """
+    cluster_cols = {'all': [col for col in df.columns if col not in ID_COLS], **CLUSTER_COLS}
+    if feature_sets is not None:
+        unknown = [name for name in feature_sets if name not in cluster_cols]
+        if unknown:
+            raise Exception(f"Unknown feature sets {unknown}, expected some of {list(cluster_cols)}")
+        cluster_cols = {name: cluster_cols[name] for name in feature_sets}
+    missing_cols = sorted({col for cols in cluster_cols.values() for col in cols if col not in df.columns})
+    if missing_cols:
+        raise Exception(f"Training data is missing feature columns: {missing_cols}")
+    return cluster_cols
+
+def init_worker(shm_name: str, shape: tuple, dtype: str, threads: int) -> None:
+    """Pool initializer that attaches the worker to the shared scaled matrix, so it is never pickled into the tasks."""
+    from threadpoolctl import threadpool_limits
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm
+    _shared['X'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    # one BLAS/OpenMP thread per worker, the pool is already using the cores
+    _shared['threadpool_limits'] = threadpool_limits(threads)
+
+def fit_candidate(feature_set: str, col_positions: list, k: int, seed: int, sample_size: int, mini_batch: bool) -> dict:
+    """Function to fit KMeans for a single (feature set, k, seed) candidate on the shared scaled matrix and score it. The
+    silhouette is estimated on a random sample of `sample_size` pitches since the full score is O(n^2) in pitches.
+
+    Args:
+        feature_set (str): feature group name
+        col_positions (list): columns of the shared matrix in the feature group
+        k (int): number of clusters
+        seed (int): random seed for the KMeans init and the silhouette sample
+        sample_size (int): pitches to sample for the silhouette, None uses every pitch
+        mini_batch (bool): fit with MiniBatchKMeans instead of KMeans
+
+    Returns:
+        dict: candidate parameters, inertia, silhouette and fit seconds
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+    X = _shared['X'][:, col_positions]
+    start_time = time.perf_counter()
+    if mini_batch:
+        model = MiniBatchKMeans(n_clusters=k, n_init='auto', max_iter=MAX_ITER, random_state=seed).fit(X)
+    else:
+        model = KMeans(n_clusters=k, n_init='auto', max_iter=MAX_ITER, random_state=seed).fit(X)
+    fit_seconds = time.perf_counter() - start_time
+
+    sample_size = sample_size if sample_size is not None and sample_size < X.shape[0] else None
+    silhouette = silhouette_score(X, model.labels_, sample_size=sample_size, random_state=seed)
+    return {'feature_set': feature_set, 'k': k, 'seed': seed, 'n_features': len(col_positions), 'inertia': float(model.inertia_),
+            'silhouette': float(silhouette), 'n_iter': int(model.n_iter_), 'fit_seconds': fit_seconds,
+            'score_seconds': time.perf_counter() - start_time - fit_seconds}
+
+def select_model(training_data, output_dir: str, feature_sets: list=None, k_values: list=DEFAULT_K_VALUES, seeds: list=DEFAULT_SEEDS,
+                 sample_size: int=DEFAULT_SAMPLE_SIZE, mini_batch: bool=False, workers: int=None) -> pd.DataFrame:
+    """Function to sweep KMeans over every (feature set, k, seed) across a process pool and save the best model. This replaces the
+    sequential `train_k_means` loop in nbs/modeling.ipynb.
+
+    MinMax scaling is per column, so scaling the union of every feature set's columns once gives the same values as scaling each
+    feature set on its own. The scaled union is put in shared memory and every worker reads its columns from there instead of
+    getting its own pickled copy. The candidate with the best (sampled) silhouette is refit and saved as `pitch_path.pkl` with a
+    scaler fit on its columns as `pitch_path_scaler.pkl`, the same pair `pitch_path.model.inference` loads.
+
+    Args:
+        training_data: training data dataframe or feather file, e.g. from `pitch-path-process`
+        output_dir (str): directory to write the results table and the model pickles to
+        feature_sets (list, optional): feature groups to compare, see `CLUSTER_COLS`. Defaults to every group.
+        k_values (list, optional): numbers of clusters to try. Defaults to 2 to 7.
+        seeds (list, optional): random seeds to try. Defaults to [42].
+        sample_size (int, optional): pitches to sample for each silhouette, None for the full score. Defaults to DEFAULT_SAMPLE_SIZE.
+        mini_batch (bool, optional): fit with MiniBatchKMeans, faster for a season of pitches. Defaults to False.
+        workers (int, optional): number of worker processes. Defaults to the cpu count.
+
+    Returns:
+        pd.DataFrame: results table with a row per candidate, best silhouette first
+    """
+    df = pd.read_feather(training_data) if isinstance(training_data, str) else training_data
+    cluster_cols = get_cluster_cols(df, feature_sets)
+    union_cols = list(dict.fromkeys(col for cols in cluster_cols.values() for col in cols))
+
+    missing = df[union_cols].isna().any(axis=1)
+    if missing.any():
+        logger.warning(f"Dropping {missing.sum()} pitches with missing feature values.")
+        df = df[~missing]
+    from sklearn.preprocessing import MinMaxScaler
+    X_scaled = MinMaxScaler().fit_transform(df[union_cols].to_numpy(dtype=np.float64))
+    col_positions = {name: [union_cols.index(col) for col in cols] for name, cols in cluster_cols.items()}
+
+    tasks = [(name, col_positions[name], k, seed, sample_size, mini_batch) for name in cluster_cols for k in k_values for seed in seeds]
+    workers = min(workers or os.cpu_count(), len(tasks))
+    logger.info(f"Fitting {len(tasks)} candidates on {X_scaled.shape[0]} pitches with {workers} workers")
+
+    shm = shared_memory.SharedMemory(create=True, size=X_scaled.nbytes)
+    try:
+        np.ndarray(X_scaled.shape, dtype=X_scaled.dtype, buffer=shm.buf)[:] = X_scaled
+        del X_scaled
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(shm.name, (df.shape[0], len(union_cols)), 'float64', 1)) as executor:
+            futures = [executor.submit(fit_candidate, *task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                logger.info(f"{result['feature_set']} k={result['k']} seed={result['seed']}: silhouette {result['silhouette']:.4f}, "
+                            f"inertia {result['inertia']:.4f}")
+                results.append(result)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results_df = pd.DataFrame(results).sort_values(['silhouette', 'feature_set', 'k', 'seed'], ascending=[False, True, True, True])
+    results_df = results_df.reset_index(drop=True)
+    os.makedirs(output_dir, exist_ok=True)
+    results_df.to_csv(os.path.join(output_dir, RESULTS_FILE), index=False)
+
+    best = results_df.iloc[0]
+    logger.info(f"Best candidate: {best['feature_set']} with k={best['k']} and seed={best['seed']}, silhouette {best['silhouette']:.4f}")
+    save_model(df[cluster_cols[best['feature_set']]], output_dir, int(best['k']), int(best['seed']), mini_batch)
+    return results_df
+
+def save_model(X_train: pd.DataFrame, output_dir: str, k: int, seed: int, mini_batch: bool=False) -> tuple:
+    """Function to fit the scaler and KMeans model on the training features and pickle them like nbs/modeling.ipynb does. If the
+    output directory has model versions (see `pitch_path.model.incremental`) the model is saved as a new version and `versions/LATEST`
+    pointed at it, since that is the model `PitchPathModel.from_dir` serves, otherwise it is written to the top of the directory.
+
+    Args:
+        X_train (pd.DataFrame): training features, the scaler keeps the column names
+        output_dir (str): directory to write the pickles or the new version to
+        k (int): number of clusters
+        seed (int): random seed
+        mini_batch (bool, optional): fit with MiniBatchKMeans instead of KMeans. Defaults to False.
+
+    Returns:
+        tuple: (model, scaler)
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from sklearn.preprocessing import MinMaxScaler
+    scaler = MinMaxScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    model_class = MiniBatchKMeans if mini_batch else KMeans
+    model = model_class(n_clusters=k, n_init='auto', max_iter=MAX_ITER, random_state=seed).fit(X_train_scaled)
+
+    if get_latest_version(output_dir) is not None:
+        state = make_state(output_dir, X_train.columns, np.bincount(model.labels_, minlength=k), X_train.shape[0],
+                           (model.cluster_centers_ - scaler.min_) / scaler.scale_, full_refit=True)
+        save_version(output_dir, model, scaler, state)
+        return model, scaler
+
+    logger.info(f"Writing model and scaler to {output_dir}")
+    with open(os.path.join(output_dir, MODEL_FILE), 'wb') as f:
+        pickle.dump(model, f)
+    with open(os.path.join(output_dir, SCALER_FILE), 'wb') as f:
+        pickle.dump(scaler, f)
+    save_model_arrays(output_dir, model, scaler)
+    return model, scaler
@@ -1,29 +1,62 @@
+from functools import lru_cache
 import logging
 import pandas as pd
 import pitch_path.files as files
-import pitch_path.utils.preprocessing as pp
+from pitch_path.files.joints import JOINT_IDS, JOINTS, JOINTS_COLUMNS
 import pitch_path.utils.features as feat
+import pitch_path.utils.kinematics as kin
+import pitch_path.utils.streaming as streaming
+import pitch_path.utils.instrumentation as instr
+from pitch_path.utils.instrumentation import Instrumentation, stage
+from pitch_path.utils.cache import FeatureCache, make_cache_key, SEGMENTATION_CODE_VERSION, FEATURES_CODE_VERSION
+from pitch_path.utils.pitch_batch import PitchBatch, get_coord_dtype
 import os
 
 logger = logging.getLogger(__name__)
 
 JOINTS_FILE_PATH = os.path.join(files.__path__[0], "joint_ids.csv")
-JOINTS_DF = pd.read_csv(JOINTS_FILE_PATH)
 ALL_HANDEDNESS = ['l', 'r']
 
 
+@lru_cache(maxsize=None)
+def get_joints_df() -> pd.DataFrame:
+    """Helper function to get the joint ids table (files/joint_ids.csv) as a dataframe, built from the embedded copy on first use."""
+    return pd.DataFrame(JOINTS, columns=JOINTS_COLUMNS)
+
+def __getattr__(name: str):
+    # JOINTS_DF is only built when it's used, so importing the module doesn't read the joint ids
+    if name == 'JOINTS_DF':
+        return get_joints_df()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class PitcherDataProcessor:
     """Class used to handled processing a raw pitch data file in the provided format for the evaluation.
     It will take in the raw data, filter to between start and release times, and calculate features.
+
+    With `lean=True` the raw file is read with only the joints we use, int32 ids, float32 coordinates and categorical handedness,
+    and the processed dataframe keeps float32 coordinates, categorical bats and throws and int8 flags. The features are still
+    float64 and match the default mode within the tolerance documented on `PitchBatch`.
+
+    With `kinematics=True` the peak and checkpoint values of the joint speeds, accelerations and arm angles are added to the
+    features, see `pitch_path.utils.kinematics`.
     """
-    def __init__(self, file_name: str, is_processed_file: bool=False) -> None:
+    def __init__(self, file_name: str, is_processed_file: bool=False, streaming: bool=False, leg_lift_window: int=30, cache: FeatureCache=None,
+                 instrumentation: Instrumentation=None, lean: bool=False, kinematics: bool=False) -> None:
         self.file_name = file_name
+        self.streaming = streaming
+        self.lean = lean
+        self.kinematics = kinematics
+        self.leg_lift_window = leg_lift_window
+        self.cache = cache
+        self.instrumentation = instrumentation
         self.metadata_cols = ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time']
         self.joints_of_interest = ['wrist', 'elbow', 'shoulder']
 
         # initialize all variables we want to save in the class
         self.df = None
-        self.wide_df = None
+        self.frame_batch = None
+        self.pitch_batch = None
         self.pitcher_df = None
         self.pitcher_features_df = None
         self.handedness = None
@@ -35,12 +68,20 @@ class PitcherDataProcessor:
         self.sched_id = None
         self.pitcher_id = None
         self.throws = None
+        self.cache_keys = None
 
         # process the file provided
-        if not is_processed_file:
-            self.initialize_from_raw_file(file_name)
-        else:
-            self.initialize_from_processed_file(file_name)
+        with self.instrumented():
+            if is_processed_file:
+                self.initialize_from_processed_file(file_name)
+            elif streaming or cache is not None:
+                # the raw file is only read once we know the outputs aren't cached
+                self.initialize_from_file_metadata(file_name)
+            else:
+                self.initialize_from_raw_file(file_name)
+
+            if cache is not None and not is_processed_file:
+                self.load_from_cache()
 
 
     def info(self) -> None:
@@ -52,42 +93,49 @@ class PitcherDataProcessor:
 
     def initialize_from_raw_file(self, file_name) -> None:
         logger.info(f"Processing pitcher file: {file_name}")
-        self.df = pd.read_feather(file_name)
-        df_with_joints = pd.merge(self.df, JOINTS_DF, how='inner', on='joint_type_id')
-
-        self.wide_df = pd.pivot_table(df_with_joints,
-                values=['x', 'y', 'z'],
-                columns=['hawkeye', ],
-                index=['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time'])\
-                .reset_index()
-        self.wide_df.columns = [f"{col[1]}{'_' if col[1].strip() != '' else ''}{col[0]}" for col in self.wide_df.columns.values]
-
-        self.handedness = self.wide_df.throws.unique()[0].lower()
-        self.front_leg = [x for x in ALL_HANDEDNESS if x != ALL_HANDEDNESS][0]
+        if self.lean:
+            # the joints we use depend on the handedness, so it is read first to only read those joints
+            self.set_pitcher_metadata(streaming.read_raw_head(file_name))
+            with stage('read') as record:
+                self.df = streaming.read_raw_file(file_name, list(self.get_joint_names().keys()), streaming.RAW_COLS, lean=True)
+                record['rows_out'] = self.df.shape[0]
+        else:
+            with stage('read') as record:
+                self.df = pd.read_feather(file_name)
+                record['rows_out'] = self.df.shape[0]
+            self.set_pitcher_metadata(self.df)
 
-         # get (x,y,z) column names from handedness
-        self.joints_to_filter_to = [f"{self.handedness}Shoulder", f"{self.handedness}Elbow", f"{self.handedness}Wrist", f"{self.front_leg}Knee"]
-        self.joint_cols_fmt =  [f"{a}_{b}" for a in self.joints_to_filter_to for b in ['x', 'y', 'z']]
+        # only the joints we use are reshaped, straight into a dense array with the handed joints in generic slots
+        self.frame_batch = PitchBatch.from_raw_frame(self.df, list(self.get_joint_names().keys()), dtype=get_coord_dtype(self.lean))
 
-        self.metadata_cols = ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time']
-        self.columns_to_filter_to = self.metadata_cols + self.joint_cols_fmt
+        self.info()
+        logger.info("Finished processing.....")
     
-        # get the leg lift
-        self.leg_lift_col_name = [x for x in self.columns_to_filter_to if 'Knee' in x and self.front_leg in x and 'z' in x][0]
-
-        # setting other metadata columns
-        self.sched_id = self.wide_df['sched_id'].unique()[0]
-        self.pitcher_id = self.wide_df['pitcher_id'].unique()[0]
-        self.throws = self.wide_df['throws'].unique()[0]
+    def initialize_from_file_metadata(self, file_name) -> None:
+        logger.info(f"Reading pitcher file metadata: {file_name}")
+        # only the metadata is read up front, the pitches are read later in `initialize_from_raw_file` or `iter_pitcher_dfs`
+        self.set_pitcher_metadata(streaming.read_raw_head(file_name))
 
         self.info()
         logger.info("Finished processing.....")
-    
+
     def initialize_from_processed_file(self, file_name) -> None:
         logger.info(f"Initializing from processed pitcher file: {file_name}")
-        self.pitcher_df = pd.read_feather(file_name)
+        with stage('read') as record:
+            self.pitcher_df = pd.read_feather(file_name)
+            record['rows_out'] = self.pitcher_df.shape[0]
+        self.set_pitcher_metadata(self.pitcher_df)
+
+        self.info()
+        logger.info("Finished processing.....")
+
+    def set_pitcher_metadata(self, df: pd.DataFrame) -> None:
+        """Set the handedness, joint column names and id metadata from a raw or processed pitcher dataframe.
 
-        self.handedness = self.pitcher_df.throws.unique()[0].lower()
+        Args:
+            df (pd.DataFrame): raw or processed pitcher dataframe
+        """
+        self.handedness = df.throws.unique()[0].lower()
         self.front_leg = [x for x in ALL_HANDEDNESS if x != ALL_HANDEDNESS][0]
 
          # get (x,y,z) column names from handedness
@@ -101,38 +149,131 @@ class PitcherDataProcessor:
         self.leg_lift_col_name = [x for x in self.columns_to_filter_to if 'Knee' in x and self.front_leg in x and 'z' in x][0]
 
         # setting other metadata columns
-        self.sched_id = self.pitcher_df['sched_id'].unique()[0]
-        self.pitcher_id = self.pitcher_df['pitcher_id'].unique()[0]
-        self.throws = self.pitcher_df['throws'].unique()[0]
-
-        self.info()
-        logger.info("Finished processing.....")
+        # cast so the ids of a lean dataframe (int32) don't change the feature dtypes
+        self.sched_id = int(df['sched_id'].unique()[0])
+        self.pitcher_id = int(df['pitcher_id'].unique()[0])
+        self.throws = df['throws'].unique()[0]
+
+    def get_cache_keys(self) -> dict:
+        """Get the cache keys for the processed and features outputs. The processed key depends on the raw file contents and the
+        segmentation parameters, and the features key depends on the processed key and the feature parameters, so changing a feature
+        parameter only invalidates the features.
+
+        Returns:
+            dict: cache key for each output
+        """
+        if self.cache_keys is None:
+            processed_key = make_cache_key('processed', file_hash=self.cache.hash_file(self.file_name), code_version=SEGMENTATION_CODE_VERSION,
+                                           leg_lift_window=self.leg_lift_window, leg_lift_col_name=self.leg_lift_col_name,
+                                           columns=self.columns_to_filter_to, lean=self.lean)
+            features_key = make_cache_key('features', processed_key=processed_key, code_version=FEATURES_CODE_VERSION,
+                                          joints=self.joints_of_interest, kinematics=self.kinematics)
+            self.cache_keys = {'processed': processed_key, 'features': features_key}
+        return self.cache_keys
+
+    def instrumented(self):
+        """Context manager that activates the processor's instrumentation, if it has one, with the file name added to the stage
+        records. See `pitch_path.utils.instrumentation`.
+        """
+        return instr.activate(self.instrumentation, file=self.file_name)
+
+    def load_from_cache(self) -> None:
+        cache_keys = self.get_cache_keys()
+        self.pitcher_df = self.cache.get(cache_keys['processed'])
+        self.pitcher_features_df = self.cache.get(cache_keys['features'])
+
+    def get_joint_names(self) -> dict:
+        return {JOINT_IDS[joint]: joint for joint in self.joints_to_filter_to}
 
     def get_raw_pitcher_df(self) -> pd.DataFrame:
         return self.df
 
+    def iter_pitcher_dfs(self, batch_size: int=streaming.DEFAULT_BATCH_SIZE):
+        """Generator that streams the raw file one pitch at a time and yields each pitch after it has been reshaped, filtered to
+        start and release and renamed, so memory is bounded by the largest pitch instead of the file size. Pitches without a leg lift
+        before release are skipped.
+
+        Args:
+            batch_size (int, optional): maximum rows per record batch read from the file. Defaults to streaming.DEFAULT_BATCH_SIZE.
+
+        Yields:
+            pd.DataFrame: pitcher df for a single pitch
+        """
+        joint_names = self.get_joint_names()
+        raw_pitches = streaming.iter_raw_pitches(self.file_name, list(joint_names.keys()), streaming.RAW_COLS, batch_size, self.lean)
+        for raw_pitch_df in raw_pitches:
+            # activated per pitch so the instrumentation isn't left active while the caller has the pitch
+            with self.instrumented():
+                pitch_batch = PitchBatch.from_raw_frame(raw_pitch_df, list(joint_names.keys()), dtype=get_coord_dtype(self.lean))
+                pitch_df = pitch_batch.segment(window=self.leg_lift_window).to_frame(lean=self.lean)
+            if pitch_df.shape[0] > 0:
+                yield pitch_df
+
+    def iter_pitcher_features_dfs(self, batch_size: int=streaming.DEFAULT_BATCH_SIZE):
+        """Generator that streams the raw file one pitch at a time and yields the feature row for each pitch, see `iter_pitcher_dfs`.
+
+        Args:
+            batch_size (int, optional): maximum rows per record batch read from the file. Defaults to streaming.DEFAULT_BATCH_SIZE.
+
+        Yields:
+            pd.DataFrame: pitch feature dataframe with a single row
+        """
+        for pitch_df in self.iter_pitcher_dfs(batch_size):
+            with self.instrumented():
+                features_df = feat.generate_features(df=pitch_df, pitcher_id=self.pitcher_id, sched_id=self.sched_id, joints=self.joints_of_interest)
+                if self.kinematics:
+                    features_df = kin.add_kinematic_features(features_df, PitchBatch.from_frame(pitch_df, dtype=get_coord_dtype(self.lean)),
+                                                             self.joints_of_interest)
+            yield features_df
+
+    def get_pitch_batch(self) -> PitchBatch:
+        """Get the pitches segmented to start and release as a `PitchBatch`, segmenting them if they haven't been yet. For a
+        processed file the batch is built from the processed pitcher df.
+
+        Returns:
+            PitchBatch: segmented pitches
+        """
+        if self.pitch_batch is None:
+            with self.instrumented():
+                if self.pitcher_df is not None:
+                    self.pitch_batch = PitchBatch.from_frame(self.pitcher_df, dtype=get_coord_dtype(self.lean))
+                else:
+                    if self.frame_batch is None:
+                        self.initialize_from_raw_file(self.file_name)
+                    self.pitch_batch = self.frame_batch.segment(window=self.leg_lift_window)
+        return self.pitch_batch
+
     def get_pitcher_df(self) -> pd.DataFrame:
         if self.pitcher_df is not None:
             return self.pitcher_df
         else:
             logger.info("Creating pitcher file df....")
-            df = self.wide_df[self.columns_to_filter_to]
-            pitch_df_w_ll = pp.set_leg_lift_time(df, self.leg_lift_col_name)
-            pitch_df_throw = pp.set_release_point(pitch_df_w_ll)
-            pitch_df_filtered = pp.filter_df_to_start_release(pitch_df_throw)
-            self.pitcher_df = pp.rename_handedness_cols(pitch_df_filtered)
+            if self.streaming:
+                self.pitcher_df = pd.concat(self.iter_pitcher_dfs(), ignore_index=True)
+            else:
+                self.pitcher_df = self.get_pitch_batch().to_frame(lean=self.lean)
+
+            if self.cache is not None:
+                self.cache.put(self.get_cache_keys()['processed'], self.pitcher_df)
             return self.pitcher_df
     
     def get_pitcher_features_df(self) -> pd.DataFrame:
         if self.pitcher_features_df is not None:
             return self.pitcher_features_df
         logger.info("Creating pitcher features df...")
-        if self.pitcher_df is None:
+        if self.pitcher_df is None and self.pitch_batch is None:
             logger.info("pitcher df is null, getting pitcher df first.")
             _ = self.get_pitcher_df()
 
-        joint_cols = [col for col in self.pitcher_df.columns for joint in self.joints_of_interest if joint in col] 
-        self.pitcher_features_df = feat.generate_features_from_pitch_df(df=self.pitcher_df, pitcher_id=self.pitcher_id, sched_id=self.sched_id, joint_cols=joint_cols, joints=self.joints_of_interest)
+        with self.instrumented():
+            if self.pitch_batch is not None:
+                self.pitcher_features_df = self.pitch_batch.generate_features(self.joints_of_interest)
+            else:
+                self.pitcher_features_df = feat.generate_features(df=self.pitcher_df, pitcher_id=self.pitcher_id, sched_id=self.sched_id, joints=self.joints_of_interest)
+            if self.kinematics:
+                self.pitcher_features_df = kin.add_kinematic_features(self.pitcher_features_df, self.get_pitch_batch(), self.joints_of_interest)
+        if self.cache is not None:
+            self.cache.put(self.get_cache_keys()['features'], self.pitcher_features_df)
         return self.pitcher_features_df
 
                 
@@ -143,8 +284,7 @@ class PitcherDataProcessor:
             _ = self.get_pitcher_df()
         
         output_dir = f"{root_dir}/processed"
-        if not os.path.exists(output_dir):
-            os.mkdir(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
 
         output_file_path = f"{output_dir}/sched_id{self.sched_id}_pitcher{self.pitcher_id}"
 
@@ -152,7 +292,9 @@ class PitcherDataProcessor:
             raise Exception(f"File path {output_file_path} already exists.")
 
         logger.info(f"Writing pitcher df to {output_file_path}")
-        self.pitcher_df.to_feather(path=output_file_path)
+        with self.instrumented(), stage('save', rows_in=self.pitcher_df.shape[0]) as record:
+            self.pitcher_df.to_feather(path=output_file_path)
+            record['rows_out'] = self.pitcher_df.shape[0]
 
 
     def save_pitcher_features_df(self, root_dir: str, overwrite: bool=False) -> None:
@@ -162,17 +304,64 @@ class PitcherDataProcessor:
             _ = self.get_pitcher_features_df()
         
         output_dir = f"{root_dir}/pitcher_features"
-        if not os.path.exists(output_dir):
-            os.mkdir(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
 
         output_file_path = f"{output_dir}/sched_id{self.sched_id}_pitcher{self.pitcher_id}"
         if not overwrite and os.path.exists(output_file_path):
             raise Exception(f"File path {output_file_path} already exists.")
 
         logger.info(f"Writing pitcher features df to {output_file_path}")
-        self.pitcher_features_df.to_feather(path=output_file_path)
+        with self.instrumented(), stage('save', rows_in=self.pitcher_features_df.shape[0]) as record:
+            self.pitcher_features_df.to_feather(path=output_file_path)
+            record['rows_out'] = self.pitcher_features_df.shape[0]
         
 
 
 
-    
\ No newline at end of file
+    
+
+
+def process_pitcher_file(file_name: str, output_dir: str=None, save_processed: bool=False, save_features: bool=False, overwrite: bool=False, streaming: bool=False, leg_lift_window: int=30, cache: FeatureCache=None, instrumentation: Instrumentation=None, lean: bool=False, kinematics: bool=False) -> pd.DataFrame:
+    """Fused pipeline that goes from a raw pitcher file straight to the pitcher features in a single process. All intermediates
+    stay in memory, and the processed and features dataframes are only written out if asked for, instead of writing the processed
+    file and reading it back in with `is_processed_file=True` before features can be calculated.
+
+    Args:
+        file_name (str): raw pitcher file
+        output_dir (str, optional): root output directory, required if saving either output. Defaults to None.
+        save_processed (bool, optional): save the processed pitcher df under `output_dir/processed`. Defaults to False.
+        save_features (bool, optional): save the pitcher features df under `output_dir/pitcher_features`. Defaults to False.
+        overwrite (bool, optional): overwrite existing output files. Defaults to False.
+        streaming (bool, optional): stream the raw file one pitch at a time instead of reading it all into memory. Defaults to False.
+        leg_lift_window (int, optional): rows the front knee has to rise for to start the leg lift. Defaults to 30.
+        cache (FeatureCache, optional): cache to reuse outputs from when the file and parameters haven't changed. Defaults to None.
+        instrumentation (Instrumentation, optional): instrumentation to record the stage timings, memory and row counts with. Defaults to None.
+        lean (bool, optional): read and process the file with the lean dtypes, see `PitcherDataProcessor`. Defaults to False.
+        kinematics (bool, optional): add the kinematic features, see `pitch_path.utils.kinematics`. Defaults to False.
+
+    Raises:
+        Exception: saving outputs without an output directory
+
+    Returns:
+        pd.DataFrame: pitcher features df with a feature row for every pitch
+    """
+    if (save_processed or save_features) and output_dir is None:
+        raise Exception("output_dir is required to save the processed or features df.")
+
+    processor = PitcherDataProcessor(file_name=file_name, streaming=streaming, leg_lift_window=leg_lift_window, cache=cache,
+                                      instrumentation=instrumentation, lean=lean, kinematics=kinematics)
+    if save_processed or processor.pitcher_features_df is None:
+        if save_processed or streaming or cache is not None:
+            processor.get_pitcher_df()
+        else:
+            # the processed dataframe isn't saved or cached, so the features come straight from the segmented batch
+            processor.get_pitch_batch()
+        # the raw frame and unsegmented frames aren't needed once the pitches are segmented
+        processor.df = None
+        processor.frame_batch = None
+
+    if save_processed:
+        processor.save_pitcher_df(output_dir, overwrite=overwrite)
+    if save_features:
+        processor.save_pitcher_features_df(output_dir, overwrite=overwrite)
+    return processor.get_pitcher_features_df()
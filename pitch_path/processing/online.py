@@ -0,0 +1,229 @@
+from collections import deque
+import logging
+import numpy as np
+import pandas as pd
+from pitch_path.model.inference import PitchPathModel, load_model
+from pitch_path.files.joints import JOINT_IDS
+import pitch_path.utils.features as feat
+import pitch_path.utils.preprocessing as pp
+
+logger = logging.getLogger(__name__)
+
+JOINTS_OF_INTEREST = ['wrist', 'elbow', 'shoulder']
+# buffered frames are only trimmed in chunks, so the deque isn't popped on every frame
+TRIM_CHUNK = 32
+# finished pitch ids are remembered so late frames after release are ignored, only the most recent ones are kept
+MAX_FINISHED_PITCHES = 1024
+
+
+def get_tracked_joints(throws: str) -> list:
+    """Helper function to get the joints the online classifier needs for a pitcher, in the order `update_frame` takes them: the
+    throwing arm shoulder, elbow and wrist, then the knee used for the leg lift.
+
+    Args:
+        throws (str): throwing hand, R or L
+
+    Returns:
+        list: hawkeye joint names
+    """
+    handedness = throws.lower()
+    # PitcherDataProcessor always watches the left knee for the leg lift, match it so the online and batch paths agree
+    return [f"{handedness}Shoulder", f"{handedness}Elbow", f"{handedness}Wrist", "lKnee"]
+
+def get_feature_cols(joints: list=JOINTS_OF_INTEREST) -> list:
+    """Helper function to get the feature columns in the order `feat.generate_features` makes them."""
+    cols = []
+    for j in joints:
+        cols.append(f"distance_traveled_{j}")
+        cols += [f"{j}_{axis}_{col}" for col in feat.CHECKPOINT_COLS for axis in feat.AXES]
+    return cols + ['pitcher_id', 'sched_id', 'astros_pitch_id']
+
+
+class OnlinePitchState:
+    """State for a single pitch in progress. Everything is updated per frame in constant time except the buffer of segment frames
+    kept for the 25/50/75 percentile checkpoints. Those positions depend on the final segment length, which isn't known until
+    release, so the frames from int(0.25 * frames so far) on are kept. That is at most 3/4 of the segment, not constant.
+    """
+    __slots__ = ['frame_count', 'prev_time', 'prev_knee', 'run_length', 'start_frame', 'segment_length', 'prev_coords',
+                 'distances', 'start_coords', 'buffer', 'buffer_offset']
+
+    def __init__(self, n_joints: int) -> None:
+        self.frame_count = 0
+        self.prev_time = None
+        self.prev_knee = np.nan
+        self.run_length = 0
+        self.start_frame = -1
+        self.segment_length = 0
+        self.prev_coords = None
+        self.distances = np.zeros(n_joints, dtype=np.float64)
+        self.start_coords = None
+        self.buffer = deque()
+        self.buffer_offset = 0
+
+
+class OnlinePitchClassifier:
+    """Class used to classify pitches frame by frame as they come in from a live feed, instead of waiting for the whole pitch like
+    `PitcherDataProcessor`. For every frame of a pitch it:
+
+    - tracks how many frames in a row the front knee has risen, the leg lift starts at the frame the run reaches `leg_lift_window`
+      (the same frame `pp.get_leg_lift_positions` picks)
+    - once the leg lift has started, adds each joint's distance from the previous frame and buffers the frame for the checkpoints
+    - at the first frame with time >= 0, picks the release as whichever of this frame and the previous one is closer to 0, the
+      previous one on a tie (the same frame `pp.get_release_positions` picks, since times only increase)
+
+    As soon as the release is known the feature row is built and labeled with the model, and returned from `update_frame`, so the
+    label is ready at most one frame after release. Frames have to arrive in time order for each pitch. Missing coordinates in the
+    segment count as 0, like the batch path's fillna(0).
+    """
+    def __init__(self, pitcher_id: int, sched_id: int, throws: str, model: PitchPathModel=None, leg_lift_window: int=30,
+                 joints: list=JOINTS_OF_INTEREST, max_finished_pitches: int=MAX_FINISHED_PITCHES) -> None:
+        self.pitcher_id = pitcher_id
+        self.sched_id = sched_id
+        self.throws = throws
+        self.model = model if model is not None else load_model()
+        self.leg_lift_window = leg_lift_window
+        self.joints = joints
+        self.tracked_joints = get_tracked_joints(throws)
+        # rows of the coordinate array for each feature joint, the knee is the last row
+        generic_joints = [name[1:].lower() for name in self.tracked_joints[:-1]]
+        self.joint_rows = np.array([generic_joints.index(j) for j in joints])
+        self.feature_cols = get_feature_cols(joints)
+        self.model_cols = [self.feature_cols.index(col) for col in self.model.feature_cols]
+
+        self.pitches = {}
+        self.finished_pitches = set()
+        self.finished_order = deque()
+        self.max_finished_pitches = max_finished_pitches
+
+    def get_frame_coords(self, frame_df: pd.DataFrame) -> np.ndarray:
+        """Helper function to get the coordinate array `update_frame` takes from the raw rows (one per joint) of a single frame.
+
+        Args:
+            frame_df (pd.DataFrame): raw rows for a frame with joint_type_id, x, y and z columns
+
+        Returns:
+            np.ndarray: (tracked joints, 3) coordinates, NaN for joints missing from the frame
+        """
+        joint_ids = [JOINT_IDS[joint] for joint in self.tracked_joints]
+        coords = np.full((len(self.tracked_joints), 3), np.nan)
+        positions = {joint_id: i for i, joint_id in enumerate(joint_ids)}
+        for joint_id, x, y, z in frame_df[['joint_type_id', 'x', 'y', 'z']].itertuples(index=False):
+            if joint_id in positions:
+                coords[positions[joint_id]] = (x, y, z)
+        return coords
+
+    def update_frame(self, astros_pitch_id: int, time: float, coords: np.ndarray) -> dict:
+        """Add a frame to a pitch.
+
+        Args:
+            astros_pitch_id (int): pitch id
+            time (float): frame time, relative to release like the raw data
+            coords (np.ndarray): (tracked joints, 3) coordinates in `tracked_joints` order, see `get_frame_coords`
+
+        Raises:
+            Exception: frames aren't in time order
+
+        Returns:
+            dict: the pitch result (see `finish_pitch`) if the pitch was released by this frame, otherwise None
+        """
+        if astros_pitch_id in self.finished_pitches:
+            return None
+        state = self.pitches.get(astros_pitch_id)
+        if state is None:
+            state = self.pitches[astros_pitch_id] = OnlinePitchState(len(self.joints))
+        elif time <= state.prev_time:
+            raise Exception(f"Frames for astros_pitch_id {astros_pitch_id} are out of order, got time {time} after {state.prev_time}.")
+
+        if time >= 0 and state.frame_count > 0 and abs(state.prev_time) <= abs(time):
+            # the previous frame was closer to release, so it was the release and this frame isn't part of the pitch
+            return self.finish_pitch(astros_pitch_id)
+
+        knee = coords[-1, 2]
+        state.run_length = state.run_length + 1 if knee > state.prev_knee else 0
+        state.prev_knee = knee
+        if state.start_frame < 0 and state.run_length >= self.leg_lift_window:
+            state.start_frame = state.frame_count
+
+        if state.start_frame >= 0:
+            self.add_segment_frame(state, np.nan_to_num(coords[self.joint_rows]))
+        state.frame_count += 1
+        state.prev_time = time
+
+        if time >= 0:
+            return self.finish_pitch(astros_pitch_id)
+        return None
+
+    def add_segment_frame(self, state: OnlinePitchState, coords: np.ndarray) -> None:
+        if state.prev_coords is None:
+            state.start_coords = coords
+        else:
+            state.distances += np.linalg.norm(coords - state.prev_coords, axis=1)
+        state.prev_coords = coords
+        state.buffer.append(coords)
+        state.segment_length += 1
+
+        # the 25th percentile checkpoint is the earliest buffered one and it only moves forward as the segment grows
+        first_needed = int(0.25 * state.segment_length)
+        if first_needed - state.buffer_offset >= TRIM_CHUNK:
+            for _ in range(first_needed - state.buffer_offset):
+                state.buffer.popleft()
+            state.buffer_offset = first_needed
+
+    def add_finished_pitch(self, astros_pitch_id: int) -> None:
+        """Helper function to remember a finished pitch id so its late frames are ignored. Only the `max_finished_pitches` most
+        recently finished ids are kept, so a long running feed doesn't grow the set without bound.
+
+        Args:
+            astros_pitch_id (int): pitch id
+        """
+        if astros_pitch_id in self.finished_pitches:
+            return
+        self.finished_pitches.add(astros_pitch_id)
+        self.finished_order.append(astros_pitch_id)
+        while len(self.finished_order) > self.max_finished_pitches:
+            self.finished_pitches.discard(self.finished_order.popleft())
+
+    def finish_pitch(self, astros_pitch_id: int) -> dict:
+        """Finish a pitch at its last added frame, build the feature row and label it. This is called by `update_frame` at release,
+        call it directly for a pitch that ended before reaching time 0.
+
+        Args:
+            astros_pitch_id (int): pitch id
+
+        Returns:
+            dict: astros_pitch_id, `features` dict in `feat.generate_features` column order, `label`, `segment_length` and
+            `release_time`. If the pitch had no leg lift before release, features and label are None, the batch path drops these
+            pitches.
+        """
+        state = self.pitches.pop(astros_pitch_id, None)
+        self.add_finished_pitch(astros_pitch_id)
+        result = {'astros_pitch_id': astros_pitch_id, 'features': None, 'label': None, 'segment_length': 0,
+                  'release_time': state.prev_time if state is not None else None}
+        if state is None or state.start_frame < 0:
+            return result
+
+        n = state.segment_length
+        checkpoints = [state.start_coords]
+        for percentile in pp.PERCENTILE_COLS.values():
+            checkpoints.append(state.buffer[int(percentile * n) - state.buffer_offset])
+        checkpoints.append(state.prev_coords)
+
+        values = []
+        for i in range(len(self.joints)):
+            values.append(state.distances[i])
+            for checkpoint in checkpoints:
+                values += checkpoint[i].tolist()
+        values += [self.pitcher_id, self.sched_id, astros_pitch_id]
+
+        result['features'] = dict(zip(self.feature_cols, values))
+        result['label'] = int(self.model.predict(np.array([[values[i] for i in self.model_cols]]))[0])
+        result['segment_length'] = n
+        return result
+
+    def finish(self) -> list:
+        """Finish every pitch still in progress, e.g. at the end of a feed.
+
+        Returns:
+            list: pitch results, see `finish_pitch`
+        """
+        return [self.finish_pitch(pitch_id) for pitch_id in list(self.pitches)]
@@ -0,0 +1,274 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pitch_path
+from pitch_path.files.joints import JOINT_IDS
+from pitch_path.processing.data_processing import get_joints_df
+import pitch_path.utils.features as feat
+import pitch_path.utils.preprocessing as pp
+from pitch_path.utils.pitch_batch import BATCH_JOINTS, PitchBatch
+from pitch_path.utils.synthetic import generate_raw_pitcher_df
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [10, 1000, 100000]
+DEFAULT_OUTPUT = "benchmark_results.json"
+GENERATE_CHUNK_PITCHES = 500
+METADATA_COLS = ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time']
+JOINTS_TO_FILTER_TO = ['rShoulder', 'rElbow', 'rWrist', 'lKnee']
+JOINT_COLS = [f"{joint}_{axis}" for joint in JOINTS_TO_FILTER_TO for axis in ['x', 'y', 'z']]
+LEG_LIFT_COL = 'lKnee_z'
+JOINTS_OF_INTEREST = ['wrist', 'elbow', 'shoulder']
+
+
+def legacy_pivot_to_wide(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """Helper function with the original raw to wide reshape (joint merge + pivot_table) so it can be compared with
+    `PitchBatch.from_raw_frame`.
+
+    Args:
+        raw_df (pd.DataFrame): raw pitcher dataframe
+
+    Returns:
+        pd.DataFrame: wide dataframe with a {joint}_{axis} column for every joint
+    """
+    df_with_joints = pd.merge(raw_df, get_joints_df(), how='inner', on='joint_type_id')
+    wide_df = pd.pivot_table(df_with_joints, values=['x', 'y', 'z'], columns=['hawkeye', ], index=METADATA_COLS).reset_index()
+    wide_df.columns = [f"{col[1]}{'_' if col[1].strip() != '' else ''}{col[0]}" for col in wide_df.columns.values]
+    return wide_df
+
+def get_sorted_arrays(wide_df: pd.DataFrame) -> tuple:
+    """Helper function to get the (pitch, time) sorted leg lift values, times and pitch offsets the vectorized leg lift and
+    release stages take.
+
+    Args:
+        wide_df (pd.DataFrame): wide pitcher dataframe
+
+    Returns:
+        tuple: (leg lift values, times, pitch offsets)
+    """
+    codes, _ = pd.factorize(wide_df['astros_pitch_id'], sort=True)
+    times = wide_df['time'].to_numpy(dtype=np.float64)
+    order = pp.get_pitch_order(codes, times)
+    offsets = pp.get_pitch_offsets(codes[order])
+    return wide_df[LEG_LIFT_COL].to_numpy(dtype=np.float64)[order], times[order], offsets
+
+def generate_inputs(n_pitches: int, fps: int, keep_raw: bool, seed: int) -> tuple:
+    """Helper function to generate the synthetic raw and wide dataframes for a benchmark size. The raw data is generated in chunks
+    and reshaped as it goes, so large sizes only need the raw data in memory if the raw stages are run.
+
+    Args:
+        n_pitches (int): number of pitches
+        fps (int): frames per second
+        keep_raw (bool): whether to keep and return the raw dataframe
+        seed (int): random seed
+
+    Returns:
+        tuple: (raw dataframe or None, wide dataframe)
+    """
+    joint_ids = [JOINT_IDS[joint] for joint in JOINTS_TO_FILTER_TO]
+    rng = np.random.default_rng(seed)
+    raw_dfs, wide_dfs = [], []
+    for first in range(0, n_pitches, GENERATE_CHUNK_PITCHES):
+        raw_df = generate_raw_pitcher_df(min(GENERATE_CHUNK_PITCHES, n_pitches - first), throws='R', fps=fps,
+                                         first_pitch_id=first, seed=int(rng.integers(2 ** 31)))
+        # the handed joint names as the slots give the original wide columns, e.g. rWrist_x
+        wide_dfs.append(PitchBatch.from_raw_frame(raw_df, joint_ids, joints=JOINTS_TO_FILTER_TO).to_frame())
+        if keep_raw:
+            raw_dfs.append(raw_df)
+    raw_df = pd.concat(raw_dfs, ignore_index=True) if keep_raw else None
+    return raw_df, pd.concat(wide_dfs, ignore_index=True)
+
+def get_row_count(x) -> int:
+    # the vectorized leg lift and release stages take (values, times, offsets) arrays, and a batch's rows are its frames
+    if isinstance(x, PitchBatch):
+        return x.n_frames
+    return len(x[1]) if isinstance(x, tuple) else len(x)
+
+def get_batch(wide_df: pd.DataFrame) -> PitchBatch:
+    """Helper function to get the `PitchBatch` for a wide pitcher dataframe, with the handed joint columns in the generic slots."""
+    generic_cols = {f"{joint}_{axis}": f"{slot}_{axis}" for joint, slot in zip(JOINTS_TO_FILTER_TO, BATCH_JOINTS) for axis in ['x', 'y', 'z']}
+    return PitchBatch.from_frame(wide_df.rename(columns=generic_cols))
+
+def measure(fn, make_input, repeat: int=1, profile_memory: bool=True) -> dict:
+    """Helper function to time a stage and measure its peak memory. The stage is timed `repeat` times and the fastest run is kept,
+    then run once more under tracemalloc for the peak allocated memory, since tracing slows the stage down. Inputs are made fresh
+    for every run outside of the timer because some of the legacy stages modify their input.
+
+    Args:
+        fn: stage function taking the stage input
+        make_input: function returning the stage input
+        repeat (int, optional): number of timed runs. Defaults to 1.
+        profile_memory (bool, optional): whether to measure peak memory. Defaults to True.
+
+    Returns:
+        dict: seconds, peak_memory_bytes, rows_in and rows_out
+    """
+    seconds = []
+    for _ in range(repeat):
+        stage_input = make_input()
+        start = time.perf_counter()
+        output = fn(stage_input)
+        seconds.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if profile_memory:
+        stage_input = make_input()
+        tracemalloc.start()
+        fn(stage_input)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {'seconds': min(seconds), 'peak_memory_bytes': peak_memory, 'rows_in': get_row_count(stage_input), 'rows_out': get_row_count(output)}
+
+def get_stages(raw_df: pd.DataFrame, wide_df: pd.DataFrame) -> list:
+    """Helper function to get every benchmarked stage. Each legacy stage is paired with the vectorized code that replaced it and
+    gets the same input, which is the output of the previous legacy stage so the legacy pipeline runs as it originally did.
+
+    Args:
+        raw_df (pd.DataFrame): raw pitcher dataframe, or None to skip the reshape stages
+        wide_df (pd.DataFrame): wide pitcher dataframe
+
+    Returns:
+        list: (stage, implementation, stage function, input function, is legacy) tuples
+    """
+    df = wide_df[METADATA_COLS + JOINT_COLS]
+    # the legacy stages chain, so build their inputs once up front instead of timing them as part of the next stage
+    legacy_inputs = {}
+
+    def legacy_input(stage: str):
+        if not legacy_inputs:
+            legacy_inputs['leg_lift'] = pp.set_leg_lift_time(df.copy(), LEG_LIFT_COL)
+            legacy_inputs['release'] = pp.set_release_point(legacy_inputs['leg_lift'].copy())
+            legacy_inputs['filter'] = pp.rename_handedness_cols(pp.filter_df_to_start_release(legacy_inputs['release'].copy()))
+        return legacy_inputs[stage].copy()
+
+    def features_input():
+        return get_batch(df).segment().to_frame()
+
+    processed_joint_cols = [f"{joint}_{axis}" for joint in JOINTS_OF_INTEREST for axis in ['x', 'y', 'z']]
+    stages = []
+    if raw_df is not None:
+        joint_ids = [JOINT_IDS[joint] for joint in JOINTS_TO_FILTER_TO]
+        stages += [
+            ('pivot_table', 'legacy', legacy_pivot_to_wide, lambda: raw_df, True),
+            ('pivot_table', 'batch', lambda x: PitchBatch.from_raw_frame(x, joint_ids), lambda: raw_df, False),
+        ]
+    stages += [
+        ('set_leg_lift_time', 'legacy', lambda x: pp.set_leg_lift_time(x, LEG_LIFT_COL), df.copy, True),
+        ('set_leg_lift_time', 'vectorized', lambda x: pp.get_leg_lift_positions(x[0], x[2]), lambda: get_sorted_arrays(df), False),
+        ('set_release_point', 'legacy', pp.set_release_point, lambda: legacy_input('leg_lift'), True),
+        ('set_release_point', 'vectorized', lambda x: pp.get_release_positions(x[1], x[2]), lambda: get_sorted_arrays(df), False),
+        ('filter_df_to_start_release', 'legacy', pp.filter_df_to_start_release, lambda: legacy_input('release'), True),
+        ('filter_df_to_start_release', 'batch', lambda x: x.segment(), lambda: get_batch(df), False),
+        ('generate_features_from_pitch_df', 'legacy',
+         lambda x: feat.generate_features_from_pitch_df(x, 1, 1, processed_joint_cols, JOINTS_OF_INTEREST), lambda: legacy_input('filter'), True),
+        ('generate_features_from_pitch_df', 'vectorized',
+         lambda x: feat.generate_features(x, 1, 1, JOINTS_OF_INTEREST), features_input, False),
+        ('generate_features_from_pitch_df', 'batch', lambda x: x.generate_features(JOINTS_OF_INTEREST), lambda: get_batch(df).segment(), False),
+    ]
+    return stages
+
+def run_benchmarks(sizes: list=DEFAULT_SIZES, fps: int=300, repeat: int=1, profile_memory: bool=True, max_legacy_pitches: int=1000,
+                   max_raw_pitches: int=1000, max_frames: int=20000000, seed: int=0) -> list:
+    """Function to benchmark every pipeline stage on synthetic data (see `pitch_path.utils.synthetic`) for each number of pitches.
+    The legacy stages loop over pitches in python and would take hours at the largest sizes, and the raw data has a row per joint
+    per frame, so stages past `max_legacy_pitches`, raw stages past `max_raw_pitches` and sizes past `max_frames` are recorded as
+    skipped instead of run.
+
+    Args:
+        sizes (list, optional): numbers of pitches to benchmark. Defaults to DEFAULT_SIZES.
+        fps (int, optional): frames per second of the synthetic data. Defaults to 300.
+        repeat (int, optional): timed runs per stage. Defaults to 1.
+        profile_memory (bool, optional): whether to measure peak memory. Defaults to True.
+        max_legacy_pitches (int, optional): largest size to run the legacy stages on. Defaults to 1000.
+        max_raw_pitches (int, optional): largest size to run the raw reshape stages on. Defaults to 1000.
+        max_frames (int, optional): largest number of wide frames to generate. Defaults to 20000000.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        list: a result dict per stage, implementation and size
+    """
+    results = []
+    frames_per_pitch = int(round(2.5 * fps))
+    for n_pitches in sizes:
+        if n_pitches * frames_per_pitch > max_frames:
+            logger.warning(f"Skipping {n_pitches} pitches, {n_pitches * frames_per_pitch} frames is over --max-frames {max_frames}")
+            results.append({'stage': None, 'implementation': None, 'n_pitches': n_pitches, 'skipped': 'over max_frames'})
+            continue
+
+        logger.info(f"Generating {n_pitches} synthetic pitches")
+        raw_df, wide_df = generate_inputs(n_pitches, fps, n_pitches <= max_raw_pitches, seed)
+        for stage, implementation, fn, make_input, is_legacy in get_stages(raw_df, wide_df):
+            result = {'stage': stage, 'implementation': implementation, 'n_pitches': n_pitches, 'skipped': None}
+            if is_legacy and n_pitches > max_legacy_pitches:
+                result['skipped'] = 'over max_legacy_pitches'
+            else:
+                result.update(measure(fn, make_input, repeat, profile_memory))
+                logger.info(f"{stage} ({implementation}) {n_pitches} pitches: {result['seconds']:.4f}s")
+            results.append(result)
+        del raw_df, wide_df
+    return results
+
+def write_results(results: list, output_file: str, config: dict) -> None:
+    """Write the benchmark results with the versions and machine they were run on, so runs can be compared across versions.
+
+    Args:
+        results (list): results from `run_benchmarks`
+        output_file (str): json file to write
+        config (dict): benchmark parameters
+    """
+    output = {
+        'pitch_path_version': pitch_path.__version__,
+        'python_version': platform.python_version(),
+        'numpy_version': np.__version__,
+        'pandas_version': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        # ru_maxrss is in kilobytes on linux
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'config': config,
+        'results': results,
+    }
+    with open(output_file, 'w') as f:
+        json.dump(output, f, indent=2)
+    logger.info(f"Wrote benchmark results to {output_file}")
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the legacy and vectorized pipeline stages on synthetic Hawk-Eye data.")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_SIZES,
+                        help="comma separated numbers of pitches (default: 10,1000,100000)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help=f"json file to write results to (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--fps", type=int, default=300, help="frames per second of the synthetic data (default: 300)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage, the fastest is kept (default: 1)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--max-legacy-pitches", type=int, default=1000, help="largest size to run the legacy stages on, the legacy features take about a second per pitch (default: 1000)")
+    parser.add_argument("--max-raw-pitches", type=int, default=1000, help="largest size to run the raw reshape stages on (default: 1000)")
+    parser.add_argument("--max-frames", type=int, default=20000000, help="largest number of frames to generate (default: 20000000)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # the legacy stages log for every call
+    logging.getLogger("pitch_path.utils").setLevel(logging.WARNING)
+
+    config = {'sizes': args.sizes, 'fps': args.fps, 'repeat': args.repeat, 'profile_memory': not args.no_memory,
+              'max_legacy_pitches': args.max_legacy_pitches, 'max_raw_pitches': args.max_raw_pitches,
+              'max_frames': args.max_frames, 'seed': args.seed}
+    results = run_benchmarks(args.sizes, args.fps, args.repeat, not args.no_memory, args.max_legacy_pitches,
+                             args.max_raw_pitches, args.max_frames, args.seed)
+    write_results(results, args.output, config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
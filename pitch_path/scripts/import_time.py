@@ -0,0 +1,97 @@
+import argparse
+import json
+import logging
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MS = 100
+DEFAULT_REPEAT = 5
+# the inference path should only need numpy, the processing modules need pandas and pyarrow but nothing heavier
+INFERENCE_FORBIDDEN = ['pandas', 'pyarrow', 'scipy', 'sklearn', 'matplotlib']
+PROCESSING_FORBIDDEN = ['scipy', 'sklearn', 'matplotlib']
+INFERENCE_MODULES = ['pitch_path.model.inference', 'pitch_path.scripts.serve_model']
+PROCESSING_MODULES = ['pitch_path.processing.data_processing', 'pitch_path.processing.online', 'pitch_path.scripts.process_pitchers']
+BASELINE_MODULE = 'numpy'
+# run in a fresh interpreter so every import is cold
+MEASURE_CODE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted({name.split('.')[0] for name in sys.modules})}))
+"""
+
+
+def measure_import(module: str, repeat: int=DEFAULT_REPEAT) -> dict:
+    """Function to time a cold import of a module, each time in a new interpreter, and list the top level packages it loads.
+
+    Args:
+        module (str): module to import
+        repeat (int, optional): number of imports, the fastest is kept. Defaults to DEFAULT_REPEAT.
+
+    Raises:
+        Exception: the import failed
+
+    Returns:
+        dict: module, fastest import milliseconds and the top level packages loaded
+    """
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", MEASURE_CODE, module], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Importing {module} failed:\n{result.stderr}")
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {'module': module, 'import_ms': min(run['seconds'] for run in runs) * 1e3, 'modules': runs[0]['modules']}
+
+def check_imports(budget_ms: float=DEFAULT_BUDGET_MS, repeat: int=DEFAULT_REPEAT) -> tuple:
+    """Function to check the import time and heavy dependencies of the inference and processing entry points. Inference modules
+    have to import within `budget_ms` without loading any of INFERENCE_FORBIDDEN, and processing modules can't load any of
+    PROCESSING_FORBIDDEN. The numpy import time is reported as a baseline, since it is the floor for the inference path on the
+    machine running the check.
+
+    Args:
+        budget_ms (float, optional): import time budget for the inference modules. Defaults to DEFAULT_BUDGET_MS.
+        repeat (int, optional): imports per module, the fastest is kept. Defaults to DEFAULT_REPEAT.
+
+    Returns:
+        tuple: (report dict, whether every check passed)
+    """
+    report = {'budget_ms': budget_ms, 'baseline': measure_import(BASELINE_MODULE, repeat), 'modules': []}
+    ok = True
+    for modules, forbidden, budget in [(INFERENCE_MODULES, INFERENCE_FORBIDDEN, budget_ms), (PROCESSING_MODULES, PROCESSING_FORBIDDEN, None)]:
+        for module in modules:
+            result = measure_import(module, repeat)
+            result['forbidden_loaded'] = [name for name in forbidden if name in result['modules']]
+            result['over_budget'] = budget is not None and result['import_ms'] > budget
+            ok &= not (result['forbidden_loaded'] or result['over_budget'])
+            del result['modules']
+            report['modules'].append(result)
+    report['baseline'] = {'module': BASELINE_MODULE, 'import_ms': report['baseline']['import_ms']}
+    return report, ok
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the cold import time and heavy dependencies of the pitch_path entry points.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help=f"import budget for the inference path (default: {DEFAULT_BUDGET_MS})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"imports per module, the fastest is kept (default: {DEFAULT_REPEAT})")
+    parser.add_argument("-o", "--output", default=None, help="json file to write the report to")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    report, ok = check_imports(args.budget_ms, args.repeat)
+    logger.info(f"{BASELINE_MODULE} baseline: {report['baseline']['import_ms']:.1f}ms")
+    for result in report['modules']:
+        status = "FAIL" if result['forbidden_loaded'] or result['over_budget'] else "ok"
+        forbidden = f", loads {','.join(result['forbidden_loaded'])}" if result['forbidden_loaded'] else ""
+        logger.info(f"{status} {result['module']}: {result['import_ms']:.1f}ms{forbidden}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
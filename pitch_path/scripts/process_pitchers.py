@@ -0,0 +1,313 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+import pandas as pd
+import pyarrow.feather as feather
+from pitch_path.processing.data_processing import process_pitcher_file
+from pitch_path.utils.cache import FeatureCache, make_cache_key, write_atomic, SEGMENTATION_CODE_VERSION, FEATURES_CODE_VERSION
+from pitch_path.utils.instrumentation import Instrumentation, JsonLogSink
+from pitch_path.utils.trajectory_store import build_trajectory_store
+
+logger = logging.getLogger(__name__)
+
+PROCESSED_DIR = "processed"
+FEATURES_DIR = "pitcher_features"
+TRAINING_DIR = "training"
+TRAINING_FILE = "training_data"
+TRAJECTORY_STORE_DIR = "trajectory_store"
+PARAMS_DIR = "params"
+
+
+def get_input_files(input_dir: str) -> list:
+    """Helper function to list the raw pitcher files in a directory, skipping hidden files and sub directories.
+
+    Args:
+        input_dir (str): directory containing raw pitcher files
+
+    Returns:
+        list: sorted list of raw pitcher file paths
+    """
+    return sorted(os.path.join(input_dir, f) for f in os.listdir(input_dir)
+                  if not f.startswith('.') and os.path.isfile(os.path.join(input_dir, f)))
+
+def get_output_paths(file_name: str, output_dir: str) -> dict:
+    """Helper function to get the processed and features output paths for a raw pitcher file. Only the id columns are read
+    from the file so this is cheap enough to call for every file when checking what needs to be processed.
+
+    Args:
+        file_name (str): raw pitcher file
+        output_dir (str): root output directory
+
+    Returns:
+        dict: output paths keyed by output type, the processing parameters the outputs were made with are under `PARAMS_DIR`
+    """
+    ids = feather.read_table(file_name, columns=['sched_id', 'pitcher_id'], memory_map=True)
+    output_name = f"sched_id{ids['sched_id'][0].as_py()}_pitcher{ids['pitcher_id'][0].as_py()}"
+    return {
+        PROCESSED_DIR: os.path.join(output_dir, PROCESSED_DIR, output_name),
+        FEATURES_DIR: os.path.join(output_dir, FEATURES_DIR, output_name),
+        PARAMS_DIR: os.path.join(output_dir, PARAMS_DIR, f"{output_name}.json"),
+    }
+
+def get_processing_params(file_name: str, leg_lift_window: int, lean: bool, kinematics: bool, cache: FeatureCache=None) -> dict:
+    """Helper function to collect the parameters that change the processed and features outputs of a file. With a cache, the
+    file's content hash and the stage code versions are added as a single key, so the outputs are reused as long as the file
+    contents, parameters and code are unchanged, whatever the modification times say.
+
+    Args:
+        file_name (str): raw pitcher file
+        leg_lift_window (int): rows the front knee has to rise for to start the leg lift
+        lean (bool): process with the lean dtypes
+        kinematics (bool): add the kinematic features
+        cache (FeatureCache, optional): cache the file is processed with. Defaults to None.
+
+    Returns:
+        dict: json serializable processing parameters
+    """
+    params = {'leg_lift_window': int(leg_lift_window), 'lean': bool(lean), 'kinematics': bool(kinematics)}
+    if cache is not None:
+        params['cache_key'] = make_cache_key('outputs', file_hash=cache.hash_file(file_name), segmentation_code_version=SEGMENTATION_CODE_VERSION,
+                                             features_code_version=FEATURES_CODE_VERSION, **params)
+    return params
+
+def read_processing_params(params_path: str) -> dict:
+    """Helper function to read the processing parameters a file's outputs were made with.
+
+    Args:
+        params_path (str): params file written next to the outputs
+
+    Returns:
+        dict: processing parameters, None if the file is missing or unreadable
+    """
+    try:
+        with open(params_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_processing_params(params_path: str, params: dict) -> None:
+    """Helper function to record the processing parameters a file's outputs were made with.
+
+    Args:
+        params_path (str): params file written next to the outputs
+        params (dict): processing parameters, see `get_processing_params`
+    """
+    def write_params(path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(params, f, sort_keys=True)
+    write_atomic(params_path, write_params)
+
+def is_up_to_date(input_path: str, output_paths: list, params_path: str=None, params: dict=None, check_mtime: bool=True) -> bool:
+    """Helper function to check if all outputs exist, are newer than their input and, if a params file is given, were made
+    with the same processing parameters. Outputs from older runs without a params file are treated as out of date.
+
+    Args:
+        input_path (str): input file
+        output_paths (list): output files created from the input
+        params_path (str, optional): params file written next to the outputs. Defaults to None.
+        params (dict, optional): processing parameters of this run, see `get_processing_params`. Defaults to None.
+        check_mtime (bool, optional): require the outputs to be newer than the input, not needed when the params have the
+            input's content hash. Defaults to True.
+
+    Returns:
+        bool: True if nothing needs to be recomputed
+    """
+    input_mtime = os.path.getmtime(input_path)
+    if not all(os.path.exists(p) and (not check_mtime or os.path.getmtime(p) >= input_mtime) for p in output_paths):
+        return False
+    return params_path is None or read_processing_params(params_path) == params
+
+def remove_outputs(output_paths: list) -> bool:
+    """Helper function to delete a file's outputs and params, so outputs from an earlier run aren't mistaken for current ones.
+
+    Args:
+        output_paths (list): output and params files of the input
+
+    Returns:
+        bool: True if anything was deleted
+    """
+    removed = False
+    for path in output_paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    return removed
+
+def process_file(file_name: str, output_dir: str, overwrite: bool=False, leg_lift_window: int=30, cache: FeatureCache=None,
+                 instrumentation: Instrumentation=None, lean: bool=False, kinematics: bool=False) -> dict:
+    """Function to run a single raw pitcher file through processing and feature generation and save both outputs. Any
+    error is caught and returned so that one bad file doesn't stop the rest of the batch.
+
+    Args:
+        file_name (str): raw pitcher file
+        output_dir (str): root output directory
+        overwrite (bool, optional): reprocess the file even if the outputs are up to date, i.e. newer than the file and made with
+            the same leg lift window, lean and kinematics settings. Defaults to False.
+        leg_lift_window (int, optional): rows the front knee has to rise for to start the leg lift. Defaults to 30.
+        cache (FeatureCache, optional): cache to reuse outputs from. When set, a file is skipped if its contents, parameters and
+            the stage code versions match the ones its outputs were made with, instead of comparing modification times, and a
+            file that does need processing reuses whichever stage outputs are cached. Defaults to None.
+        instrumentation (Instrumentation, optional): instrumentation to record the stages with. Defaults to None.
+        lean (bool, optional): process the file with the lean dtypes, see `PitcherDataProcessor`. Defaults to False.
+        kinematics (bool, optional): add the kinematic features, see `pitch_path.utils.kinematics`. Defaults to False.
+
+    Returns:
+        dict: result with the file name, status (processed, skipped or failed), elapsed seconds and error if it failed. If the file
+        failed, its outputs from an earlier run are deleted and `invalidated` is True if there were any.
+    """
+    start_time = time.perf_counter()
+    output_paths, params_path = {}, None
+    try:
+        output_paths = get_output_paths(file_name, output_dir)
+        params_path = output_paths.pop(PARAMS_DIR)
+        params = get_processing_params(file_name, leg_lift_window, lean, kinematics, cache)
+        if not overwrite and is_up_to_date(file_name, output_paths.values(), params_path, params, check_mtime=cache is None):
+            return {'file_name': file_name, 'status': 'skipped', 'seconds': time.perf_counter() - start_time, 'error': None}
+
+        process_pitcher_file(file_name, output_dir, save_processed=True, save_features=True, overwrite=True,
+                             leg_lift_window=leg_lift_window, cache=cache, instrumentation=instrumentation, lean=lean,
+                             kinematics=kinematics)
+        # written last, so a run that dies part way through leaves the outputs out of date
+        write_processing_params(params_path, params)
+        return {'file_name': file_name, 'status': 'processed', 'seconds': time.perf_counter() - start_time, 'error': None}
+    except Exception:
+        error = traceback.format_exc()
+        # the outputs of an earlier run no longer match the file, keep them out of the training data
+        invalidated = remove_outputs([p for p in [*output_paths.values(), params_path] if p is not None])
+        return {'file_name': file_name, 'status': 'failed', 'seconds': time.perf_counter() - start_time, 'error': error,
+                'invalidated': invalidated}
+
+def build_training_data(output_dir: str, overwrite: bool=False) -> str:
+    """Function to combine every pitcher features file into the training data file. The training data is only rebuilt if
+    a features file is newer than it, pass `overwrite` after features files were deleted. With no features files left, the
+    training data is deleted.
+
+    Args:
+        output_dir (str): root output directory
+        overwrite (bool, optional): rebuild even if the training data is up to date. Defaults to False.
+
+    Returns:
+        str: training data file path
+    """
+    features_dir = os.path.join(output_dir, FEATURES_DIR)
+    feature_files = get_input_files(features_dir)
+    training_dir = os.path.join(output_dir, TRAINING_DIR)
+    os.makedirs(training_dir, exist_ok=True)
+    training_path = os.path.join(training_dir, TRAINING_FILE)
+
+    if not feature_files:
+        logger.warning(f"No pitcher features files found in {features_dir}, skipping training data.")
+        remove_outputs([training_path])
+        return training_path
+    if not overwrite and os.path.exists(training_path) and \
+            os.path.getmtime(training_path) >= max(os.path.getmtime(f) for f in feature_files):
+        logger.info(f"Training data {training_path} is up to date.")
+        return training_path
+
+    logger.info(f"Combining {len(feature_files)} pitcher features files into {training_path}")
+    training_df = pd.concat([pd.read_feather(f) for f in feature_files], ignore_index=True)
+    training_df.to_feather(path=training_path)
+    return training_path
+
+def run_batch(input_dir: str, output_dir: str, workers: int=None, overwrite: bool=False, trajectory_store: bool=False,
+              leg_lift_window: int=30, cache: FeatureCache=None, instrumentation: Instrumentation=None, lean: bool=False,
+              kinematics: bool=False) -> list:
+    """Function to process a directory of raw pitcher files across a process pool and then build the training data.
+
+    Args:
+        input_dir (str): directory containing raw pitcher files
+        output_dir (str): root output directory
+        workers (int, optional): number of worker processes, 1 runs everything in this process. Defaults to the cpu count.
+        overwrite (bool, optional): reprocess files even if their outputs are up to date. Defaults to False.
+        trajectory_store (bool, optional): also pack the processed files into a trajectory store. Defaults to False.
+        leg_lift_window (int, optional): rows the front knee has to rise for to start the leg lift. Defaults to 30.
+        cache (FeatureCache, optional): cache to reuse outputs from, see `process_file`. Defaults to None.
+        instrumentation (Instrumentation, optional): instrumentation to record the stages with, it is sent to every worker so
+            its sinks have to be picklable, e.g. `JsonLogSink` with a path. Defaults to None.
+        lean (bool, optional): process the files with the lean dtypes, see `PitcherDataProcessor`. Defaults to False.
+        kinematics (bool, optional): add the kinematic features, see `pitch_path.utils.kinematics`. Defaults to False.
+
+    Returns:
+        list: result for every input file, see `process_file`
+    """
+    files = get_input_files(input_dir)
+    workers = workers or os.cpu_count()
+    logger.info(f"Processing {len(files)} pitcher files from {input_dir} with {workers} workers")
+
+    # create the output directories up front so the workers don't race to make them
+    for sub_dir in [PROCESSED_DIR, FEATURES_DIR, PARAMS_DIR]:
+        os.makedirs(os.path.join(output_dir, sub_dir), exist_ok=True)
+
+    results = []
+    def log_result(result: dict) -> None:
+        results.append(result)
+        msg = f"[{len(results)}/{len(files)}] {result['status']} {result['file_name']} ({result['seconds']:.2f}s)"
+        if result['status'] == 'failed':
+            logger.error(f"{msg}\n{result['error']}")
+        else:
+            logger.info(msg)
+
+    if workers == 1:
+        for f in files:
+            log_result(process_file(f, output_dir, overwrite, leg_lift_window, cache, instrumentation, lean, kinematics))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_file, f, output_dir, overwrite, leg_lift_window, cache, instrumentation, lean, kinematics): f for f in files}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    # the worker process itself died, e.g. out of memory
+                    result = {'file_name': futures[future], 'status': 'failed', 'seconds': 0.0, 'error': traceback.format_exc()}
+                log_result(result)
+
+    failed = [r for r in results if r['status'] == 'failed']
+    logger.info(f"Finished: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    # a failed file's old features were deleted, which the modification times don't show
+    build_training_data(output_dir, overwrite or any(r.get('invalidated') for r in failed))
+    if trajectory_store:
+        processed_files = get_input_files(os.path.join(output_dir, PROCESSED_DIR))
+        build_trajectory_store(processed_files, os.path.join(output_dir, TRAJECTORY_STORE_DIR))
+    return results
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Process a directory of raw pitcher files into processed, pitcher features and training data files.")
+    parser.add_argument("input_dir", help="directory containing raw pitcher files")
+    parser.add_argument("output_dir", help="root output directory, processed/, pitcher_features/ and training/ are created under it")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: cpu count)")
+    parser.add_argument("--overwrite", action="store_true", help="reprocess files even if their outputs are up to date")
+    parser.add_argument("--trajectory-store", action="store_true", help="also pack the processed files into a memory mapped trajectory store")
+    parser.add_argument("--leg-lift-window", type=int, default=30, help="rows the front knee has to rise for to start the leg lift (default: 30)")
+    parser.add_argument("--lean", action="store_true", help="read and process with float32 coordinates, int32 ids and categorical handedness to fit more pitchers per worker")
+    parser.add_argument("--kinematics", action="store_true", help="add peak and checkpoint joint speed, acceleration and arm angle features")
+    parser.add_argument("--cache-dir", default=None, help="cache stage outputs by input hash and parameters in this directory")
+    parser.add_argument("--cache-max-gb", type=float, default=10.0, help="size limit of the cache in GB (default: 10)")
+    parser.add_argument("--stage-log", default=None, help="append a json line with the time, memory and row counts of every stage to this file")
+    parser.add_argument("--trace-memory", action="store_true", help="also trace the peak python allocations of every stage, slows the stages down")
+    parser.add_argument("--profile-stages", default=None, help="comma separated stages to run under cProfile, e.g. leg_lift,features")
+    parser.add_argument("--profile-dir", default="profiles", help="directory to write the cProfile stats to (default: profiles)")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # the per stage processor logs are too noisy across a whole batch
+    logging.getLogger("pitch_path.processing").setLevel(logging.WARNING)
+    logging.getLogger("pitch_path.utils").setLevel(logging.WARNING)
+
+    cache = FeatureCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    instrumentation = None
+    if args.stage_log or args.trace_memory or args.profile_stages:
+        profile_stages = args.profile_stages.split(",") if args.profile_stages else None
+        instrumentation = Instrumentation([JsonLogSink(args.stage_log)], args.trace_memory, profile_stages, args.profile_dir)
+    results = run_batch(args.input_dir, args.output_dir, args.workers, args.overwrite, args.trajectory_store, args.leg_lift_window,
+                        cache, instrumentation, args.lean, args.kinematics)
+    return 1 if any(r['status'] == 'failed' for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
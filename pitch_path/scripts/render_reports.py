@@ -0,0 +1,221 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import html
+import logging
+import os
+import sys
+import traceback
+import numpy as np
+import pandas as pd
+from pitch_path.model.inference import MODEL_DIR, NO_LABEL, load_model
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.scripts.process_pitchers import get_input_files
+from pitch_path.utils.pitch_batch import PitchBatch
+from pitch_path.utils.pitch_plots import DEFAULT_MAX_POINTS, decimate_trajectories, plot_arm_paths, plot_cluster_centers
+
+logger = logging.getLogger(__name__)
+
+PITCHERS_DIR = "pitchers"
+CLUSTERS_DIR = "clusters"
+INDEX_FILE = "index.html"
+CLUSTER_CENTERS_FILE = "cluster_centers.png"
+DEFAULT_MAX_PITCHES = 100
+DPI = 100
+
+
+def get_sample_priority(pitch_ids: np.ndarray) -> np.ndarray:
+    """Helper function to get a pseudo random but fixed priority for every pitch id. Keeping the pitches with the lowest
+    priorities gives the same sample whatever order the files finish in."""
+    return (pitch_ids.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+
+def sample_pitches(pitch_ids: np.ndarray, max_pitches: int) -> np.ndarray:
+    """Helper function to get the positions of at most `max_pitches` pitches to draw, in their original order."""
+    if pitch_ids.shape[0] <= max_pitches:
+        return np.arange(pitch_ids.shape[0])
+    return np.sort(np.argsort(get_sample_priority(pitch_ids), kind='stable')[:max_pitches])
+
+def save_figure(fig, path: str) -> None:
+    fig.savefig(path, dpi=DPI, bbox_inches='tight')
+
+def render_pitcher_file(file_name: str, output_dir: str, raw: bool=False, max_points: int=DEFAULT_MAX_POINTS,
+                        max_pitches: int=DEFAULT_MAX_PITCHES, model_dir: str=None) -> dict:
+    """Function to render the arm path figure for a pitcher file and, if a model directory is given, label its pitches so they
+    can be drawn by cluster. Any error is caught and returned so one bad file doesn't stop the rest of the batch.
+
+    Args:
+        file_name (str): processed pitcher file, or raw pitcher file if `raw` is set
+        output_dir (str): root output directory, the figure is written under `output_dir/pitchers`
+        raw (bool, optional): the file is a raw pitcher file that still needs to be processed. Defaults to False.
+        max_points (int, optional): points drawn per pitch. Defaults to DEFAULT_MAX_POINTS.
+        max_pitches (int, optional): pitches drawn in the figure. Defaults to DEFAULT_MAX_PITCHES.
+        model_dir (str, optional): model to label the pitches with. Defaults to None, no labels.
+
+    Returns:
+        dict: result with the file name, status (rendered or failed), figure path, pitch ids, labels and decimated trajectories
+    """
+    try:
+        pitcher_df = PitcherDataProcessor(file_name).get_pitcher_df() if raw else pd.read_feather(file_name)
+        batch = PitchBatch.from_frame(pitcher_df)
+        trajectories = decimate_trajectories(batch, max_points)
+        pitcher_id, sched_id = int(batch.pitcher_ids[0]), int(batch.sched_ids[0])
+
+        figure_path = os.path.join(output_dir, PITCHERS_DIR, f"sched_id{sched_id}_pitcher{pitcher_id}.png")
+        shown = sample_pitches(batch.pitch_ids, max_pitches)
+        save_figure(plot_arm_paths(trajectories[shown], f"Pitcher {pitcher_id}, sched_id {sched_id}"), figure_path)
+
+        labels = load_model(model_dir).predict(batch.generate_features()) if model_dir is not None else None
+        # the trajectories go back to the parent for the cluster figures, float32 halves what is sent
+        return {'file_name': file_name, 'status': 'rendered', 'figure': figure_path, 'pitcher_id': pitcher_id, 'sched_id': sched_id,
+                'pitch_ids': batch.pitch_ids.astype(np.int64), 'labels': labels, 'trajectories': trajectories.astype(np.float32),
+                'error': None}
+    except Exception:
+        return {'file_name': file_name, 'status': 'failed', 'figure': None, 'error': traceback.format_exc()}
+
+def render_cluster(label: int, trajectories: np.ndarray, output_dir: str) -> str:
+    """Function to render the arm path figure of a cluster's sampled pitches.
+
+    Args:
+        label (int): cluster label
+        trajectories (np.ndarray): (pitches, points, joints, 3) decimated trajectories
+        output_dir (str): root output directory, the figure is written under `output_dir/clusters`
+
+    Returns:
+        str: figure path
+    """
+    figure_path = os.path.join(output_dir, CLUSTERS_DIR, f"cluster_{label}.png")
+    save_figure(plot_arm_paths(trajectories, f"Cluster {label}"), figure_path)
+    return figure_path
+
+def write_index(output_dir: str, pitcher_results: list, cluster_figures: dict) -> str:
+    """Function to write an html page that shows every rendered figure, clusters first.
+
+    Args:
+        output_dir (str): root output directory
+        pitcher_results (list): rendered pitcher file results, see `render_pitcher_file`
+        cluster_figures (dict): figure path for every cluster label, plus the cluster centers figure under None
+
+    Returns:
+        str: index path
+    """
+    def image(path: str, caption: str) -> str:
+        src = html.escape(os.path.relpath(path, output_dir))
+        return f'<figure><img src="{src}" width="100%"><figcaption>{html.escape(caption)}</figcaption></figure>'
+
+    sections = []
+    if cluster_figures:
+        centers = cluster_figures.get(None)
+        images = [image(centers, "Cluster centers")] if centers else []
+        images += [image(path, f"Cluster {label}") for label, path in sorted((k, v) for k, v in cluster_figures.items() if k is not None)]
+        sections.append("<h2>Clusters</h2>\n" + "\n".join(images))
+    pitcher_results = sorted(pitcher_results, key=lambda r: (r['pitcher_id'], r['sched_id']))
+    sections.append("<h2>Pitchers</h2>\n" + "\n".join(image(r['figure'], f"Pitcher {r['pitcher_id']}, sched_id {r['sched_id']}, "
+                                                                         f"{r['pitch_ids'].shape[0]} pitches") for r in pitcher_results))
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    with open(index_path, 'w') as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Pitch path arm paths</title>"
+                "<style>body{font-family:sans-serif;max-width:1200px;margin:auto}</style></head><body>\n"
+                "<h1>Pitch path arm paths</h1>\n" + "\n".join(sections) + "\n</body></html>\n")
+    return index_path
+
+def render_reports(files: list, output_dir: str, workers: int=None, raw: bool=False, max_points: int=DEFAULT_MAX_POINTS,
+                   max_pitches: int=DEFAULT_MAX_PITCHES, model_dir: str=MODEL_DIR) -> list:
+    """Function to render the arm path figures for many pitcher files across a process pool and write an html index of them.
+    Every pitcher file gets a figure under `pitchers/`, and if a model is given every cluster gets a figure of a sample of its
+    pitches from all of the files under `clusters/`, along with the cluster centers. Figures are drawn with the Agg backend, so
+    no display is needed, and every pitch is decimated to `max_points` points and every figure to `max_pitches` pitches, so the
+    render time of a figure doesn't depend on the frame rate or how many pitches there are.
+
+    Args:
+        files (list): processed pitcher files, or raw pitcher files if `raw` is set
+        output_dir (str): root output directory
+        workers (int, optional): number of worker processes, 1 renders everything in this process. Defaults to the cpu count.
+        raw (bool, optional): the files are raw pitcher files that still need to be processed. Defaults to False.
+        max_points (int, optional): points drawn per pitch. Defaults to DEFAULT_MAX_POINTS.
+        max_pitches (int, optional): pitches drawn per figure. Defaults to DEFAULT_MAX_PITCHES.
+        model_dir (str, optional): model to draw the clusters of, None skips the cluster figures. Defaults to the bundled model.
+
+    Returns:
+        list: result for every file, see `render_pitcher_file`
+    """
+    workers = workers or os.cpu_count()
+    logger.info(f"Rendering {len(files)} pitcher files to {output_dir} with {workers} workers")
+    for sub_dir in [PITCHERS_DIR, CLUSTERS_DIR] if model_dir is not None else [PITCHERS_DIR]:
+        os.makedirs(os.path.join(output_dir, sub_dir), exist_ok=True)
+
+    results = []
+    # only the sampled pitches of each cluster are kept as the files come in, so memory doesn't grow with the number of files
+    cluster_samples = {}
+    def add_result(result: dict) -> None:
+        if result['status'] == 'failed':
+            logger.error(f"Failed to render {result['file_name']}\n{result['error']}")
+        else:
+            logger.info(f"[{len(results) + 1}/{len(files)}] rendered {result['file_name']}")
+            if result['labels'] is not None:
+                # NO_LABEL pitches have missing features and aren't in a cluster
+                for label in np.unique(result['labels'][result['labels'] != NO_LABEL]):
+                    in_cluster = result['labels'] == label
+                    pitch_ids, trajectories = cluster_samples.get(label, (np.zeros(0, dtype=np.int64), None))
+                    pitch_ids = np.concatenate([pitch_ids, result['pitch_ids'][in_cluster]])
+                    trajectories = result['trajectories'][in_cluster] if trajectories is None else \
+                        np.concatenate([trajectories, result['trajectories'][in_cluster]])
+                    keep = sample_pitches(pitch_ids, max_pitches)
+                    cluster_samples[label] = (pitch_ids[keep], trajectories[keep])
+            # the trajectories aren't needed once they have been sampled
+            result['trajectories'] = None
+        results.append(result)
+
+    args = (output_dir, raw, max_points, max_pitches, model_dir)
+    cluster_figures = {}
+    if workers == 1:
+        for f in files:
+            add_result(render_pitcher_file(f, *args))
+        for label, (_, trajectories) in cluster_samples.items():
+            cluster_figures[int(label)] = render_cluster(int(label), trajectories, output_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render_pitcher_file, f, *args): f for f in files}
+            for future in as_completed(futures):
+                try:
+                    add_result(future.result())
+                except Exception:
+                    # the worker process itself died, e.g. out of memory
+                    add_result({'file_name': futures[future], 'status': 'failed', 'figure': None, 'error': traceback.format_exc()})
+            cluster_futures = {executor.submit(render_cluster, int(label), trajectories, output_dir): int(label)
+                               for label, (_, trajectories) in cluster_samples.items()}
+            for future in as_completed(cluster_futures):
+                cluster_figures[cluster_futures[future]] = future.result()
+
+    if model_dir is not None:
+        cluster_figures[None] = os.path.join(output_dir, CLUSTERS_DIR, CLUSTER_CENTERS_FILE)
+        save_figure(plot_cluster_centers(load_model(model_dir).get_centroids_df()), cluster_figures[None])
+
+    rendered = [r for r in results if r['status'] == 'rendered']
+    index_path = write_index(output_dir, rendered, cluster_figures)
+    logger.info(f"Finished: {len(rendered)} rendered, {len(results) - len(rendered)} failed, index at {index_path}")
+    return results
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Render arm path and release point figures for pitcher files, per pitcher and per cluster, with an html index.")
+    parser.add_argument("inputs", nargs="+", help="processed pitcher files or directories of them, e.g. processed/ from pitch-path-process")
+    parser.add_argument("output_dir", help="directory to write the figures and index.html to")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: cpu count)")
+    parser.add_argument("--raw", action="store_true", help="the files are raw pitcher files")
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS, help=f"points drawn per pitch (default: {DEFAULT_MAX_POINTS})")
+    parser.add_argument("--max-pitches", type=int, default=DEFAULT_MAX_PITCHES, help=f"pitches drawn per figure (default: {DEFAULT_MAX_PITCHES})")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="model used to draw the clusters (default: the bundled model)")
+    parser.add_argument("--no-clusters", action="store_true", help="only render the per pitcher figures")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("pitch_path.processing").setLevel(logging.WARNING)
+    logging.getLogger("pitch_path.utils").setLevel(logging.WARNING)
+
+    files = [f for path in args.inputs for f in (get_input_files(path) if os.path.isdir(path) else [path])]
+    results = render_reports(files, args.output_dir, args.workers, args.raw, args.max_points, args.max_pitches,
+                             None if args.no_clusters else args.model_dir)
+    return 1 if any(r['status'] == 'failed' for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import argparse
+import json
+import logging
+import sys
+import time
+import numpy as np
+import pandas as pd
+from pitch_path.model.inference import MODEL_DIR, load_model
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.processing.online import OnlinePitchClassifier
+
+logger = logging.getLogger(__name__)
+
+PARITY_RTOL = 1e-9
+
+
+def get_replay_frames(processor: PitcherDataProcessor) -> tuple:
+    """Helper function to get the frames of a raw pitcher file in the order a live feed would send them, one pitch at a time in
+    time order, with the coordinates in the order `OnlinePitchClassifier.update_frame` takes them.
+
+    Args:
+        processor (PitcherDataProcessor): processor for the raw file
+
+    Returns:
+        tuple: (astros_pitch_ids, times, (frames, tracked joints, 3) coordinates)
+    """
+    # the frame batch is already in pitch and time order, with the joints in the processor's order
+    batch = processor.frame_batch
+    return np.repeat(batch.pitch_ids, batch.lengths), batch.times, batch.coords.astype(np.float64)
+
+def replay_file(file_name: str, realtime: bool=False, speed: float=1.0, leg_lift_window: int=30, model_dir: str=MODEL_DIR) -> tuple:
+    """Function to feed a saved raw pitcher file through `OnlinePitchClassifier` frame by frame, timing every frame.
+
+    Args:
+        file_name (str): raw pitcher file
+        realtime (bool, optional): wait between frames at the recorded frame rate (divided by `speed`) instead of replaying as
+            fast as possible. Pitches are replayed back to back. Defaults to False.
+        speed (float, optional): replay speed multiplier when replaying in real time. Defaults to 1.0.
+        leg_lift_window (int, optional): rows the front knee has to rise for to start the leg lift. Defaults to 30.
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+
+    Returns:
+        tuple: (processor, pitch results from the classifier, per frame update seconds, per result latency seconds). The latency
+        is from when the release frame arrived to when the label was returned, which includes waiting for the next frame when
+        the release is only known once a frame with time >= 0 arrives.
+    """
+    processor = PitcherDataProcessor(file_name, leg_lift_window=leg_lift_window)
+    classifier = OnlinePitchClassifier(processor.pitcher_id, processor.sched_id, processor.throws, load_model(model_dir), leg_lift_window)
+    if classifier.tracked_joints != processor.joints_to_filter_to:
+        raise Exception(f"Online joints {classifier.tracked_joints} don't match the processor joints {processor.joints_to_filter_to}.")
+    pitch_ids, times, coords = get_replay_frames(processor)
+
+    results, frame_seconds, latencies = [], np.zeros(times.shape[0]), []
+    arrivals = {}
+    replay_start = time.perf_counter()
+    pitch_start_time, pitch_start_wall = None, replay_start
+    for i in range(times.shape[0]):
+        if i == 0 or pitch_ids[i] != pitch_ids[i - 1]:
+            pitch_start_time, pitch_start_wall = times[i], time.perf_counter()
+        if realtime:
+            wait = pitch_start_wall + (times[i] - pitch_start_time) / speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        arrival = time.perf_counter()
+        arrivals[(pitch_ids[i], times[i])] = arrival
+        result = classifier.update_frame(pitch_ids[i], times[i], coords[i])
+        done = time.perf_counter()
+        frame_seconds[i] = done - arrival
+        if result is not None:
+            results.append(result)
+            if result['features'] is not None:
+                latencies.append(done - arrivals[(result['astros_pitch_id'], result['release_time'])])
+        if i > 0 and pitch_ids[i] != pitch_ids[i - 1]:
+            arrivals = {key: value for key, value in arrivals.items() if key[0] == pitch_ids[i]}
+    results += classifier.finish()
+    return processor, results, frame_seconds, np.array(latencies)
+
+def check_parity(processor: PitcherDataProcessor, results: list, rtol: float=PARITY_RTOL, model_dir: str=MODEL_DIR) -> dict:
+    """Function to compare the online results with the batch features and labels for the same file.
+
+    Args:
+        processor (PitcherDataProcessor): processor for the raw file
+        results (list): pitch results from the classifier
+        rtol (float, optional): relative tolerance for the feature values. Defaults to PARITY_RTOL.
+        model_dir (str, optional): directory of the model the online classifier used. Defaults to the bundled model.
+
+    Returns:
+        dict: pitch counts, the pitches only one path has, the largest feature difference and the mismatched labels
+    """
+    batch_df = processor.get_pitcher_features_df().set_index('astros_pitch_id').sort_index()
+    batch_labels = pd.Series(load_model(model_dir).predict(batch_df), index=batch_df.index)
+    online_results = [r for r in results if r['features'] is not None]
+    online_df = pd.DataFrame([r['features'] for r in online_results]).set_index('astros_pitch_id').sort_index()
+    online_labels = pd.Series([r['label'] for r in online_results], index=[r['astros_pitch_id'] for r in online_results]).sort_index()
+
+    common = batch_df.index.intersection(online_df.index)
+    cols = batch_df.columns
+    batch_values = batch_df.loc[common, cols].to_numpy(dtype=np.float64)
+    online_values = online_df.loc[common, cols].to_numpy(dtype=np.float64)
+    diffs = np.abs(batch_values - online_values)
+    mismatched_labels = common[batch_labels.loc[common].to_numpy() != online_labels.loc[common].to_numpy()]
+    return {
+        'batch_pitches': int(batch_df.shape[0]),
+        'online_pitches': int(online_df.shape[0]),
+        'batch_only': batch_df.index.difference(online_df.index).tolist(),
+        'online_only': online_df.index.difference(batch_df.index).tolist(),
+        'max_abs_diff': float(diffs.max()) if diffs.size else 0.0,
+        'features_match': bool(np.allclose(online_values, batch_values, rtol=rtol, atol=0)),
+        'mismatched_labels': mismatched_labels.tolist(),
+        'columns_match': list(online_df.columns) == list(cols),
+    }
+
+def summarize_seconds(seconds: np.ndarray) -> dict:
+    if seconds.size == 0:
+        return {}
+    return {f"p{p}_us": float(np.percentile(seconds, p) * 1e6) for p in [50, 99]} | {'max_us': float(seconds.max() * 1e6)}
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay raw pitcher files through the online classifier and check latency and parity with the batch path.")
+    parser.add_argument("files", nargs="+", help="raw pitcher files")
+    parser.add_argument("--realtime", action="store_true", help="replay at the recorded frame rate instead of as fast as possible")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier with --realtime (default: 1.0)")
+    parser.add_argument("--leg-lift-window", type=int, default=30, help="rows the front knee has to rise for to start the leg lift (default: 30)")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="directory with the model and scaler pickles (default: bundled model)")
+    parser.add_argument("--no-parity", action="store_true", help="skip the parity check against the batch path")
+    parser.add_argument("-o", "--output", default=None, help="json file to write the report to")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("pitch_path.processing").setLevel(logging.WARNING)
+    logging.getLogger("pitch_path.utils").setLevel(logging.WARNING)
+
+    reports, ok = [], True
+    for file_name in args.files:
+        processor, results, frame_seconds, latencies = replay_file(file_name, args.realtime, args.speed, args.leg_lift_window, args.model_dir)
+        report = {'file_name': file_name, 'frames': int(frame_seconds.shape[0]), 'pitches': len(results),
+                  'frame_update': summarize_seconds(frame_seconds), 'release_to_label': summarize_seconds(latencies)}
+        if not args.no_parity:
+            report['parity'] = check_parity(processor, results, model_dir=args.model_dir)
+            parity = report['parity']
+            ok &= parity['features_match'] and parity['columns_match'] and not (parity['mismatched_labels'] or parity['batch_only'] or parity['online_only'])
+        logger.info(json.dumps(report))
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
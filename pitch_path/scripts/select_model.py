@@ -0,0 +1,39 @@
+import argparse
+import logging
+import sys
+from pitch_path.model.selection import CLUSTER_COLS, DEFAULT_SAMPLE_SIZE, select_model
+
+logger = logging.getLogger(__name__)
+
+
+def parse_k_values(value: str) -> list:
+    """Helper function to parse k values given as a range like 2-7 or a comma separated list like 3,4,5."""
+    if '-' in value:
+        first, last = value.split('-')
+        return list(range(int(first), int(last) + 1))
+    return [int(k) for k in value.split(',')]
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare KMeans models across feature sets, k and seeds and save the best one.")
+    parser.add_argument("training_file", help="training data feather file, e.g. training/training_data from pitch-path-process")
+    parser.add_argument("output_dir", help="directory to write the results table and the model pickles to, as a new version if it has versions/LATEST")
+    parser.add_argument("--feature-sets", default=None, help=f"comma separated feature sets (default: all of {','.join(['all'] + list(CLUSTER_COLS))})")
+    parser.add_argument("-k", "--k-values", type=parse_k_values, default="2-7", help="k range like 2-7 or list like 3,4,5 (default: 2-7)")
+    parser.add_argument("--seeds", type=lambda s: [int(x) for x in s.split(',')], default="42", help="comma separated random seeds (default: 42)")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help=f"pitches sampled for each silhouette score, 0 for the full score (default: {DEFAULT_SAMPLE_SIZE})")
+    parser.add_argument("--mini-batch", action="store_true", help="fit with MiniBatchKMeans instead of KMeans")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: cpu count)")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    feature_sets = args.feature_sets.split(',') if args.feature_sets else None
+    results_df = select_model(args.training_file, args.output_dir, feature_sets, args.k_values, args.seeds, args.sample_size or None,
+                              args.mini_batch, args.workers)
+    logger.info(f"Top candidates:\n{results_df.head(10).to_string(index=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
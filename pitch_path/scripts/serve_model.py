@@ -0,0 +1,123 @@
+import argparse
+import json
+import logging
+import sys
+from pitch_path.model.inference import MODEL_DIR, load_model
+
+logger = logging.getLogger(__name__)
+
+
+def classify_request(request, model_dir: str=MODEL_DIR) -> dict:
+    """Function to classify the pitches in a single request. A request is either a single feature dict, a list of feature
+    dicts, or a dict with the feature dicts under `pitches`. Any other keys on a pitch (like `astros_pitch_id`) are ignored.
+
+    Args:
+        request: parsed json request
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+
+    Returns:
+        dict: response with a `labels` list, or an `error` message
+    """
+    try:
+        if isinstance(request, dict):
+            pitches = request.get('pitches', [request])
+        else:
+            pitches = request
+        labels = load_model(model_dir).predict(pitches)
+        return {'labels': labels.tolist()}
+    except Exception as e:
+        return {'error': str(e)}
+
+def serve_stdin(model_dir: str=MODEL_DIR, input_stream=sys.stdin, output_stream=sys.stdout) -> None:
+    """Read one json request per line from stdin and write one json response per line to stdout.
+
+    Args:
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+        input_stream (optional): stream to read requests from. Defaults to sys.stdin.
+        output_stream (optional): stream to write responses to. Defaults to sys.stdout.
+    """
+    for line in input_stream:
+        if not line.strip():
+            continue
+        try:
+            response = classify_request(json.loads(line), model_dir)
+        except json.JSONDecodeError as e:
+            response = {'error': f"Invalid json: {e}"}
+        output_stream.write(json.dumps(response) + "\n")
+        output_stream.flush()
+
+def make_handler(model_dir: str=MODEL_DIR) -> type:
+    # http.server is only imported when serving over http, the stdin server doesn't need it
+    from http.server import BaseHTTPRequestHandler
+
+    class PredictHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self.send_json(200, {'status': 'ok', 'features': load_model(model_dir).feature_cols})
+            else:
+                self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            if self.path != "/predict":
+                self.send_json(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except json.JSONDecodeError as e:
+                self.send_json(400, {'error': f"Invalid json: {e}"})
+                return
+            response = classify_request(request, model_dir)
+            self.send_json(400 if 'error' in response else 200, response)
+
+        def log_message(self, format, *args) -> None:
+            logger.debug(format % args)
+
+    return PredictHandler
+
+def serve_http(host: str="127.0.0.1", port: int=8000, model_dir: str=MODEL_DIR) -> None:
+    """Serve the model over http. POST a json request (see `classify_request`) to /predict, GET /health to check the server.
+
+    Args:
+        host (str, optional): host to bind. Defaults to "127.0.0.1".
+        port (int, optional): port to bind. Defaults to 8000.
+        model_dir (str, optional): directory with the model and scaler pickles. Defaults to the bundled model.
+    """
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), make_handler(model_dir))
+    logger.info(f"Serving pitch path model on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the pitch path model over stdin/stdout or http.")
+    parser.add_argument("--http", action="store_true", help="serve over http instead of stdin/stdout")
+    parser.add_argument("--host", default="127.0.0.1", help="http host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="http port (default: 8000)")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="directory with the model and scaler pickles (default: bundled model)")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    # logs go to stderr so they don't mix with stdout responses
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # load the model before taking requests so the first request doesn't pay for it
+    load_model(args.model_dir)
+
+    if args.http:
+        serve_http(args.host, args.port, args.model_dir)
+    else:
+        serve_stdin(args.model_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import pandas as pd
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.utils.similarity import DEFAULT_BUFFER_SIZE, DEFAULT_N_POINTS, META_FILE, ArmPathIndex
+
+logger = logging.getLogger(__name__)
+
+
+def add_files(index_dir: str, files: list, raw: bool=False, n_points: int=DEFAULT_N_POINTS, buffer_size: int=DEFAULT_BUFFER_SIZE) -> ArmPathIndex:
+    """Function to add pitcher files to an arm path index, creating the index if it doesn't exist yet.
+
+    Args:
+        index_dir (str): index directory
+        files (list): processed pitcher files, or raw pitcher files if `raw` is set
+        raw (bool, optional): the files are raw pitcher files that still need to be processed. Defaults to False.
+        n_points (int, optional): frames to resample each pitch to for a new index. Defaults to DEFAULT_N_POINTS.
+        buffer_size (int, optional): buffered pitches before the tree is rebuilt for a new index. Defaults to DEFAULT_BUFFER_SIZE.
+
+    Returns:
+        ArmPathIndex: the updated index
+    """
+    if os.path.exists(os.path.join(index_dir, META_FILE)):
+        index = ArmPathIndex.load(index_dir)
+    else:
+        index = ArmPathIndex(n_points, buffer_size=buffer_size)
+    for file_name in files:
+        pitcher_df = PitcherDataProcessor(file_name).get_pitcher_df() if raw else pd.read_feather(file_name)
+        added = index.add_pitcher_df(pitcher_df)
+        logger.info(f"Added {added} pitches from {file_name}")
+    index.save(index_dir)
+    return index
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Build an arm path similarity index and find the pitches with the most similar arm paths.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="add pitcher files to the index, creating it if needed")
+    add_parser.add_argument("index_dir", help="index directory")
+    add_parser.add_argument("files", nargs="+", help="processed pitcher files, e.g. processed/ from pitch-path-process")
+    add_parser.add_argument("--raw", action="store_true", help="the files are raw pitcher files")
+    add_parser.add_argument("--n-points", type=int, default=DEFAULT_N_POINTS, help=f"frames to resample each pitch to for a new index (default: {DEFAULT_N_POINTS})")
+    add_parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                            help=f"pitches added before the tree is rebuilt for a new index (default: {DEFAULT_BUFFER_SIZE})")
+    query_parser = subparsers.add_parser("query", help="find the pitches with the most similar arm paths to indexed pitches")
+    query_parser.add_argument("index_dir", help="index directory")
+    query_parser.add_argument("pitch_ids", nargs="+", type=int, help="astros_pitch_ids to query")
+    query_parser.add_argument("-k", type=int, default=10, help="number of similar pitches (default: 10)")
+    for subparser in [add_parser, query_parser]:
+        subparser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("pitch_path.processing").setLevel(logging.WARNING)
+
+    if args.command == "add":
+        index = add_files(args.index_dir, args.files, args.raw, args.n_points, args.buffer_size)
+        logger.info(f"Arm path index in {args.index_dir} has {len(index)} pitches")
+        return 0
+
+    index = ArmPathIndex.load(args.index_dir)
+    for pitch_id in args.pitch_ids:
+        distances, pitches = index.query_pitch(pitch_id, args.k)
+        similar = [{'astros_pitch_id': int(p['astros_pitch_id']), 'pitcher_id': int(p['pitcher_id']), 'sched_id': int(p['sched_id']),
+                    'distance': float(d)} for p, d in zip(pitches, distances)]
+        print(json.dumps({'astros_pitch_id': pitch_id, 'similar': similar}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import pandas as pd
+from pitch_path.model.incremental import DEFAULT_DRIFT_THRESHOLD, get_version_dir, update_model
+from pitch_path.model.inference import MODEL_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def read_features_files(paths: list) -> pd.DataFrame:
+    """Helper function to read pitcher features files, expanding directories to every file in them."""
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+    return pd.concat([pd.read_feather(f) for f in files if not os.path.basename(f).startswith('.')], ignore_index=True)
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Add new games to the partitioned training data and update the model incrementally.")
+    parser.add_argument("features", nargs="+", help="pitcher features files or directories, e.g. pitcher_features from pitch-path-process")
+    parser.add_argument("--training-dir", required=True, help="partitioned training data directory")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="directory with the model versions (default: bundled model directory)")
+    parser.add_argument("--drift-threshold", type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                        help=f"centroid movement since the last full refit that triggers a new full refit (default: {DEFAULT_DRIFT_THRESHOLD})")
+    parser.add_argument("--full-refit", action="store_true", help="refit on the full training data instead of updating")
+    parser.add_argument("--overwrite", action="store_true", help="replace games that are already in the training data")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    features_df = read_features_files(args.features)
+    version = update_model(features_df, args.training_dir, args.model_dir, args.drift_threshold, args.full_refit, args.overwrite)
+    if version is not None:
+        logger.info(f"Model version {version} is in {get_version_dir(args.model_dir, version)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import pandas as pd
+import pitch_path
+
+logger = logging.getLogger(__name__)
+
+# bump these when a change to the code changes the output of the stage, so cached outputs from older code are not used
+SEGMENTATION_CODE_VERSION = 1
+FEATURES_CODE_VERSION = 1
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+HASH_CHUNK_SIZE = 8 * 1024 ** 2
+
+
+def make_cache_key(stage: str, **params) -> str:
+    """Helper function to build a cache key from a stage name and everything the stage output depends on.
+
+    Args:
+        stage (str): pipeline stage, e.g. processed or features
+        **params: json serializable parameters the stage output depends on
+
+    Returns:
+        str: sha256 hex digest
+    """
+    payload = json.dumps({'stage': stage, 'package_version': pitch_path.__version__, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def get_umask() -> int:
+    """Helper function to get the process umask, which can only be read by setting it."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def write_atomic(path: str, write_fn) -> None:
+    """Helper function to write a file through a temporary file and a rename, so concurrent readers never see a partial file.
+    The file gets the usual permissions for a new file (0666 less the umask) instead of the owner only ones of the temporary
+    file, so a directory shared between users stays readable.
+
+    Args:
+        path (str): file to write
+        write_fn: function that writes to the path it is given
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    os.close(fd)
+    try:
+        write_fn(tmp_path)
+        os.chmod(tmp_path, 0o666 & ~get_umask())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class FeatureCache:
+    """Class used to cache pipeline stage outputs on disk. Entries are keyed by the content hash of the input file plus the stage
+    parameters, code version and package version (see `make_cache_key`), so an output is reused only if it would come out the same.
+    The cache is bounded to `max_bytes` and evicts the least recently used entries first. The input hash memos under `hashes/` are
+    a few hundred bytes per input file and aren't counted towards `max_bytes` or evicted, so they grow with the number of distinct
+    input paths; deleting the directory only costs rehashing the inputs.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int=DEFAULT_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        self.hashes_dir = os.path.join(cache_dir, "hashes")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.hashes_dir, exist_ok=True)
+
+    def hash_file(self, file_name: str) -> str:
+        """Get the sha256 of a file's contents. The hash is remembered by path, size and modification time so unchanged files are
+        only hashed once.
+
+        Args:
+            file_name (str): file to hash
+
+        Returns:
+            str: sha256 hex digest
+        """
+        stat = os.stat(file_name)
+        abs_path = os.path.abspath(file_name)
+        memo_path = os.path.join(self.hashes_dir, hashlib.sha1(abs_path.encode()).hexdigest() + ".json")
+        if os.path.exists(memo_path):
+            with open(memo_path) as f:
+                memo = json.load(f)
+            if memo['size'] == stat.st_size and memo['mtime_ns'] == stat.st_mtime_ns:
+                return memo['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        memo = {'path': abs_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+        def write_memo(path: str) -> None:
+            with open(path, 'w') as f:
+                json.dump(memo, f)
+        write_atomic(memo_path, write_memo)
+        return memo['sha256']
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, f"{key}.feather")
+
+    def get(self, key: str) -> pd.DataFrame:
+        """Get a cached dataframe.
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            pd.DataFrame: cached dataframe, or None if it isn't cached
+        """
+        path = self.get_path(key)
+        try:
+            df = pd.read_feather(path)
+        except FileNotFoundError:
+            logger.info(f"Cache miss for {key}")
+            return None
+        # the modification time is used as the last access time for eviction, another process may have evicted it since the read
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        logger.info(f"Cache hit for {key}")
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Cache a dataframe and evict old entries if the cache is over its size limit.
+
+        Args:
+            key (str): cache key
+            df (pd.DataFrame): dataframe to cache
+        """
+        write_atomic(self.get_path(key), lambda path: df.reset_index(drop=True).to_feather(path=path))
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until the cache is under its size limit."""
+        entries = []
+        for f in os.listdir(self.entries_dir):
+            if f.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.entries_dir, f))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            logger.info(f"Evicting {f} from cache")
+            try:
+                os.remove(os.path.join(self.entries_dir, f))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -3,11 +3,14 @@ import logging
 import numpy as np
 import pandas as pd
 import pitch_path.utils.preprocessing as pp
-from scipy.spatial import distance
+from pitch_path.utils.instrumentation import stage
 
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_COLS = ['start', 'time_25', 'time_5', 'time_75', 'release']
+AXES = ['x', 'y', 'z']
+
 def get_col_values_at_time(df: pd.DataFrame, time_col: str, joint_loc_cols: list) -> pd.DataFrame:
     """Helper function to return a list of columns at different time intervals. E.g. at start, release, midway point, etc.
     This works by grabbing the rows where the time column is 1.
@@ -37,6 +40,8 @@ def get_distance_to_prev(df: pd.DataFrame, joint_cols: list, prev_joint_cols: li
     Returns:
         pd.DataFrame: pitch dataframe with added distance column
     """
+    # scipy is only needed by this legacy row-wise version, so it's imported here instead of with the module
+    from scipy.spatial import distance
     df[distance_col_name] = df.apply(lambda x: 0 if np.isnan(x[prev_joint_cols[0]])
                                   else distance.cdist([x[joint_cols].to_list()], [x[prev_joint_cols].to_list()], 'euclidean')[0][0], axis=1)
     return df
@@ -138,16 +143,113 @@ def generate_features_from_pitch_df(df: pd.DataFrame, pitcher_id: int, sched_id:
         pd.DataFrame: pitch feature dataframe that contains a feature row for all pitches
     """
     logger.info(f"Getting features for pitcher_id: {pitcher_id} and sched_id: {sched_id}")
-    all_pitches_features_list = []
+    with stage('features', rows_in=df.shape[0]) as record:
+        all_pitches_features_list = []
+
+        prev_joint_cols = [f"prev_{x}" for x in joint_cols]
+        cols_to_shift = joint_cols + ['time']
+
+        for pitch in df['astros_pitch_id'].unique():
+            pitch_df = df[df['astros_pitch_id'] == pitch]
+            pitch_df = pp.add_shifted_columns(pitch_df, cols_to_shift)
+
+            feature_row = generate_feature_row_from_pitch_df(pitch_df, pitcher_id, sched_id, joint_cols, prev_joint_cols, joints, distance_col_name)
+            all_pitches_features_list.append(feature_row)
+        pitch_features = pd.concat(all_pitches_features_list)
+        record['rows_out'] = pitch_features.shape[0]
+
+    return pitch_features
+
+def get_pitch_codes(df: pd.DataFrame) -> tuple:
+    """Helper function to map every row to an integer code for its pitch, in order of first appearance. Also returns a stable
+    ordering of the rows that makes each pitch contiguous so we can use array diffs instead of per pitch slices.
+
+    Args:
+        df (pd.DataFrame): pitch dataframe
+
+    Returns:
+        tuple: (codes, pitch ids, row order that groups the pitches together)
+    """
+    codes, pitch_ids = pd.factorize(df['astros_pitch_id'], sort=False)
+    order = np.argsort(codes, kind='stable')
+    return codes, pitch_ids, order
+
+def get_frame_distances(coords: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Vectorized version of `get_distance_to_prev`. Calculates the euclidean distance from every frame to the previous frame
+    of the same pitch. Rows have to be grouped by pitch already (see `get_pitch_codes`). The first frame of a pitch, or any frame
+    where the previous location is missing, gets a distance of 0 to match the row-wise implementation.
+
+    Args:
+        coords (np.ndarray): (frames, 3) array of (x,y,z) locations for a single joint
+        codes (np.ndarray): pitch code for each frame
 
-    prev_joint_cols = [f"prev_{x}" for x in joint_cols]
-    cols_to_shift = joint_cols + ['time']
+    Returns:
+        np.ndarray: distance to previous frame for each frame
+    """
+    distances = np.zeros(coords.shape[0], dtype=np.float64)
+    if coords.shape[0] < 2:
+        return distances
+    prev_coords = coords[:-1]
+    distances[1:] = np.linalg.norm(coords[1:] - prev_coords, axis=1)
+    no_prev = np.isnan(prev_coords[:, 0]) | (codes[1:] != codes[:-1])
+    distances[1:][no_prev] = 0
+    return distances
+
+def get_checkpoint_positions(flags: np.ndarray, codes: np.ndarray, n_pitches: int) -> np.ndarray:
+    """Helper function to find the row of each pitch where a checkpoint flag (start, release, etc) is set. If a pitch has more
+    than one flagged row the first one is used, and pitches without a flagged row get -1.
+
+    Args:
+        flags (np.ndarray): flag column where the checkpoint row is 1
+        codes (np.ndarray): pitch code for each frame
+        n_pitches (int): number of pitches
 
-    for pitch in df['astros_pitch_id'].unique():
-        pitch_df = df[df['astros_pitch_id'] == pitch]
-        pitch_df = pp.add_shifted_columns(pitch_df, cols_to_shift)
+    Returns:
+        np.ndarray: row position of the checkpoint for every pitch
+    """
+    flagged_rows = np.flatnonzero(flags == 1)
+    positions = np.full(n_pitches, -1, dtype=np.int64)
+    # assign in reverse so the first flagged row of each pitch is the one that sticks
+    positions[codes[flagged_rows[::-1]]] = flagged_rows[::-1]
+    return positions
 
-        feature_row = generate_feature_row_from_pitch_df(pitch_df, pitcher_id, sched_id, joint_cols, prev_joint_cols, joints, distance_col_name)
-        all_pitches_features_list.append(feature_row)
+def generate_features(df: pd.DataFrame, pitcher_id: int, sched_id: int, joints: list) -> pd.DataFrame:
+    """Vectorized version of `generate_features_from_pitch_df`. Instead of looping over every pitch and building each feature row
+    with cross merges, the distance traveled and the joint locations at the start, 25, 50, 75 percentiles and release are calculated
+    for all pitches at once with array diffs and grouped reductions. The output has the same columns, in the same order.
 
-    return pd.concat(all_pitches_features_list)
\ No newline at end of file
+    Args:
+        df (pd.DataFrame): pitch dataframe that has been filtered to start and release
+        pitcher_id (int): pitchid of pitch
+        sched_id (int): schedule id of pitch
+        joints (list): list of joints to calculate features for
+
+    Returns:
+        pd.DataFrame: pitch feature dataframe that contains a feature row for all pitches
+    """
+    logger.info(f"Getting features for pitcher_id: {pitcher_id} and sched_id: {sched_id}")
+    with stage('features', rows_in=df.shape[0]) as record:
+        codes, pitch_ids, order = get_pitch_codes(df)
+        n_pitches = len(pitch_ids)
+        sorted_codes = codes[order]
+
+        checkpoint_positions = {col: get_checkpoint_positions(df[col].to_numpy(), codes, n_pitches) for col in CHECKPOINT_COLS}
+
+        features = {}
+        for j in joints:
+            coords = df[[f"{j}_{axis}" for axis in AXES]].to_numpy(dtype=np.float64)
+            distances = get_frame_distances(coords[order], sorted_codes)
+            features[f"distance_traveled_{j}"] = np.bincount(sorted_codes, weights=np.nan_to_num(distances), minlength=n_pitches)
+
+            for col, positions in checkpoint_positions.items():
+                checkpoint_coords = np.where((positions >= 0)[:, None], coords[positions], np.nan)
+                for i, axis in enumerate(AXES):
+                    features[f"{j}_{axis}_{col}"] = checkpoint_coords[:, i]
+
+        pitch_features = pd.DataFrame(features)
+        pitch_features['pitcher_id'] = pitcher_id
+        pitch_features['sched_id'] = sched_id
+        pitch_features['astros_pitch_id'] = np.asarray(pitch_ids)
+        record['rows_out'] = pitch_features.shape[0]
+
+    return pitch_features
@@ -0,0 +1,171 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# instrumentation the stages report to, set by `Instrumentation.activate`. None means instrumentation is off.
+_active = None
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+
+
+def get_rss_bytes() -> int:
+    """Helper function to get the current resident set size of the process, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, TypeError, ValueError, IndexError):
+        return None
+
+
+class JsonLogSink:
+    """Sink that writes every stage record as a line of json, appended to a file or logged if no file is given. The file is opened
+    for every record, so the sink can be pickled and sent to worker processes that all append to the same file.
+    """
+    def __init__(self, path: str=None) -> None:
+        self.path = path
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        if self.path is None:
+            logger.info(line)
+            return
+        with open(self.path, 'a') as f:
+            f.write(line + "\n")
+
+
+class MemoryCollector:
+    """Sink that keeps every stage record in memory, e.g. for tests or notebooks."""
+    def __init__(self) -> None:
+        self.records = []
+
+    def write(self, record: dict) -> None:
+        self.records.append(record)
+
+    def clear(self) -> None:
+        self.records = []
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records)
+
+
+class Instrumentation:
+    """Class used to record the wall time, memory and row counts of each pipeline stage. The pipeline stages report through the
+    module level `stage` function, which does nothing unless an instrumentation is active (see `activate`), so the stages cost a
+    function call and an empty context manager when instrumentation is off.
+
+    Every record has the stage name, the activation context (e.g. the file being processed), the wall time, the input and output
+    row counts, the change in RSS over the stage (`rss_delta_bytes`, where /proc is available) and the process peak RSS so far
+    (`process_max_rss_bytes`, which never goes down so it isn't a per stage figure). With `trace_memory` the peak python
+    allocations during the stage (`peak_alloc_bytes`) are traced with tracemalloc too, which slows the stages down so it is off
+    by default. Stages named in `profile_stages` are run
+    under cProfile and the stats written to `profile_dir`.
+    """
+    def __init__(self, sinks: list=None, trace_memory: bool=False, profile_stages: list=None, profile_dir: str=None) -> None:
+        if profile_stages and profile_dir is None:
+            raise Exception("profile_dir is required to profile stages.")
+        self.sinks = sinks if sinks is not None else [JsonLogSink()]
+        self.trace_memory = trace_memory
+        self.profile_stages = set(profile_stages or [])
+        self.profile_dir = profile_dir
+        self.context = {}
+        self.profiling = False
+
+    @contextlib.contextmanager
+    def activate(self, **context):
+        """Context manager that makes this the instrumentation the stages report to, with `context` added to every record.
+        Activations can be nested, the previous instrumentation and context are restored on exit.
+
+        Yields:
+            Instrumentation: this instrumentation
+        """
+        global _active
+        previous_active, previous_context = _active, self.context
+        _active, self.context = self, {**previous_context, **context}
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            _active, self.context = previous_active, previous_context
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: int=None):
+        """Context manager that records a single stage. Set `rows_out` on the yielded record before the stage exits.
+
+        Args:
+            name (str): stage name
+            rows_in (int, optional): input row count. Defaults to None.
+
+        Yields:
+            dict: the stage record
+        """
+        record = {**self.context, 'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        profiler = None
+        if name in self.profile_stages and not self.profiling:
+            profiler = cProfile.Profile()
+            self.profiling = True
+        if self.trace_memory:
+            start_traced, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+
+        start_rss = get_rss_bytes()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                _, peak_traced = tracemalloc.get_traced_memory()
+                record['peak_alloc_bytes'] = peak_traced - start_traced
+            end_rss = get_rss_bytes()
+            record['rss_delta_bytes'] = end_rss - start_rss if start_rss is not None and end_rss is not None else None
+            # ru_maxrss is in kilobytes on linux
+            record['process_max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            if profiler is not None:
+                record['profile_path'] = self.write_profile(profiler, record)
+            for sink in self.sinks:
+                sink.write(record)
+
+    def write_profile(self, profiler: cProfile.Profile, record: dict) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        file_name = os.path.basename(str(record.get('file', 'pipeline')))
+        path = os.path.join(self.profile_dir, f"{file_name}_{record['stage']}_{os.getpid()}_{time.time_ns()}.prof")
+        profiler.dump_stats(path)
+        return path
+
+
+def stage(name: str, rows_in: int=None):
+    """Function for pipeline stages to report to the active instrumentation, see `Instrumentation.stage`. If there isn't an
+    active instrumentation the record is thrown away.
+
+    Args:
+        name (str): stage name
+        rows_in (int, optional): input row count. Defaults to None.
+
+    Returns:
+        context manager yielding the stage record
+    """
+    if _active is None:
+        return contextlib.nullcontext({})
+    return _active.stage(name, rows_in)
+
+def activate(instrumentation: Instrumentation, **context):
+    """Helper function to activate an instrumentation that may be None, see `Instrumentation.activate`."""
+    if instrumentation is None:
+        return contextlib.nullcontext()
+    return instrumentation.activate(**context)
@@ -0,0 +1,216 @@
+import logging
+import numpy as np
+import pandas as pd
+import pitch_path.utils.features as feat
+from pitch_path.utils.instrumentation import stage
+from pitch_path.utils.pitch_batch import PitchBatch, JOINTS_OF_INTEREST
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 7
+DEFAULT_POLYORDER = 2
+ARM_JOINTS = ['shoulder', 'elbow', 'wrist']
+
+
+def get_savgol_coefficients(window: int=DEFAULT_WINDOW, polyorder: int=DEFAULT_POLYORDER) -> np.ndarray:
+    """Helper function to get the Savitzky-Golay smoothing coefficients, the weights that fit a polynomial of degree `polyorder`
+    to `window` frames by least squares and evaluate it at the center frame. Same as `scipy.signal.savgol_coeffs` without
+    needing scipy.
+
+    Args:
+        window (int, optional): frames in the filter, odd. Defaults to DEFAULT_WINDOW.
+        polyorder (int, optional): degree of the fitted polynomial, less than window. Defaults to DEFAULT_POLYORDER.
+
+    Raises:
+        Exception: an even window or a polyorder that isn't less than the window
+
+    Returns:
+        np.ndarray: (window,) coefficients for the frames from -window // 2 to window // 2
+    """
+    if window % 2 != 1 or window < 1:
+        raise Exception(f"The smoothing window has to be a positive odd number of frames, got {window}.")
+    if polyorder >= window:
+        raise Exception(f"The polyorder has to be less than the window, got polyorder {polyorder} and window {window}.")
+    half = window // 2
+    vander = np.vander(np.arange(-half, half + 1, dtype=np.float64), polyorder + 1, increasing=True)
+    # the first row of the pseudo inverse gives the fitted constant term, i.e. the fitted value at the center frame
+    return np.linalg.pinv(vander)[0]
+
+def get_window_indices(offsets: np.ndarray, window: int) -> np.ndarray:
+    """Helper function to get the frames around every frame, clipped to the frame's own pitch so a window never reaches into
+    the next or previous pitch. Frames near the start or end of a pitch repeat the first or last frame, like
+    `scipy.signal.savgol_filter(mode='nearest')` on each pitch.
+
+    Args:
+        offsets (np.ndarray): pitch offsets, see `PitchBatch`
+        window (int): frames in the window, odd
+
+    Returns:
+        np.ndarray: (frames, window) frame indices
+    """
+    lengths = np.diff(offsets)
+    starts = np.repeat(offsets[:-1], lengths)
+    ends = np.repeat(offsets[1:], lengths) - 1
+    half = window // 2
+    indices = np.arange(offsets[-1])[:, None] + np.arange(-half, half + 1)[None, :]
+    return np.clip(indices, starts[:, None], ends[:, None])
+
+def smooth_segments(values: np.ndarray, offsets: np.ndarray, window: int=DEFAULT_WINDOW, polyorder: int=DEFAULT_POLYORDER) -> np.ndarray:
+    """Function to smooth a signal with a Savitzky-Golay filter applied to each pitch separately, for every pitch at once. The
+    window around every frame is gathered with `get_window_indices` and combined with the filter coefficients in one einsum.
+
+    Args:
+        values (np.ndarray): (frames, ...) signal, e.g. a (frames, 3) joint
+        offsets (np.ndarray): pitch offsets, see `PitchBatch`
+        window (int, optional): frames in the filter, odd. Defaults to DEFAULT_WINDOW.
+        polyorder (int, optional): degree of the fitted polynomial. Defaults to DEFAULT_POLYORDER.
+
+    Returns:
+        np.ndarray: float64 smoothed signal with the same shape as values
+    """
+    coefficients = get_savgol_coefficients(window, polyorder)
+    indices = get_window_indices(offsets, window)
+    return np.einsum('w,fw...->f...', coefficients, values.astype(np.float64, copy=False)[indices])
+
+def get_derivative(values: np.ndarray, times: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Helper function to get the time derivative of a signal with central differences within each pitch, and one sided
+    differences at the first and last frame of a pitch. Pitches with a single frame get NaN.
+
+    Args:
+        values (np.ndarray): (frames, ...) signal
+        times (np.ndarray): time of every frame, in seconds
+        offsets (np.ndarray): pitch offsets, see `PitchBatch`
+
+    Returns:
+        np.ndarray: (frames, ...) derivative per second
+    """
+    indices = get_window_indices(offsets, 3)
+    prev_frames, next_frames = indices[:, 0], indices[:, 2]
+    time_deltas = times[next_frames] - times[prev_frames]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        time_deltas = np.where(time_deltas != 0, time_deltas, np.nan)
+        return (values[next_frames] - values[prev_frames]) / time_deltas.reshape((-1,) + (1,) * (values.ndim - 1))
+
+def get_angle(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Helper function to get the angle in degrees between the (frames, 3) vectors u and v of every frame."""
+    norms = np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = np.einsum('fa,fa->f', u, v) / norms
+    return np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+
+def get_kinematics(batch: PitchBatch, joints: list=JOINTS_OF_INTEREST, window: int=DEFAULT_WINDOW,
+                   polyorder: int=DEFAULT_POLYORDER) -> dict:
+    """Function to calculate the per frame kinematic signals of every pitch in a batch at once, from the smoothed joint
+    locations (see `smooth_segments`):
+
+    - `{joint}_speed` and `{joint}_acceleration`: magnitude of the joint's velocity (feet/s) and acceleration (feet/s^2)
+    - `elbow_flexion`: angle between the upper arm and forearm in degrees, 0 is a straight arm
+    - `elbow_extension_velocity`: rate the elbow is straightening in degrees/s
+    - `arm_plane`: angle between the plane of the shoulder, elbow and wrist and the ground in degrees, 90 is a vertical arm plane.
+      The plane is poorly defined when the arm is close to straight, so it is noisy when `elbow_flexion` is within a degree of 0
+    - `arm_slot`: angle of the shoulder to wrist line above horizontal, looking from the plate (the x-z plane), in degrees. 90 is
+      over the top, 0 is sidearm and negative is below the shoulder, the same for either throwing hand
+
+    The angle signals are only calculated if the batch has the shoulder, elbow and wrist. The derivatives amplify the float32
+    rounding of a lean batch (see `PitchBatch`), so lean speeds are within about 1e-3 feet/s, accelerations within about
+    0.1 feet/s^2 and angles within about 0.01 degrees of the default mode (more for `arm_plane` with a straight arm).
+
+    Args:
+        batch (PitchBatch): segmented or unsegmented batch
+        joints (list, optional): joints to get the speed and acceleration for. Defaults to JOINTS_OF_INTEREST.
+        window (int, optional): smoothing window in frames. Defaults to DEFAULT_WINDOW.
+        polyorder (int, optional): smoothing polynomial degree. Defaults to DEFAULT_POLYORDER.
+
+    Returns:
+        dict: (frames,) array for every signal
+    """
+    has_arm = all(joint in batch.joint_index for joint in ARM_JOINTS)
+    smoothed = {joint: smooth_segments(batch.get_joint(joint), batch.offsets, window, polyorder)
+                for joint in dict.fromkeys(list(joints) + (ARM_JOINTS if has_arm else []))}
+
+    kinematics = {}
+    for joint in joints:
+        velocity = get_derivative(smoothed[joint], batch.times, batch.offsets)
+        kinematics[f"{joint}_speed"] = np.linalg.norm(velocity, axis=1)
+        kinematics[f"{joint}_acceleration"] = np.linalg.norm(get_derivative(velocity, batch.times, batch.offsets), axis=1)
+
+    if has_arm:
+        upper_arm = smoothed['shoulder'] - smoothed['elbow']
+        forearm = smoothed['wrist'] - smoothed['elbow']
+        kinematics['elbow_flexion'] = 180 - get_angle(upper_arm, forearm)
+        kinematics['elbow_extension_velocity'] = -get_derivative(kinematics['elbow_flexion'], batch.times, batch.offsets)
+        # the plane is as steep as its normal is far from vertical
+        normals = np.cross(upper_arm, forearm)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kinematics['arm_plane'] = np.degrees(np.arccos(np.clip(np.abs(normals[:, 2]) / np.linalg.norm(normals, axis=1), 0, 1)))
+        arm = smoothed['wrist'] - smoothed['shoulder']
+        kinematics['arm_slot'] = np.degrees(np.arctan2(arm[:, 2], np.abs(arm[:, 0])))
+    return kinematics
+
+def get_segment_peaks(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Helper function to get the largest value of each pitch, ignoring NaN. Pitches without a value get NaN."""
+    peaks = np.full(offsets.shape[0] - 1, np.nan)
+    non_empty = np.diff(offsets) > 0
+    if non_empty.any():
+        with np.errstate(invalid='ignore'):
+            peaks[non_empty] = np.fmax.reduceat(values, offsets[:-1][non_empty])
+    return peaks
+
+def get_kinematic_features(batch: PitchBatch, joints: list=JOINTS_OF_INTEREST, window: int=DEFAULT_WINDOW,
+                           polyorder: int=DEFAULT_POLYORDER) -> pd.DataFrame:
+    """Function to get a feature row per pitch from the kinematic signals of a segmented batch (see `get_kinematics`): the peak
+    of every signal over the pitch (`{signal}_peak`) and its value at the start, 25/50/75 percentile and release checkpoints
+    (`{signal}_{checkpoint}`, like the joint location features).
+
+    Args:
+        batch (PitchBatch): segmented batch
+        joints (list, optional): joints to get the speed and acceleration for. Defaults to JOINTS_OF_INTEREST.
+        window (int, optional): smoothing window in frames. Defaults to DEFAULT_WINDOW.
+        polyorder (int, optional): smoothing polynomial degree. Defaults to DEFAULT_POLYORDER.
+
+    Raises:
+        Exception: the batch hasn't been segmented
+
+    Returns:
+        pd.DataFrame: kinematic features with an `astros_pitch_id` column, in batch order
+    """
+    if batch.checkpoints is None:
+        raise Exception("Kinematic features need a segmented batch, call segment first.")
+    with stage('kinematics', rows_in=batch.n_frames) as record:
+        kinematics = get_kinematics(batch, joints, window, polyorder)
+        features = {}
+        for signal, values in kinematics.items():
+            features[f"{signal}_peak"] = get_segment_peaks(values, batch.offsets)
+            for col in feat.CHECKPOINT_COLS:
+                positions = batch.checkpoints[col]
+                found = positions >= 0
+                features[f"{signal}_{col}"] = np.full(len(batch), np.nan)
+                features[f"{signal}_{col}"][found] = values[batch.offsets[:-1][found] + positions[found]]
+
+        kinematic_features = pd.DataFrame(features)
+        kinematic_features['astros_pitch_id'] = batch.pitch_ids.astype(np.int64)
+        record['rows_out'] = kinematic_features.shape[0]
+    return kinematic_features
+
+def add_kinematic_features(features_df: pd.DataFrame, batch: PitchBatch, joints: list=JOINTS_OF_INTEREST, window: int=DEFAULT_WINDOW,
+                           polyorder: int=DEFAULT_POLYORDER) -> pd.DataFrame:
+    """Function to add the kinematic features of a segmented batch (see `get_kinematic_features`) to a pitch features dataframe
+    like the one `feat.generate_features` or `PitchBatch.generate_features` returns. The kinematic columns go before the id
+    columns so the ids stay last.
+
+    Args:
+        features_df (pd.DataFrame): pitch feature dataframe with an `astros_pitch_id` column
+        batch (PitchBatch): segmented batch with the same pitches
+        joints (list, optional): joints to get the speed and acceleration for. Defaults to JOINTS_OF_INTEREST.
+        window (int, optional): smoothing window in frames. Defaults to DEFAULT_WINDOW.
+        polyorder (int, optional): smoothing polynomial degree. Defaults to DEFAULT_POLYORDER.
+
+    Returns:
+        pd.DataFrame: features with the kinematic columns, in the order of features_df
+    """
+    kinematic_features = get_kinematic_features(batch, joints, window, polyorder).set_index('astros_pitch_id')
+    kinematic_features = kinematic_features.reindex(features_df['astros_pitch_id'].to_numpy())
+    id_cols = [col for col in ['pitcher_id', 'sched_id', 'astros_pitch_id'] if col in features_df.columns]
+    feature_cols = [col for col in features_df.columns if col not in id_cols]
+    return pd.concat([features_df[feature_cols].reset_index(drop=True), kinematic_features.reset_index(drop=True),
+                      features_df[id_cols].reset_index(drop=True)], axis=1).set_axis(features_df.index, axis=0)
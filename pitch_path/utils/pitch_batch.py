@@ -0,0 +1,327 @@
+import logging
+import numpy as np
+import pandas as pd
+import pitch_path.utils.features as feat
+import pitch_path.utils.preprocessing as pp
+from pitch_path.utils.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# generic joint slots, the throwing arm joints and the knee watched for the leg lift whichever side they are on
+BATCH_JOINTS = ['shoulder', 'elbow', 'wrist', 'knee']
+JOINTS_OF_INTEREST = ['wrist', 'elbow', 'shoulder']
+METADATA_COLS = ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time']
+FLAG_DTYPES = {'start': np.float64, 'release': np.int64, 'time_25': np.int64, 'time_5': np.int64, 'time_75': np.int64}
+# lean mode dtypes, see `PitchBatch.to_frame`
+LEAN_COORD_DTYPE = np.float32
+LEAN_ID_DTYPES = {'astros_pitch_id': np.int64, 'sched_id': np.int32, 'pitcher_id': np.int32}
+LEAN_FLAG_DTYPE = np.int8
+HANDEDNESS_DTYPE = pd.CategoricalDtype(['L', 'R'])
+
+
+def get_handed_joints(throws: str, front_leg: str='l') -> list:
+    """Helper function to get the hawkeye joint that goes in each `BATCH_JOINTS` slot for a pitcher.
+
+    Args:
+        throws (str): throwing hand, R or L
+        front_leg (str, optional): side of the knee used for the leg lift. Defaults to 'l', like `PitcherDataProcessor`.
+
+    Returns:
+        list: hawkeye joint names in `BATCH_JOINTS` order
+    """
+    handedness = throws.lower()
+    return [f"{handedness}Shoulder", f"{handedness}Elbow", f"{handedness}Wrist", f"{front_leg}Knee"]
+
+def get_coord_dtype(lean: bool=False):
+    """Helper function to get the coordinate dtype for the default or lean mode."""
+    return LEAN_COORD_DTYPE if lean else np.float64
+
+def repeat_handedness(values: np.ndarray, lengths: np.ndarray) -> pd.Categorical:
+    """Helper function to repeat per pitch handedness values for every frame as a categorical, so each frame costs a one byte
+    code instead of a string.
+
+    Args:
+        values (np.ndarray): handedness of every pitch, L or R
+        lengths (np.ndarray): frames in every pitch
+
+    Raises:
+        Exception: a value that isn't one of the `HANDEDNESS_DTYPE` categories
+
+    Returns:
+        pd.Categorical: handedness of every frame
+    """
+    pitch_values = pd.Categorical(values, dtype=HANDEDNESS_DTYPE)
+    unknown = pitch_values.isna() & pd.notna(np.asarray(values, dtype=object))
+    if unknown.any():
+        raise Exception(f"Unknown handedness {sorted(set(np.asarray(values, dtype=object)[unknown]))}, expected one of "
+                        f"{list(HANDEDNESS_DTYPE.categories)}.")
+    return pd.Categorical.from_codes(np.repeat(pitch_values.codes, lengths), dtype=HANDEDNESS_DTYPE)
+
+
+class PitchBatch:
+    """Class used to hold the frames of many pitches as contiguous arrays instead of a wide dataframe. Coordinates are a
+    (frames, joints, 3) array with the frames of each pitch together and in time order, pitch i is the frames
+    offsets[i]:offsets[i + 1], and the per pitch metadata are arrays with one value per pitch. Joints are generic slots
+    (`joints`, looked up with `joint_index`), so handedness is handled once when the raw joints are put in their slots instead of
+    renaming columns. Segmenting and features work on the arrays and views of them, dataframes are only built at the edges with
+    `from_frame` and `to_frame`.
+
+    After `segment`, `checkpoints` holds the position of the start, 25/50/75 percentile and release frame within each pitch.
+
+    Lean mode (float32 coordinates from `from_raw_frame(dtype=LEAN_COORD_DTYPE)`, `to_frame(lean=True)`) halves the coordinates
+    and shrinks the frame metadata. Times stay float64 so release is found exactly as before, and distances are calculated in
+    float64 from the float32 coordinates, so the only error in the features is the rounding of the coordinates to float32 (a
+    relative error of at most 2**-24, about 6e-8):
+
+    - segmentation is the same, unless two consecutive leg lift joint z values differ by less than float32 resolution
+    - the joint locations at the checkpoints are within a relative 2**-24 of the float64 features
+    - `distance_traveled_{joint}` is within 2**-23 * sqrt(3) * frames * max(|coordinate|) of the float64 feature, in practice the
+      rounding errors mostly cancel and the difference is below 1e-4 feet
+    """
+    __slots__ = ['coords', 'times', 'offsets', 'pitch_ids', 'pitcher_ids', 'sched_ids', 'bats', 'throws', 'joints', 'joint_index',
+                 'checkpoints']
+
+    def __init__(self, coords: np.ndarray, times: np.ndarray, offsets: np.ndarray, pitch_ids: np.ndarray, pitcher_ids: np.ndarray,
+                 sched_ids: np.ndarray, bats: np.ndarray, throws: np.ndarray, joints: list=BATCH_JOINTS, checkpoints: dict=None) -> None:
+        if coords.ndim != 3 or coords.shape[1:] != (len(joints), 3):
+            raise Exception(f"Expected coordinates with shape (frames, {len(joints)}, 3), got {coords.shape}.")
+        if offsets[-1] != coords.shape[0] or times.shape[0] != coords.shape[0]:
+            raise Exception(f"Offsets and times don't cover the {coords.shape[0]} frames.")
+        self.coords = coords
+        self.times = times
+        self.offsets = offsets
+        self.pitch_ids = pitch_ids
+        self.pitcher_ids = pitcher_ids
+        self.sched_ids = sched_ids
+        self.bats = bats
+        self.throws = throws
+        self.joints = list(joints)
+        self.joint_index = {joint: i for i, joint in enumerate(self.joints)}
+        self.checkpoints = checkpoints
+
+    def __len__(self) -> int:
+        return self.pitch_ids.shape[0]
+
+    @property
+    def n_frames(self) -> int:
+        return self.coords.shape[0]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Pitch number of every frame."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def get_joint(self, joint: str) -> np.ndarray:
+        """Get a (frames, 3) view of a joint's coordinates."""
+        return self.coords[:, self.joint_index[joint]]
+
+    def get_pitch(self, i: int) -> tuple:
+        """Get views of the times and (frames, joints, 3) coordinates of pitch i."""
+        frames = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        return self.times[frames], self.coords[frames]
+
+    @classmethod
+    def from_raw_frame(cls, df: pd.DataFrame, joint_ids: list, joints: list=BATCH_JOINTS, dtype=np.float64,
+                       on_duplicate: str='raise') -> "PitchBatch":
+        """Build a batch from the raw long format data (one row per joint per frame), see `pp.scatter_joints_to_frames`.
+
+        Args:
+            df (pd.DataFrame): raw pitch dataframe
+            joint_ids (list): joint_type_id that goes in each joint slot, e.g. the ids of `get_handed_joints`
+            joints (list, optional): joint slot names. Defaults to BATCH_JOINTS.
+            dtype (optional): dtype of the coordinates, LEAN_COORD_DTYPE for the lean mode. Defaults to np.float64.
+            on_duplicate (str, optional): what to do with duplicate joint frames, see `pp.scatter_joints_to_frames`. Defaults to 'raise'.
+
+        Returns:
+            PitchBatch: every frame of every pitch, in pitch id and time order
+        """
+        joint_df, first_rows, coords = pp.scatter_joints_to_frames(df, joint_ids, dtype, on_duplicate)
+        frame_df = joint_df.iloc[first_rows]
+        codes, _ = pd.factorize(frame_df['astros_pitch_id'], sort=True)
+        offsets = pp.get_pitch_offsets(codes)
+        return cls(coords, frame_df['time'].to_numpy(dtype=np.float64), offsets, *cls.get_pitch_metadata(frame_df, offsets[:-1]),
+                   joints=joints)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, joints: list=BATCH_JOINTS, dtype=np.float64) -> "PitchBatch":
+        """Build a batch from a wide or processed pitcher dataframe with `{joint}_{axis}` columns for every joint, e.g. the output
+        of `PitcherDataProcessor.get_pitcher_df`. If the dataframe has all of the start, percentile and release flag columns their
+        positions are kept as the checkpoints.
+
+        Args:
+            df (pd.DataFrame): pitcher dataframe
+            joints (list, optional): joint column prefixes, in slot order. Defaults to BATCH_JOINTS.
+            dtype (optional): dtype of the coordinates. Defaults to np.float64.
+
+        Returns:
+            PitchBatch: batch with the pitches in order of first appearance and the frames of each pitch in time order
+        """
+        codes, _ = pd.factorize(df['astros_pitch_id'], sort=False)
+        order = pp.get_pitch_order(codes, df['time'].to_numpy(dtype=np.float64))
+        offsets = pp.get_pitch_offsets(codes[order])
+        coord_cols = [f"{joint}_{axis}" for joint in joints for axis in feat.AXES]
+        coords = df[coord_cols].to_numpy(dtype=dtype)[order].reshape(order.shape[0], len(joints), 3)
+
+        checkpoints = None
+        if all(col in df.columns for col in FLAG_DTYPES):
+            sorted_codes = codes[order]
+            checkpoints = {}
+            for col in feat.CHECKPOINT_COLS:
+                positions = feat.get_checkpoint_positions(df[col].to_numpy()[order], sorted_codes, offsets.shape[0] - 1)
+                checkpoints[col] = np.where(positions >= 0, positions - offsets[:-1], -1)
+        frame_df = df.iloc[order[offsets[:-1]]]
+        return cls(coords, df['time'].to_numpy(dtype=np.float64)[order], offsets, *cls.get_pitch_metadata(frame_df),
+                   joints=joints, checkpoints=checkpoints)
+
+    @staticmethod
+    def get_pitch_metadata(df: pd.DataFrame, rows: np.ndarray=None) -> tuple:
+        """Helper function to get the (pitch_ids, pitcher_ids, sched_ids, bats, throws) arrays from the rows of a dataframe with
+        one row per pitch, or the given rows."""
+        df = df if rows is None else df.iloc[rows]
+        return tuple(df[col].to_numpy() for col in ['astros_pitch_id', 'pitcher_id', 'sched_id', 'bats', 'throws'])
+
+    def to_frame(self, lean: bool=False) -> pd.DataFrame:
+        """Convert the batch back to the wide pitcher dataframe schema, with the `{joint}_{axis}` columns in slot order and the
+        flag columns if the batch has checkpoints, i.e. the schema `PitcherDataProcessor.get_pitcher_df` returns for a segmented
+        batch.
+
+        Args:
+            lean (bool, optional): use the lean dtypes, float32 coordinates, `LEAN_ID_DTYPES` ids, categorical bats and throws
+                and int8 flags, instead of float64 coordinates, int64 ids, strings and int64/float64 flags. The columns and values
+                are the same, up to the coordinate rounding. Defaults to False.
+
+        Returns:
+            pd.DataFrame: pitcher dataframe
+        """
+        lengths = self.lengths
+        if lean:
+            df = pd.DataFrame({col: np.repeat(ids.astype(LEAN_ID_DTYPES[col]), lengths)
+                               for col, ids in [('astros_pitch_id', self.pitch_ids), ('sched_id', self.sched_ids), ('pitcher_id', self.pitcher_ids)]})
+            df['bats'] = repeat_handedness(self.bats, lengths)
+            df['throws'] = repeat_handedness(self.throws, lengths)
+        else:
+            df = pd.DataFrame({
+                'astros_pitch_id': np.repeat(self.pitch_ids, lengths),
+                'sched_id': np.repeat(self.sched_ids, lengths),
+                'pitcher_id': np.repeat(self.pitcher_ids, lengths),
+                'bats': np.repeat(self.bats, lengths),
+                'throws': np.repeat(self.throws, lengths),
+            })
+        df['time'] = self.times
+        coord_cols = [f"{joint}_{axis}" for joint in self.joints for axis in feat.AXES]
+        coords = self.coords.reshape(self.n_frames, -1).astype(get_coord_dtype(lean))
+        df = pd.concat([df, pd.DataFrame(coords, columns=coord_cols)], axis=1)
+        if self.checkpoints is not None:
+            local_positions = np.arange(self.n_frames) - np.repeat(self.offsets[:-1], lengths)
+            for col, dtype in FLAG_DTYPES.items():
+                df[col] = (local_positions == np.repeat(self.checkpoints[col], lengths)).astype(LEAN_FLAG_DTYPE if lean else dtype)
+        return df
+
+    def segment(self, leg_lift_joint: str='knee', window: int=30) -> "PitchBatch":
+        """Array version of `pp.set_leg_lift_time`, `pp.set_release_point` and `pp.filter_df_to_start_release`. Finds the leg lift start (the first frame the leg lift joint's z has risen for
+        `window` frames in a row) and release (the first frame closest to time 0) of every pitch and keeps the frames between them,
+        with the percentile checkpoints at int(percentile * frames). Pitches without a leg lift before release are dropped and
+        missing values are filled with 0, like the legacy stages.
+
+        Args:
+            leg_lift_joint (str, optional): joint to watch for the leg lift. Defaults to 'knee'.
+            window (int, optional): frames the joint has to rise for. Defaults to 30.
+
+        Returns:
+            PitchBatch: segmented batch with checkpoints
+        """
+        logger.info("Segmenting pitches to start and release times....")
+        with stage('leg_lift', rows_in=self.n_frames) as record:
+            starts = pp.get_leg_lift_positions(self.get_joint(leg_lift_joint)[:, 2], self.offsets, window)
+            record['rows_out'] = starts.shape[0]
+
+        with stage('release', rows_in=self.n_frames) as record:
+            releases = pp.get_release_positions(self.times, self.offsets)
+            record['rows_out'] = releases.shape[0]
+
+        with stage('filter', rows_in=self.n_frames) as record:
+            valid = (starts >= 0) & (releases >= 0) & (starts <= releases)
+            if not valid.all():
+                logger.warning(f"Dropping {(~valid).sum()} pitches without a leg lift before release.")
+            rows, _, _ = pp.get_segment_rows(starts[valid], releases[valid])
+            lengths = releases[valid] - starts[valid] + 1
+            offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+            coords = self.coords[rows]
+            coords[np.isnan(coords)] = 0
+            times = self.times[rows]
+            times[np.isnan(times)] = 0
+            checkpoints = {'start': np.zeros_like(lengths), 'release': lengths - 1}
+            for col, percentile in pp.PERCENTILE_COLS.items():
+                checkpoints[col] = (percentile * lengths).astype(np.int64)
+            ids = [ids[valid].astype(np.int64) for ids in [self.pitch_ids, self.pitcher_ids, self.sched_ids]]
+            segmented = PitchBatch(coords, times, offsets, *ids, self.bats[valid], self.throws[valid], self.joints, checkpoints)
+            record['rows_out'] = segmented.n_frames
+        return segmented
+
+    def get_frame_distances(self, joints: list=None) -> np.ndarray:
+        """Array version of `feat.get_frame_distances` for several joints. The distance from each frame to the previous frame of
+        the same pitch, 0 for the first frame of a pitch or when the previous location is missing.
+
+        Args:
+            joints (list, optional): joints to get distances for. Defaults to every joint.
+
+        Returns:
+            np.ndarray: (frames, joints) distances
+        """
+        joints = self.joints if joints is None else joints
+        distances = np.zeros((self.n_frames, len(joints)), dtype=np.float64)
+        if self.n_frames < 2:
+            return distances
+        pitch_starts = self.offsets[1:-1]
+        for i, joint in enumerate(joints):
+            # float32 coordinates are upcast one joint at a time, so only the coordinate rounding carries into the distances
+            coords = self.get_joint(joint).astype(np.float64, copy=False)
+            distances[1:, i] = np.linalg.norm(np.diff(coords, axis=0), axis=1)
+            distances[1:, i][np.isnan(coords[:-1, 0])] = 0
+            distances[pitch_starts, i] = 0
+        return distances
+
+    def generate_features(self, joints: list=JOINTS_OF_INTEREST) -> pd.DataFrame:
+        """Array version of `feat.generate_features` for a segmented batch, with the same columns in the same order.
+
+        Args:
+            joints (list, optional): joints to calculate features for. Defaults to JOINTS_OF_INTEREST.
+
+        Raises:
+            Exception: the batch hasn't been segmented
+
+        Returns:
+            pd.DataFrame: pitch feature dataframe that contains a feature row for all pitches
+        """
+        if self.checkpoints is None:
+            raise Exception("Features need a segmented batch, call segment first.")
+        with stage('features', rows_in=self.n_frames) as record:
+            distances = self.get_frame_distances(joints)
+            codes = self.codes
+            checkpoint_coords = {}
+            for col in feat.CHECKPOINT_COLS:
+                positions = self.checkpoints[col]
+                found = positions >= 0
+                checkpoint_coords[col] = np.full((len(self), len(self.joints), 3), np.nan)
+                checkpoint_coords[col][found] = self.coords[self.offsets[:-1][found] + positions[found]]
+
+            features = {}
+            for d, j in enumerate(joints):
+                i = self.joint_index[j]
+                features[f"distance_traveled_{j}"] = np.bincount(codes, weights=distances[:, d], minlength=len(self))
+                for col in feat.CHECKPOINT_COLS:
+                    for a, axis in enumerate(feat.AXES):
+                        features[f"{j}_{axis}_{col}"] = checkpoint_coords[col][:, i, a]
+
+            pitch_features = pd.DataFrame(features)
+            # ids from a lean processed dataframe are int32, the features always have int64 ids
+            pitch_features['pitcher_id'] = self.pitcher_ids.astype(np.int64)
+            pitch_features['sched_id'] = self.sched_ids.astype(np.int64)
+            pitch_features['astros_pitch_id'] = self.pitch_ids.astype(np.int64)
+            record['rows_out'] = pitch_features.shape[0]
+        return pitch_features
@@ -1,8 +1,16 @@
-import matplotlib as plt
+import numpy as np
 import pandas as pd
+from pitch_path.utils.pitch_batch import PitchBatch
+from pitch_path.utils.similarity import resample_trajectories
+
+# points drawn per pitch, whatever the frame rate
+DEFAULT_MAX_POINTS = 50
+ARM_JOINTS = ['shoulder', 'elbow', 'wrist']
 
 
 def plot_pitch(pitch_df):
+    # matplotlib is imported on first use, importing the package shouldn't load a plotting backend
+    import matplotlib.pyplot as plt
     fig = plt.figure(figsize=(12, 9))
     ax = fig.add_subplot(projection='3d')
 
@@ -26,4 +34,100 @@ def plot_pitch(pitch_df):
         ax.set_zlabel('z-axis') 
 
     ax.legend(bbox_to_anchor=(1, 0.5), loc='center left', frameon=False)
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+def decimate_trajectories(batch: PitchBatch, max_points: int=DEFAULT_MAX_POINTS, joints: list=ARM_JOINTS) -> np.ndarray:
+    """Function to reduce every pitch's arm path to a bounded number of points for plotting, so the time to draw a pitch doesn't
+    depend on the frame rate it was recorded at. Each pitch is resampled to `max_points` evenly spaced points from start to
+    release (see `similarity.resample_trajectories`), which keeps the first and release frames exactly.
+
+    Args:
+        batch (PitchBatch): segmented batch
+        max_points (int, optional): points per pitch. Defaults to DEFAULT_MAX_POINTS.
+        joints (list, optional): joints to keep, in plotting order. Defaults to ARM_JOINTS.
+
+    Returns:
+        np.ndarray: (pitches, max_points, joints, 3) trajectories
+    """
+    coords = batch.coords[:, [batch.joint_index[joint] for joint in joints]].reshape(batch.n_frames, -1)
+    trajectories = resample_trajectories(coords.astype(np.float64, copy=False), batch.offsets, max_points)
+    return trajectories.reshape(len(batch), max_points, len(joints), 3)
+
+def join_paths(paths: np.ndarray) -> np.ndarray:
+    """Helper function to join (paths, points, dims) paths into one (paths * (points + 1), dims) array with a NaN row after
+    each path, so every path can be drawn with a single `plot` call instead of one artist per path."""
+    gaps = np.full((paths.shape[0], 1, paths.shape[2]), np.nan)
+    return np.concatenate([paths, gaps], axis=1).reshape(-1, paths.shape[2])
+
+def plot_arm_paths(trajectories: np.ndarray, title: str, joints: list=ARM_JOINTS):
+    """Function to draw the arm paths and release points of many pitches on one headless figure: the 3d path of every joint
+    from start to release with the arm at release, next to the (x, z) wrist and elbow release points like
+    `img/single_pitch_each_game_release.png`. Each joint is a single line artist however many pitches there are.
+
+    Args:
+        trajectories (np.ndarray): (pitches, points, joints, 3) trajectories from `decimate_trajectories`
+        title (str): figure title
+        joints (list, optional): joints in the trajectories. Defaults to ARM_JOINTS.
+
+    Returns:
+        matplotlib.figure.Figure: figure with an Agg canvas
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(16, 7))
+    FigureCanvasAgg(fig)
+    ax_3d = fig.add_subplot(1, 2, 1, projection='3d')
+    ax_release = fig.add_subplot(1, 2, 2)
+    release = trajectories[:, -1]
+
+    for j, joint in enumerate(joints):
+        path = join_paths(trajectories[:, :, j])
+        ax_3d.plot(path[:, 0], path[:, 1], path[:, 2], color=f"C{j}", linewidth=0.8, alpha=0.4, label=joint)
+        ax_3d.scatter(release[:, j, 0], release[:, j, 1], release[:, j, 2], color=f"C{j}", s=20, edgecolors="black")
+    # the arm at release, joint to joint
+    arm = join_paths(release)
+    ax_3d.plot(arm[:, 0], arm[:, 1], arm[:, 2], color="black", linestyle='dashed', linewidth=0.8)
+    ax_3d.set_xlabel('x-axis')
+    ax_3d.set_ylabel('y-axis')
+    ax_3d.set_zlabel('z-axis')
+    ax_3d.legend(loc='upper left', frameon=False)
+
+    release_joints = [j for j, joint in enumerate(joints) if joint in ['wrist', 'elbow']]
+    release_xz = join_paths(release[:, release_joints][:, :, [0, 2]])
+    ax_release.plot(release_xz[:, 0], release_xz[:, 1], color="grey", linestyle='dashed', linewidth=0.8)
+    for j in release_joints:
+        ax_release.scatter(release[:, j, 0], release[:, j, 2], color=f"C{j}", s=30, alpha=0.5, label=joints[j])
+    ax_release.set_xlabel('x-axis')
+    ax_release.set_ylabel('z-axis')
+    ax_release.set_title("(X,Z) Release point")
+    ax_release.legend(frameon=False)
+
+    fig.suptitle(f"{title} ({trajectories.shape[0]} pitches)")
+    return fig
+
+def plot_cluster_centers(centroids_df: pd.DataFrame):
+    """Function to draw the (x, z) wrist and elbow release points of the cluster centers on one headless figure, like
+    `img/cluster_center_release_point_*.png`.
+
+    Args:
+        centroids_df (pd.DataFrame): cluster centers with a label column, see `PitchPathModel.get_centroids_df`
+
+    Returns:
+        matplotlib.figure.Figure: figure with an Agg canvas
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 7))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    for _, center in centroids_df.iterrows():
+        x = [center['wrist_x_release'], center['elbow_x_release']]
+        z = [center['wrist_z_release'], center['elbow_z_release']]
+        ax.plot(x, z, linestyle='dashed', marker='s', markersize=8, alpha=0.7, label=int(center['label']))
+    ax.set_xlabel('x-axis')
+    ax.set_ylabel('z-axis')
+    ax.legend(bbox_to_anchor=(1, 0.5), loc='center left', frameon=False, title="Cluster")
+    ax.set_title(f"(X,Z) Release point for {centroids_df.shape[0]} Cluster Centers")
+    return fig
@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
 import logging
+from pitch_path.utils.instrumentation import stage
 logger = logging.getLogger(__name__)
 
+PERCENTILE_COLS = {'time_25': 0.25, 'time_5': 0.5, 'time_75': 0.75}
+DUPLICATE_FRAME_OPTIONS = ['raise', 'first', 'last']
+
 def set_release_point(df: pd.DataFrame) -> pd.DataFrame:
     """
     Function to get set the release point feature flag of a dataframe for each pitch in a dataframe.
@@ -14,9 +19,11 @@ def set_release_point(df: pd.DataFrame) -> pd.DataFrame:
         pd.DataFrame: Dataframe with release column at index containing the release point
     """
     logger.info("Setting release point....")
-    min_index = df.groupby('astros_pitch_id', as_index=False).agg({'time': lambda x: x.abs().idxmin()})['time'].values
-    df['release'] = 0
-    df.loc[min_index, 'release'] = 1
+    with stage('release', rows_in=df.shape[0]) as record:
+        min_index = df.groupby('astros_pitch_id', as_index=False).agg({'time': lambda x: x.abs().idxmin()})['time'].values
+        df['release'] = 0
+        df.loc[min_index, 'release'] = 1
+        record['rows_out'] = df.shape[0]
     return df
 
 def get_leg_lift_time(df: pd.DataFrame, col:str = 'z', window:int = 30) -> pd.DataFrame:
@@ -48,16 +55,18 @@ def set_leg_lift_time(df: pd.DataFrame, leg_lift_col: str) -> pd.DataFrame:
         pd.DataFrame: _description_
     """
     logger.info("Setting leg lift time....")
-    astros_pitch_id = df.astros_pitch_id.unique()
-    leg_lift_time = []
-    for pitch_id in astros_pitch_id:
-        pitch_df = df[(df.astros_pitch_id == pitch_id)]
-        leg_lift_time.append(get_leg_lift_time(pitch_df, leg_lift_col))
-    
-    ll = pd.DataFrame({'astros_pitch_id': astros_pitch_id, 'time': leg_lift_time})
-    ll['start'] = 1
+    with stage('leg_lift', rows_in=df.shape[0]) as record:
+        astros_pitch_id = df.astros_pitch_id.unique()
+        leg_lift_time = []
+        for pitch_id in astros_pitch_id:
+            pitch_df = df[(df.astros_pitch_id == pitch_id)]
+            leg_lift_time.append(get_leg_lift_time(pitch_df, leg_lift_col))
+        
+        ll = pd.DataFrame({'astros_pitch_id': astros_pitch_id, 'time': leg_lift_time})
+        ll['start'] = 1
 
-    pitches_w_start = pd.merge(df, ll, how='left', on=['astros_pitch_id', 'time']).fillna(0)
+        pitches_w_start = pd.merge(df, ll, how='left', on=['astros_pitch_id', 'time']).fillna(0)
+        record['rows_out'] = pitches_w_start.shape[0]
 
     return pitches_w_start
 
@@ -72,18 +81,20 @@ def filter_df_to_start_release(df: pd.DataFrame) -> pd.DataFrame:
         pd.DataFrame: pitch dataframe that has been filtered to start and release.
     """
     logger.info("Filtering df to start and release times.")
-    filtered_dfs = []
-    for pitch in df.astros_pitch_id.unique():
-        pitch_no_df = df[(df['astros_pitch_id'] == pitch)]
-        pitch_start = pitch_no_df[pitch_no_df['start'] == 1].index[0]
-        pitch_release = pitch_no_df[pitch_no_df['release'] == 1].index[0]
-        pitch_df_fil = pitch_no_df.loc[pitch_start:pitch_release].reset_index().drop(columns=['index'])
-        pitch_df_with_percentiles = set_time_percentiles(pitch_df_fil)
-        filtered_dfs.append(pitch_df_with_percentiles)
-    full_filtered_df = pd.concat(filtered_dfs)
-    full_filtered_df['sched_id'] = full_filtered_df['sched_id'].astype(int)
-    full_filtered_df['astros_pitch_id'] = full_filtered_df['astros_pitch_id'].astype(int)
-    full_filtered_df['pitcher_id'] = full_filtered_df['pitcher_id'].astype(int)
+    with stage('filter', rows_in=df.shape[0]) as record:
+        filtered_dfs = []
+        for pitch in df.astros_pitch_id.unique():
+            pitch_no_df = df[(df['astros_pitch_id'] == pitch)]
+            pitch_start = pitch_no_df[pitch_no_df['start'] == 1].index[0]
+            pitch_release = pitch_no_df[pitch_no_df['release'] == 1].index[0]
+            pitch_df_fil = pitch_no_df.loc[pitch_start:pitch_release].reset_index().drop(columns=['index'])
+            pitch_df_with_percentiles = set_time_percentiles(pitch_df_fil)
+            filtered_dfs.append(pitch_df_with_percentiles)
+        full_filtered_df = pd.concat(filtered_dfs)
+        full_filtered_df['sched_id'] = full_filtered_df['sched_id'].astype(int)
+        full_filtered_df['astros_pitch_id'] = full_filtered_df['astros_pitch_id'].astype(int)
+        full_filtered_df['pitcher_id'] = full_filtered_df['pitcher_id'].astype(int)
+        record['rows_out'] = full_filtered_df.shape[0]
 
     return full_filtered_df
 
@@ -122,8 +133,10 @@ def rename_handedness_cols(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: pitch dataframe with columns renamed
     """
-    renamed_cols = [x.lower() if ((not x.startswith("l") and not x.startswith('r')) or x is 'release') else x[1:].lower() for x in df.columns]
-    df.columns = renamed_cols
+    with stage('rename', rows_in=df.shape[0]) as record:
+        renamed_cols = [x.lower() if ((not x.startswith("l") and not x.startswith('r')) or x is 'release') else x[1:].lower() for x in df.columns]
+        df.columns = renamed_cols
+        record['rows_out'] = df.shape[0]
     return df
 
 def add_shifted_columns(df: pd.DataFrame, cols_to_shift: list) -> pd.DataFrame:
@@ -140,4 +153,168 @@ def add_shifted_columns(df: pd.DataFrame, cols_to_shift: list) -> pd.DataFrame:
     for col in cols_to_shift:
         df[f"prev_{col}"] = df[col].shift(1)
 
-    return df
\ No newline at end of file
+    return df
+
+def get_pitch_order(codes: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Helper function to get the row order that sorts the data by (pitch, time). If the rows are already in that order
+    (e.g. straight out of the pivot) the sort is skipped.
+
+    Args:
+        codes (np.ndarray): pitch code for each frame
+        times (np.ndarray): time for each frame
+
+    Returns:
+        np.ndarray: row order sorted by pitch and then time
+    """
+    if codes.shape[0] < 2:
+        return np.arange(codes.shape[0])
+    code_diff = np.diff(codes)
+    if np.all((code_diff > 0) | ((code_diff == 0) & (np.diff(times) >= 0))):
+        return np.arange(codes.shape[0])
+    return np.lexsort((times, codes))
+
+def get_pitch_offsets(sorted_codes: np.ndarray) -> np.ndarray:
+    """Helper function to find the boundaries of each pitch in data that has been sorted by pitch. Pitch i is the rows
+    offsets[i]:offsets[i + 1].
+
+    Args:
+        sorted_codes (np.ndarray): pitch code for each frame, sorted
+
+    Returns:
+        np.ndarray: row offsets of each pitch, with the total row count appended
+    """
+    boundaries = np.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1
+    return np.concatenate([[0], boundaries, [sorted_codes.shape[0]]]).astype(np.int64)
+
+def get_leg_lift_positions(values: np.ndarray, offsets: np.ndarray, window: int = 30) -> np.ndarray:
+    """Array version of `get_leg_lift_time` for every pitch at once. Finds the first row of each pitch where the value has been
+    increasing for `window` rows in a row. Rows must be sorted by pitch and time.
+
+    Args:
+        values (np.ndarray): value to monitor for a monotonic increase, e.g. front knee z
+        offsets (np.ndarray): pitch offsets from `get_pitch_offsets`
+        window (int, optional): size of window rquired to be monotonically increasing. Defaults to 30.
+
+    Returns:
+        np.ndarray: row of the leg lift start for each pitch, -1 if the pitch never has a leg lift
+    """
+    n = values.shape[0]
+    increasing = np.zeros(n, dtype=bool)
+    increasing[1:] = np.diff(values) > 0
+    # the first row of a pitch has no previous row, which also resets the run length at each pitch boundary
+    increasing[offsets[:-1]] = False
+
+    rows = np.arange(n)
+    last_not_increasing = np.maximum.accumulate(np.where(increasing, -1, rows))
+    run_length = rows - last_not_increasing
+
+    candidates = np.where(run_length >= window, rows, n)
+    positions = np.minimum.reduceat(candidates, offsets[:-1])
+    positions[positions >= offsets[1:]] = -1
+    return positions
+
+def get_release_positions(times: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Array version of `set_release_point` for every pitch at once. Finds the first row of each pitch where the time is closest to 0.
+
+    Args:
+        times (np.ndarray): time for each frame
+        offsets (np.ndarray): pitch offsets from `get_pitch_offsets`
+
+    Returns:
+        np.ndarray: row of the release for each pitch, -1 if the pitch has no valid times
+    """
+    n = times.shape[0]
+    abs_times = np.abs(times)
+    min_abs_times = np.fmin.reduceat(abs_times, offsets[:-1])
+    candidates = np.where(abs_times == np.repeat(min_abs_times, np.diff(offsets)), np.arange(n), n)
+    positions = np.minimum.reduceat(candidates, offsets[:-1])
+    positions[positions >= offsets[1:]] = -1
+    return positions
+
+def get_segment_rows(starts: np.ndarray, releases: np.ndarray) -> tuple:
+    """Helper function to expand per pitch (start, release) rows into the rows that are kept, plus each kept row's position
+    within its pitch segment.
+
+    Args:
+        starts (np.ndarray): start row of each pitch
+        releases (np.ndarray): release row of each pitch
+
+    Returns:
+        tuple: (rows to keep, position of each kept row within its segment, segment length of each kept row)
+    """
+    lengths = releases - starts + 1
+    segment_offsets = np.cumsum(lengths) - lengths
+    local_positions = np.arange(lengths.sum()) - np.repeat(segment_offsets, lengths)
+    rows = np.repeat(starts, lengths) + local_positions
+    return rows, local_positions, np.repeat(lengths, lengths)
+
+def scatter_joints_to_frames(df: pd.DataFrame, joint_ids: list, dtype=np.float64, on_duplicate: str = 'raise') -> tuple:
+    """Helper function to scatter the raw long format data (one row per joint per frame) into a dense (frames, joints, 3) array.
+    Rows are filtered to the joints we need first, then each (pitch, time) is mapped to a frame and each joint to a slot in the
+    order of `joint_ids`, so a handed joint like rWrist can be put in a generic wrist slot without renaming any columns. Nothing
+    is aggregated, so duplicate frames for the same joint are reported instead of being averaged together.
+
+    Args:
+        df (pd.DataFrame): raw pitch dataframe with a `joint_type_id` column and x, y, z columns
+        joint_ids (list): joint_type_ids to keep, in slot order
+        dtype (optional): dtype of the coordinates. Defaults to np.float64.
+        on_duplicate (str, optional): what to do when a joint has more than one row for the same frame. `raise` raises an
+            exception, `first` and `last` log a warning and keep the first or last row. Defaults to 'raise'.
+
+    Raises:
+        Exception: invalid on_duplicate option, or duplicate frames when on_duplicate is `raise`
+
+    Returns:
+        tuple: (raw rows for the kept joints, row of `joint_df` for the first joint of every frame, (frames, joints, 3) coordinates
+        with NaN for joints missing from a frame). Frames are sorted by pitch and time.
+    """
+    if on_duplicate not in DUPLICATE_FRAME_OPTIONS:
+        raise Exception(f"on_duplicate must be one of {DUPLICATE_FRAME_OPTIONS}, got {on_duplicate}")
+
+    # the joint id -> slot mapping and (pitch, time) -> frame mapping are the join, the scatter is the pivot
+    with stage('join', rows_in=df.shape[0]) as record:
+        joint_ids = np.asarray(joint_ids, dtype=np.int64)
+        raw_joint_ids = df['joint_type_id'].to_numpy()
+        joint_df = df[np.isin(raw_joint_ids, joint_ids)]
+        raw_joint_ids = joint_df['joint_type_id'].to_numpy(dtype=np.int64)
+
+        # map each (pitch, time) to a frame
+        pitch_codes, _ = pd.factorize(joint_df['astros_pitch_id'], sort=True)
+        times = joint_df['time'].to_numpy(dtype=np.float64)
+        order = np.lexsort((times, pitch_codes))
+        sorted_codes = pitch_codes[order]
+        sorted_times = times[order]
+        new_frame = np.ones(order.shape[0], dtype=bool)
+        new_frame[1:] = (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_times[1:] != sorted_times[:-1])
+        frame_rows = np.cumsum(new_frame) - 1
+        n_frames = int(frame_rows[-1]) + 1 if frame_rows.shape[0] else 0
+
+        # map each joint to a slot
+        joint_lookup = np.full(joint_ids.max() + 1, -1, dtype=np.int64)
+        joint_lookup[joint_ids] = np.arange(joint_ids.shape[0])
+        joint_positions = joint_lookup[raw_joint_ids[order]]
+        cells = frame_rows * joint_ids.shape[0] + joint_positions
+
+        cell_counts = np.bincount(cells, minlength=n_frames * joint_ids.shape[0])
+        n_duplicates = int((cell_counts > 1).sum())
+        scatter = slice(None)
+        if n_duplicates > 0:
+            duplicate_cell = int(np.flatnonzero(cell_counts > 1)[0])
+            example = joint_df.iloc[order[np.flatnonzero(cells == duplicate_cell)[0]]]
+            msg = (f"Found {n_duplicates} duplicate joint frames, e.g. astros_pitch_id {example['astros_pitch_id']} "
+                   f"at time {example['time']} for joint_type_id {example['joint_type_id']}.")
+            if on_duplicate == 'raise':
+                raise Exception(msg)
+            logger.warning(f"{msg} Keeping the {on_duplicate} row.")
+            if on_duplicate == 'first':
+                # scatter in reverse so the first row is the last write
+                scatter = slice(None, None, -1)
+        record['rows_out'] = joint_df.shape[0]
+
+    with stage('pivot', rows_in=joint_df.shape[0]) as record:
+        values = np.full((n_frames, joint_ids.shape[0], 3), np.nan, dtype=dtype)
+        for i, axis in enumerate(['x', 'y', 'z']):
+            values[frame_rows[scatter], joint_positions[scatter], i] = joint_df[axis].to_numpy()[order[scatter]]
+        record['rows_out'] = n_frames
+
+    return joint_df, order[new_frame], values
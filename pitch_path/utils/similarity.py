@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from pitch_path.utils.cache import write_atomic
+import pitch_path.utils.preprocessing as pp
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+META_FILE = "meta.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+PITCHES_FILE = "pitches.npy"
+TREE_FILE = "tree.pkl"
+DEFAULT_N_POINTS = 32
+DEFAULT_BUFFER_SIZE = 1000
+JOINTS_OF_INTEREST = ['wrist', 'elbow', 'shoulder']
+PITCH_DTYPE = np.dtype([('astros_pitch_id', 'i8'), ('pitcher_id', 'i8'), ('sched_id', 'i8')])
+
+
+def get_trajectory_cols(joints: list=JOINTS_OF_INTEREST) -> list:
+    return [f"{joint}_{axis}" for joint in joints for axis in ['x', 'y', 'z']]
+
+def resample_trajectories(coords: np.ndarray, offsets: np.ndarray, n_points: int=DEFAULT_N_POINTS) -> np.ndarray:
+    """Function to resample every pitch's trajectory to the same number of frames, so pitches of different lengths can be compared
+    point by point. Each pitch is sampled at `n_points` evenly spaced positions from its first to its last frame, linearly
+    interpolating between frames, for all pitches at once.
+
+    Args:
+        coords (np.ndarray): (frames, columns) coordinates, grouped by pitch and in time order within each pitch
+        offsets (np.ndarray): pitch offsets from `pp.get_pitch_offsets`
+        n_points (int, optional): frames to resample each pitch to. Defaults to DEFAULT_N_POINTS.
+
+    Returns:
+        np.ndarray: (pitches, n_points, columns) resampled trajectories
+    """
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    positions = starts[:, None] + np.linspace(0, 1, n_points)[None, :] * (lengths[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    # the last frame of each pitch interpolates with itself instead of the next pitch's first frame
+    upper = np.minimum(lower + 1, (offsets[1:] - 1)[:, None])
+    weights = (positions - lower)[:, :, None]
+    return coords[lower] * (1 - weights) + coords[upper] * weights
+
+def get_pitch_embeddings(pitcher_df: pd.DataFrame, n_points: int=DEFAULT_N_POINTS, joints: list=JOINTS_OF_INTEREST) -> tuple:
+    """Function to get the arm path embedding of every pitch in a pitcher df (the output of `PitcherDataProcessor.get_pitcher_df`,
+    which only has the frames from the start of the leg lift to release). The embedding is the pitch's wrist, elbow and shoulder
+    trajectory resampled to `n_points` frames and flattened, so the euclidean distance between two embeddings compares the whole
+    arm path and not just the release point.
+
+    Args:
+        pitcher_df (pd.DataFrame): pitcher df with the generic joint columns
+        n_points (int, optional): frames to resample each pitch to. Defaults to DEFAULT_N_POINTS.
+        joints (list, optional): joints to include. Defaults to JOINTS_OF_INTEREST.
+
+    Returns:
+        tuple: (pitch ids structured array with astros_pitch_id, pitcher_id and sched_id, (pitches, n_points * joints * 3) embeddings)
+    """
+    codes, _ = pd.factorize(pitcher_df['astros_pitch_id'], sort=True)
+    row_order = pp.get_pitch_order(codes, pitcher_df['time'].to_numpy(dtype=np.float64))
+    offsets = pp.get_pitch_offsets(codes[row_order])
+    coords = pitcher_df[get_trajectory_cols(joints)].to_numpy(dtype=np.float64)[row_order]
+
+    pitches = np.zeros(offsets.shape[0] - 1, dtype=PITCH_DTYPE)
+    first_rows = row_order[offsets[:-1]]
+    for col in PITCH_DTYPE.names:
+        pitches[col] = pitcher_df[col].to_numpy()[first_rows]
+    embeddings = resample_trajectories(coords, offsets, n_points)
+    return pitches, embeddings.reshape(embeddings.shape[0], -1)
+
+
+class ArmPathIndex:
+    """Class used to find the pitches with the most similar arm paths. Pitch embeddings (see `get_pitch_embeddings`) are kept in a
+    ball tree for fast nearest neighbor queries. New pitches go into a buffer that is searched by brute force alongside the tree,
+    so adding a game doesn't rebuild the tree; the tree is only rebuilt once the buffer reaches `buffer_size` pitches.
+    """
+    def __init__(self, n_points: int=DEFAULT_N_POINTS, joints: list=JOINTS_OF_INTEREST, buffer_size: int=DEFAULT_BUFFER_SIZE,
+                 leaf_size: int=40) -> None:
+        self.n_points = n_points
+        self.joints = joints
+        self.buffer_size = buffer_size
+        self.leaf_size = leaf_size
+        self.n_features = n_points * len(joints) * 3
+
+        self.pitches = np.zeros(0, dtype=PITCH_DTYPE)
+        self.embeddings = np.zeros((0, self.n_features), dtype=np.float64)
+        self.tree = None
+        # pitches [0, n_indexed) are in the tree, the rest are in the buffer
+        self.n_indexed = 0
+        self.rows = {}
+
+    def __len__(self) -> int:
+        return self.pitches.shape[0]
+
+    def add_pitcher_df(self, pitcher_df: pd.DataFrame) -> int:
+        """Add every pitch in a pitcher df to the index, see `get_pitch_embeddings`.
+
+        Args:
+            pitcher_df (pd.DataFrame): pitcher df
+
+        Returns:
+            int: number of pitches added
+        """
+        pitches, embeddings = get_pitch_embeddings(pitcher_df, self.n_points, self.joints)
+        return self.add(pitches, embeddings)
+
+    def add(self, pitches: np.ndarray, embeddings: np.ndarray) -> int:
+        """Add pitches to the index. Pitches already in the index are skipped.
+
+        Args:
+            pitches (np.ndarray): pitch ids structured array
+            embeddings (np.ndarray): (pitches, features) embeddings
+
+        Raises:
+            Exception: embeddings don't match the index
+
+        Returns:
+            int: number of pitches added
+        """
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.n_features:
+            raise Exception(f"Expected embeddings with {self.n_features} features, got shape {embeddings.shape}.")
+        _, first = np.unique(pitches['astros_pitch_id'], return_index=True)
+        keep = np.sort(first)
+        keep = keep[[pitch_id not in self.rows for pitch_id in pitches['astros_pitch_id'][keep]]]
+        if keep.shape[0] < pitches.shape[0]:
+            logger.warning(f"Skipping {pitches.shape[0] - keep.shape[0]} pitches that are already in the index.")
+
+        n = len(self)
+        self.rows.update(zip(pitches['astros_pitch_id'][keep].tolist(), range(n, n + keep.shape[0])))
+        self.pitches = np.concatenate([self.pitches, pitches[keep].astype(PITCH_DTYPE)])
+        self.embeddings = np.concatenate([self.embeddings, embeddings[keep].astype(np.float64)])
+        if len(self) - self.n_indexed >= self.buffer_size:
+            self.rebuild()
+        return int(keep.shape[0])
+
+    def rebuild(self) -> None:
+        """Rebuild the tree with every pitch, emptying the buffer."""
+        from sklearn.neighbors import BallTree
+        logger.info(f"Building arm path index over {len(self)} pitches")
+        self.tree = BallTree(self.embeddings, leaf_size=self.leaf_size) if len(self) > 0 else None
+        self.n_indexed = len(self)
+
+    def query(self, embeddings: np.ndarray, k: int=10) -> tuple:
+        """Find the k pitches with the closest arm paths to each query embedding.
+
+        Args:
+            embeddings (np.ndarray): (queries, features) embeddings, or a single embedding
+            k (int, optional): number of neighbors. Defaults to 10.
+
+        Returns:
+            tuple: ((queries, k) distances, (queries, k) pitch ids structured array), closest first. With fewer than k pitches in
+            the index only that many are returned.
+        """
+        X = np.asarray(embeddings, dtype=np.float64).reshape(-1, self.n_features)
+        k = min(k, len(self))
+        distances, rows = np.zeros((X.shape[0], 0)), np.zeros((X.shape[0], 0), dtype=np.int64)
+        if self.tree is not None:
+            distances, rows = self.tree.query(X, k=min(k, self.n_indexed))
+        if self.n_indexed < len(self):
+            buffer = self.embeddings[self.n_indexed:]
+            buffer_distances = np.sqrt(np.maximum(((X[:, None, :] - buffer[None, :, :]) ** 2).sum(axis=2), 0))
+            distances = np.concatenate([distances, buffer_distances], axis=1)
+            rows = np.concatenate([rows, np.broadcast_to(np.arange(self.n_indexed, len(self)), buffer_distances.shape)], axis=1)
+            order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+            distances, rows = np.take_along_axis(distances, order, axis=1), np.take_along_axis(rows, order, axis=1)
+        return distances, self.pitches[rows]
+
+    def query_trajectory(self, coords: np.ndarray, k: int=10) -> tuple:
+        """Find the k pitches with the closest arm paths to an ad hoc trajectory, e.g. a pitch that isn't in the index.
+
+        Args:
+            coords (np.ndarray): (frames, joints * 3) start to release coordinates in `get_trajectory_cols` order
+            k (int, optional): number of neighbors. Defaults to 10.
+
+        Returns:
+            tuple: (k distances, k pitch ids structured array), closest first
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        embedding = resample_trajectories(coords, np.array([0, coords.shape[0]]), self.n_points).reshape(1, -1)
+        distances, pitches = self.query(embedding, k)
+        return distances[0], pitches[0]
+
+    def query_pitch(self, astros_pitch_id: int, k: int=10) -> tuple:
+        """Find the k pitches with the closest arm paths to a pitch in the index, not counting the pitch itself.
+
+        Args:
+            astros_pitch_id (int): pitch id
+            k (int, optional): number of neighbors. Defaults to 10.
+
+        Raises:
+            Exception: pitch isn't in the index
+
+        Returns:
+            tuple: (k distances, k pitch ids structured array), closest first
+        """
+        if astros_pitch_id not in self.rows:
+            raise Exception(f"astros_pitch_id {astros_pitch_id} is not in the arm path index.")
+        distances, pitches = self.query(self.embeddings[self.rows[astros_pitch_id]], k + 1)
+        keep = pitches[0]['astros_pitch_id'] != astros_pitch_id
+        return distances[0][keep][:k], pitches[0][keep][:k]
+
+    def save(self, index_dir: str) -> None:
+        """Save the index to a directory. The buffer is saved as is, so it is still searched by brute force when loaded.
+
+        Args:
+            index_dir (str): directory to write the index to
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for file_name, write in [(EMBEDDINGS_FILE, lambda f: np.save(f, self.embeddings)), (PITCHES_FILE, lambda f: np.save(f, self.pitches)),
+                                 (TREE_FILE, lambda f: pickle.dump(self.tree, f))]:
+            def write_file(path: str, write=write) -> None:
+                with open(path, 'wb') as f:
+                    write(f)
+            write_atomic(os.path.join(index_dir, file_name), write_file)
+
+        def write_meta(path: str) -> None:
+            with open(path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'n_points': self.n_points, 'joints': self.joints, 'buffer_size': self.buffer_size,
+                           'leaf_size': self.leaf_size, 'n_indexed': self.n_indexed, 'n_pitches': len(self)}, f)
+        write_atomic(os.path.join(index_dir, META_FILE), write_meta)
+        logger.info(f"Saved arm path index with {len(self)} pitches to {index_dir}")
+
+    @classmethod
+    def load(cls, index_dir: str) -> "ArmPathIndex":
+        """Load an index saved with `save`.
+
+        Args:
+            index_dir (str): index directory
+
+        Raises:
+            Exception: unsupported index version
+
+        Returns:
+            ArmPathIndex: the index
+        """
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            meta = json.load(f)
+        if meta['version'] != INDEX_VERSION:
+            raise Exception(f"Arm path index version {meta['version']} is not supported, expected {INDEX_VERSION}.")
+
+        index = cls(meta['n_points'], meta['joints'], meta['buffer_size'], meta['leaf_size'])
+        index.embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE))
+        index.pitches = np.load(os.path.join(index_dir, PITCHES_FILE))
+        with open(os.path.join(index_dir, TREE_FILE), 'rb') as f:
+            index.tree = pickle.load(f)
+        index.n_indexed = meta['n_indexed']
+        index.rows = dict(zip(index.pitches['astros_pitch_id'].tolist(), range(len(index))))
+        return index
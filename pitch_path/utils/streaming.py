@@ -0,0 +1,127 @@
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+logger = logging.getLogger(__name__)
+
+RAW_COLS = ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws', 'time', 'joint_type_id', 'x', 'y', 'z']
+DEFAULT_BATCH_SIZE = 65536
+# lean mode types, applied as the raw file is read so the default types are never materialized
+LEAN_RAW_TYPES = {'sched_id': pa.int32(), 'pitcher_id': pa.int32(), 'joint_type_id': pa.int32(), 'x': pa.float32(), 'y': pa.float32(),
+                  'z': pa.float32()}
+# repeated strings are read as categoricals
+LEAN_DICTIONARY_COLS = ['bats', 'throws']
+
+
+def read_raw_head(file_name: str, columns: list=None, n_rows: int=1) -> pd.DataFrame:
+    """Helper function to read the first rows of a raw pitcher file without reading the whole file, e.g. to get the pitcher
+    metadata before streaming the pitches.
+
+    Args:
+        file_name (str): raw pitcher feather file
+        columns (list, optional): columns to read. Defaults to the metadata columns.
+        n_rows (int, optional): number of rows to read. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: first rows of the file
+    """
+    columns = columns or ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws']
+    return ds.dataset(file_name, format='ipc').head(n_rows, columns=columns).to_pandas()
+
+def cast_to_lean(data):
+    """Helper function to cast a raw pyarrow table or record batch to the lean types, `LEAN_RAW_TYPES` and dictionary encoded
+    `LEAN_DICTIONARY_COLS`, before it is converted to pandas.
+
+    Args:
+        data (pa.Table | pa.RecordBatch): raw data
+
+    Returns:
+        pa.Table | pa.RecordBatch: data with the lean types
+    """
+    arrays = []
+    for name, array in zip(data.schema.names, data.columns):
+        if name in LEAN_RAW_TYPES:
+            array = pc.cast(array, LEAN_RAW_TYPES[name])
+        elif name in LEAN_DICTIONARY_COLS:
+            array = pc.dictionary_encode(array)
+        arrays.append(array)
+    return type(data).from_arrays(arrays, names=data.schema.names)
+
+def read_raw_file(file_name: str, joint_type_ids: list=None, columns: list=None, lean: bool=False) -> pd.DataFrame:
+    """Helper function to read a raw pitcher file with only the requested joints and columns decoded, instead of reading every
+    joint with `pd.read_feather` and filtering afterwards.
+
+    Args:
+        file_name (str): raw pitcher feather file
+        joint_type_ids (list, optional): joint_type_ids to keep. Defaults to all joints.
+        columns (list, optional): columns to read. Defaults to all raw columns.
+        lean (bool, optional): read the ids as int32, the coordinates as float32 and the handedness as categoricals, see
+            `cast_to_lean`. Defaults to False.
+
+    Returns:
+        pd.DataFrame: raw rows for the requested joints
+    """
+    columns = columns or RAW_COLS
+    row_filter = pc.field('joint_type_id').isin(joint_type_ids) if joint_type_ids is not None else None
+    table = ds.dataset(file_name, format='ipc').to_table(columns=columns, filter=row_filter)
+    if lean:
+        table = cast_to_lean(table)
+    return table.to_pandas()
+
+def iter_raw_pitches(file_name: str, joint_type_ids: list=None, columns: list=None, batch_size: int=DEFAULT_BATCH_SIZE,
+                     lean: bool=False):
+    """Generator to stream a raw pitcher feather (Arrow IPC) file one pitch at a time instead of reading the whole file into memory.
+    The file is read in record batches, only the requested columns are decoded and rows for other joints are filtered out as each
+    batch is read. Rows are buffered until every row of a pitch has been seen and then the pitch is yielded, so peak memory is
+    bounded by the largest pitch plus one batch, not the file size.
+
+    The rows of a pitch are expected to be contiguous in the file (true for the raw Hawk-Eye files, which are grouped by pitch), so
+    a pitch is complete as soon as rows for the next pitch are read.
+
+    Args:
+        file_name (str): raw pitcher feather file
+        joint_type_ids (list, optional): joint_type_ids to keep. Defaults to all joints.
+        columns (list, optional): columns to read. Defaults to all raw columns.
+        batch_size (int, optional): maximum rows per record batch. Defaults to DEFAULT_BATCH_SIZE.
+        lean (bool, optional): read each batch with the lean types, see `cast_to_lean`. Defaults to False.
+
+    Raises:
+        Exception: rows of a pitch that has already been yielded show up again
+
+    Yields:
+        pd.DataFrame: raw rows for a single pitch
+    """
+    columns = columns or RAW_COLS
+    row_filter = pc.field('joint_type_id').isin(joint_type_ids) if joint_type_ids is not None else None
+    # keep batches in file order, the threaded scanner is free to reorder them
+    batches = ds.dataset(file_name, format='ipc').to_batches(columns=columns, filter=row_filter, batch_size=batch_size, use_threads=False)
+
+    pending = {}
+    finished_pitches = set()
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        batch_df = (cast_to_lean(batch) if lean else batch).to_pandas()
+        batch_pitches = batch_df['astros_pitch_id'].unique()
+
+        seen_again = finished_pitches.intersection(batch_pitches)
+        if seen_again:
+            raise Exception(f"Rows for astros_pitch_id {sorted(seen_again)[:5]} are not contiguous in {file_name}, "
+                            "the file has to be grouped by pitch to be streamed.")
+
+        if len(batch_pitches) == 1:
+            pending.setdefault(batch_pitches[0], []).append(batch_df)
+        else:
+            for pitch_id, pitch_df in batch_df.groupby('astros_pitch_id', sort=False):
+                pending.setdefault(pitch_id, []).append(pitch_df)
+
+        # only the pitch at the end of the batch can continue into the next batch, everything else has been fully read
+        last_pitch = batch_df['astros_pitch_id'].iat[-1]
+        for pitch_id in [p for p in pending if p != last_pitch]:
+            finished_pitches.add(pitch_id)
+            yield pd.concat(pending.pop(pitch_id), ignore_index=True)
+
+    for pitch_id, pitch_dfs in pending.items():
+        yield pd.concat(pitch_dfs, ignore_index=True)
@@ -0,0 +1,159 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ARM_LENGTH = 2.2
+RUBBER_Y = 60.5
+STRIDE_LENGTH = 5.5
+NOISE = 0.001
+
+
+def smoothstep(t: np.ndarray, start, end) -> np.ndarray:
+    """Helper function for a smooth 0 -> 1 ramp between start and end."""
+    x = np.clip((t - start) / (end - start), 0, 1)
+    return x * x * (3 - 2 * x)
+
+def get_joint_offsets(joints_df: pd.DataFrame, arm: str, side: int) -> np.ndarray:
+    """Helper function to get a rough (x,y,z) offset of every joint from the pitcher's center of mass, in joint_type_id order.
+
+    Args:
+        joints_df (pd.DataFrame): joint ids dataframe
+        arm (str): throwing arm, l or r
+        side (int): sign of x on the throwing arm side
+
+    Returns:
+        np.ndarray: (joints, 3) offsets
+    """
+    heights = {'Ankle': -2.9, 'Heel': -3.0, 'BigToe': -3.0, 'SmallToe': -3.0, 'Knee': -1.6, 'Hip': 0.0, 'Shoulder': 1.6,
+               'Elbow': 0.7, 'Wrist': 0.0, 'Thumb': -0.2, 'Pinky': -0.3, 'Ear': 2.3, 'Eye': 2.4}
+    offsets = np.zeros((joints_df.shape[0], 3))
+    for i, name in enumerate(joints_df['hawkeye']):
+        if name in ('neck', 'nose', 'midHip'):
+            offsets[i, 2] = {'neck': 2.0, 'nose': 2.35, 'midHip': 0.0}[name]
+            continue
+        offsets[i, 0] = (side if name[0] == arm else -side) * (0.7 if name[1:] in ('Shoulder', 'Elbow', 'Wrist', 'Thumb', 'Pinky') else 0.35)
+        offsets[i, 2] = heights[name[1:]]
+    return offsets
+
+def generate_raw_pitcher_df(n_pitches: int=10, sched_id: int=1, pitcher_id: int=1, throws: str='R', fps: int=300,
+                            pre_release_seconds: float=2.0, post_release_seconds: float=0.5, first_pitch_id: int=None,
+                            seed: int=None) -> pd.DataFrame:
+    """Function to generate a synthetic raw pitcher file in the Hawk-Eye raw schema, one row per joint per frame, for benchmarks and
+    for checking the pipeline without the real data. Each pitch has a leg lift where the front knee rises smoothly and comes back
+    down at foot strike, a stride that carries the body towards the plate, and an arm circle that finishes with the wrist up and in
+    front of the shoulder at release (time 0). Timing, lift height and arm slot vary from pitch to pitch, and every coordinate gets
+    a little tracking noise.
+
+    Args:
+        n_pitches (int, optional): number of pitches. Defaults to 10.
+        sched_id (int, optional): schedule id. Defaults to 1.
+        pitcher_id (int, optional): pitcher id. Defaults to 1.
+        throws (str, optional): throwing hand, R or L. Defaults to 'R'.
+        fps (int, optional): frames per second. Defaults to 300.
+        pre_release_seconds (float, optional): seconds of frames before release. Defaults to 2.0.
+        post_release_seconds (float, optional): seconds of frames after release. Defaults to 0.5.
+        first_pitch_id (int, optional): astros_pitch_id of the first pitch. Defaults to sched_id * 100000 + pitcher_id % 1000 * 100.
+        seed (int, optional): random seed. Defaults to None.
+
+    Returns:
+        pd.DataFrame: raw pitcher dataframe sorted by pitch, time and joint
+    """
+    # imported here to avoid a circular import, data_processing imports the utils modules
+    from pitch_path.processing.data_processing import get_joints_df
+    joints_df = get_joints_df()
+
+    rng = np.random.default_rng(seed)
+    if first_pitch_id is None:
+        first_pitch_id = sched_id * 100000 + pitcher_id % 1000 * 100
+    throws = throws.upper()
+    side = -1 if throws == 'R' else 1
+    arm = 'r' if throws == 'R' else 'l'
+    front = 'l' if throws == 'R' else 'r'
+    back = arm
+
+    time = np.round(np.arange(-pre_release_seconds, post_release_seconds, 1 / fps), 6)
+    n_frames = time.shape[0]
+    t = time[None, :]
+
+    # per pitch timing and shape
+    lift_start = rng.uniform(-1.3, -0.95, (n_pitches, 1))
+    lift_peak = lift_start + rng.uniform(0.4, 0.5, (n_pitches, 1))
+    foot_strike = rng.uniform(-0.2, -0.12, (n_pitches, 1))
+    lift_height = rng.normal(1.2, 0.1, (n_pitches, 1))
+    arm_slot = rng.normal(np.radians(35), np.radians(8), (n_pitches, 1))
+    break_time = lift_peak - rng.uniform(0.05, 0.15, (n_pitches, 1))
+
+    # body moves towards the plate and drops during the stride
+    stride = smoothstep(t, lift_peak, foot_strike + 0.05)
+    center = np.stack(np.broadcast_arrays(np.zeros_like(t) + rng.normal(0, 0.1, (n_pitches, 1)),
+                                          RUBBER_Y - 0.3 - STRIDE_LENGTH * stride,
+                                          3.3 - 0.8 * stride), axis=-1)
+
+    offsets = get_joint_offsets(joints_df, arm, side)
+    coords = center[:, :, None, :] + offsets[None, None, :, :]
+
+    # front knee lift, the back knee rises less as it bends and drives towards the plate
+    lift = np.where(t < lift_peak, smoothstep(t, lift_start, lift_peak), 1 - smoothstep(t, lift_peak, foot_strike))
+    for leg, scale in [(front, 1.0), (back, 0.5)]:
+        knee = joints_df.index[joints_df.hawkeye == f"{leg}Knee"][0]
+        coords[:, :, knee, 2] += scale * lift_height * lift
+        coords[:, :, knee, 1] += scale * 0.8 * lift
+
+    # arm circle: down at the break, back, up and forward through release, then follow through
+    phase = np.clip((t - break_time) / (-break_time), 0, 1.3)
+    angle = -np.pi / 2 + 1.1 * np.pi * phase ** 2
+    up = np.concatenate([np.sin(arm_slot)[..., None] * side, np.zeros_like(arm_slot)[..., None], np.cos(arm_slot)[..., None]], axis=-1)
+    direction = np.cos(angle)[..., None] * np.array([0, 1, 0]) + np.sin(angle)[..., None] * up
+    shoulder = joints_df.index[joints_df.hawkeye == f"{arm}Shoulder"][0]
+    shoulder_coords = coords[:, :, shoulder, :]
+    for name, reach in [('Elbow', 0.5), ('Wrist', 1.0), ('Thumb', 1.08), ('Pinky', 1.1)]:
+        joint = joints_df.index[joints_df.hawkeye == f"{arm}{name}"][0]
+        coords[:, :, joint, :] = shoulder_coords + ARM_LENGTH * reach * direction
+
+    coords += rng.normal(0, NOISE, coords.shape)
+
+    n_joints = joints_df.shape[0]
+    pitch_ids = np.arange(first_pitch_id, first_pitch_id + n_pitches)
+    bats = rng.choice(['L', 'R'], n_pitches)
+    raw_df = pd.DataFrame({
+        'astros_pitch_id': np.repeat(pitch_ids, n_frames * n_joints),
+        'sched_id': np.int64(sched_id),
+        'pitcher_id': np.int64(pitcher_id),
+        'bats': np.repeat(bats, n_frames * n_joints).astype(object),
+        'throws': throws,
+        'time': np.tile(np.repeat(time, n_joints), n_pitches),
+        'joint_type_id': np.tile(joints_df['joint_type_id'].to_numpy(), n_pitches * n_frames),
+        'x': coords[..., 0].ravel(),
+        'y': coords[..., 1].ravel(),
+        'z': coords[..., 2].ravel(),
+    })
+    return raw_df
+
+def write_synthetic_raw_files(output_dir: str, n_files: int=6, n_pitches: int=100, seed: int=None, **kwargs) -> list:
+    """Function to write a directory of synthetic raw pitcher files, one per pitcher-game, like the raw input directory.
+
+    Args:
+        output_dir (str): directory to write the files to
+        n_files (int, optional): number of pitcher-game files. Defaults to 6.
+        n_pitches (int, optional): pitches per file. Defaults to 100.
+        seed (int, optional): random seed. Defaults to None.
+        **kwargs: passed to `generate_raw_pitcher_df`
+
+    Returns:
+        list: written file paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    file_paths = []
+    for i in range(n_files):
+        sched_id, pitcher_id = 1000 + i, 500000 + i
+        raw_df = generate_raw_pitcher_df(n_pitches, sched_id, pitcher_id, throws=rng.choice(['R', 'L'], p=[0.7, 0.3]),
+                                         seed=int(rng.integers(2 ** 31)), **kwargs)
+        file_path = os.path.join(output_dir, f"sched_id{sched_id}_pitcher{pitcher_id}.feather")
+        raw_df.to_feather(file_path)
+        file_paths.append(file_path)
+        logger.info(f"Wrote {file_path}")
+    return file_paths
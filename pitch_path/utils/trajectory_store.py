@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import pitch_path.utils.preprocessing as pp
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+COORDS_FILE = "coords.npy"
+TIME_FILE = "time.npy"
+PITCHES_FILE = "pitches.npy"
+PITCH_ORDER_FILE = "pitch_order.npy"
+SCHED_ORDER_FILE = "sched_order.npy"
+JOINT_COLS = [f"{joint}_{axis}" for joint in ['shoulder', 'elbow', 'wrist', 'knee'] for axis in ['x', 'y', 'z']]
+PITCH_INDEX_DTYPE = np.dtype([
+    ('astros_pitch_id', 'i8'), ('sched_id', 'i8'), ('pitcher_id', 'i8'), ('bats', 'U1'), ('throws', 'U1'),
+    ('offset', 'i8'), ('length', 'i8'), ('time_25', 'i8'), ('time_5', 'i8'), ('time_75', 'i8'),
+])
+
+
+def get_source_info(source) -> tuple:
+    """Helper function to get the (pitcher_id, sched_id, row count) of a processed pitcher file or dataframe without reading
+    the whole file.
+
+    Args:
+        source: processed pitcher file path or pitcher dataframe
+
+    Returns:
+        tuple: (pitcher_id, sched_id, row count)
+    """
+    if isinstance(source, pd.DataFrame):
+        return int(source['pitcher_id'].iat[0]), int(source['sched_id'].iat[0]), source.shape[0]
+    ids = feather.read_table(source, columns=['pitcher_id', 'sched_id'], memory_map=True)
+    return ids['pitcher_id'][0].as_py(), ids['sched_id'][0].as_py(), ids.num_rows
+
+def build_trajectory_store(sources: list, store_dir: str, dtype=np.float32) -> "TrajectoryStore":
+    """Function to pack processed pitcher files (the output of `PitcherDataProcessor.save_pitcher_df`) into a trajectory store.
+    The joint trajectories of every pitch are written into one contiguous memory mappable array, ordered by pitcher, game and pitch,
+    with an offset index and secondary indexes on astros_pitch_id and sched_id. Files are read one at a time and written straight
+    into the memory mapped arrays, so building the store doesn't need all of the pitches in memory.
+
+    Args:
+        sources (list): processed pitcher file paths and/or pitcher dataframes
+        store_dir (str): directory to write the store to
+        dtype (optional): dtype of the joint coordinates. Defaults to np.float32.
+
+    Returns:
+        TrajectoryStore: the store that was written
+    """
+    infos = [get_source_info(source) for source in sources]
+    order = sorted(range(len(sources)), key=lambda i: infos[i][:2])
+    n_frames = sum(info[2] for info in infos)
+    logger.info(f"Building trajectory store in {store_dir} from {len(sources)} pitcher files with {n_frames} frames")
+
+    os.makedirs(store_dir, exist_ok=True)
+    coords = np.lib.format.open_memmap(os.path.join(store_dir, COORDS_FILE), mode='w+', dtype=dtype, shape=(n_frames, len(JOINT_COLS)))
+    times = np.lib.format.open_memmap(os.path.join(store_dir, TIME_FILE), mode='w+', dtype=np.float64, shape=(n_frames,))
+
+    pitch_indexes = []
+    frame_offset = 0
+    for i in order:
+        df = sources[i] if isinstance(sources[i], pd.DataFrame) else pd.read_feather(sources[i])
+        codes, _ = pd.factorize(df['astros_pitch_id'], sort=True)
+        row_order = pp.get_pitch_order(codes, df['time'].to_numpy(dtype=np.float64))
+        df = df.iloc[row_order]
+        offsets = pp.get_pitch_offsets(codes[row_order])
+
+        coords[frame_offset:frame_offset + df.shape[0]] = df[JOINT_COLS].to_numpy(dtype=dtype)
+        times[frame_offset:frame_offset + df.shape[0]] = df['time'].to_numpy(dtype=np.float64)
+
+        pitch_index = np.zeros(offsets.shape[0] - 1, dtype=PITCH_INDEX_DTYPE)
+        first_rows = df.iloc[offsets[:-1]]
+        for col in ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws']:
+            pitch_index[col] = first_rows[col].to_numpy()
+        pitch_index['offset'] = offsets[:-1] + frame_offset
+        pitch_index['length'] = np.diff(offsets)
+        for col in pp.PERCENTILE_COLS:
+            # checkpoint positions are stored relative to the start of the pitch
+            flagged = np.flatnonzero(df[col].to_numpy() == 1)
+            pitch_index[col] = flagged[np.searchsorted(flagged, offsets[:-1])] - offsets[:-1]
+        pitch_indexes.append(pitch_index)
+        frame_offset += df.shape[0]
+
+    coords.flush()
+    times.flush()
+    pitches = np.concatenate(pitch_indexes) if pitch_indexes else np.zeros(0, dtype=PITCH_INDEX_DTYPE)
+    np.save(os.path.join(store_dir, PITCHES_FILE), pitches)
+    np.save(os.path.join(store_dir, PITCH_ORDER_FILE), np.argsort(pitches['astros_pitch_id'], kind='stable'))
+    np.save(os.path.join(store_dir, SCHED_ORDER_FILE), np.argsort(pitches['sched_id'], kind='stable'))
+    with open(os.path.join(store_dir, META_FILE), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'joint_cols': JOINT_COLS, 'dtype': np.dtype(dtype).name,
+                   'n_frames': n_frames, 'n_pitches': int(pitches.shape[0])}, f)
+
+    return TrajectoryStore(store_dir)
+
+
+class TrajectoryStore:
+    """Class used to read a trajectory store written by `build_trajectory_store`. The arrays are memory mapped, so opening a store
+    is cheap and reading a pitch, a pitcher-game, or a pitcher's whole season is a slice of the contiguous arrays instead of opening
+    and reading a processed file per pitcher-game.
+    """
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != STORE_VERSION:
+            raise Exception(f"Trajectory store version {self.meta['version']} is not supported, expected {STORE_VERSION}.")
+
+        self.joint_cols = self.meta['joint_cols']
+        self.coords = np.load(os.path.join(store_dir, COORDS_FILE), mmap_mode='r')
+        self.times = np.load(os.path.join(store_dir, TIME_FILE), mmap_mode='r')
+        self.pitches = np.load(os.path.join(store_dir, PITCHES_FILE))
+        self.pitch_order = np.load(os.path.join(store_dir, PITCH_ORDER_FILE))
+        self.sched_order = np.load(os.path.join(store_dir, SCHED_ORDER_FILE))
+
+    def __len__(self) -> int:
+        return self.pitches.shape[0]
+
+    def get_frame_slice(self, first_pitch: int, last_pitch: int) -> slice:
+        """Helper function to get the frame slice covering a contiguous range of pitch rows [first_pitch, last_pitch).
+
+        Args:
+            first_pitch (int): first pitch row
+            last_pitch (int): pitch row after the last pitch
+
+        Returns:
+            slice: frames for the pitches
+        """
+        if first_pitch >= last_pitch:
+            return slice(0, 0)
+        last = self.pitches[last_pitch - 1]
+        return slice(int(self.pitches['offset'][first_pitch]), int(last['offset'] + last['length']))
+
+    def get_pitch_row(self, astros_pitch_id: int) -> int:
+        """Get the pitch row for an astros_pitch_id.
+
+        Args:
+            astros_pitch_id (int): pitch id
+
+        Raises:
+            Exception: pitch isn't in the store
+
+        Returns:
+            int: pitch row
+        """
+        sorted_ids = self.pitches['astros_pitch_id'][self.pitch_order]
+        i = np.searchsorted(sorted_ids, astros_pitch_id)
+        if i >= sorted_ids.shape[0] or sorted_ids[i] != astros_pitch_id:
+            raise Exception(f"astros_pitch_id {astros_pitch_id} is not in the trajectory store.")
+        return int(self.pitch_order[i])
+
+    def get_pitch(self, astros_pitch_id: int) -> tuple:
+        """Get the trajectory of a single pitch. The arrays are views of the memory mapped store.
+
+        Args:
+            astros_pitch_id (int): pitch id
+
+        Returns:
+            tuple: (times, (frames, joint columns) coordinates)
+        """
+        row = self.get_pitch_row(astros_pitch_id)
+        frames = self.get_frame_slice(row, row + 1)
+        return self.times[frames], self.coords[frames]
+
+    def get_pitcher_rows(self, pitcher_id: int, sched_id: int=None) -> slice:
+        """Get the pitch rows for a pitcher, or a single game for a pitcher. Pitches are stored ordered by pitcher and game so these
+        are always contiguous.
+
+        Args:
+            pitcher_id (int): pitcher id
+            sched_id (int, optional): schedule id to filter to. Defaults to None.
+
+        Returns:
+            slice: pitch rows
+        """
+        pitcher_ids = self.pitches['pitcher_id']
+        first, last = np.searchsorted(pitcher_ids, pitcher_id, 'left'), np.searchsorted(pitcher_ids, pitcher_id, 'right')
+        if sched_id is not None:
+            sched_ids = self.pitches['sched_id'][first:last]
+            first, last = first + np.searchsorted(sched_ids, sched_id, 'left'), first + np.searchsorted(sched_ids, sched_id, 'right')
+        return slice(int(first), int(last))
+
+    def get_pitcher(self, pitcher_id: int, sched_id: int=None) -> tuple:
+        """Get every pitch for a pitcher, or a single game for a pitcher, without copying any trajectories.
+
+        Args:
+            pitcher_id (int): pitcher id
+            sched_id (int, optional): schedule id to filter to. Defaults to None.
+
+        Returns:
+            tuple: (pitch index rows, times, coordinates). Pitch offsets are relative to the whole store, subtract the first offset
+            to index into the returned arrays.
+        """
+        rows = self.get_pitcher_rows(pitcher_id, sched_id)
+        frames = self.get_frame_slice(rows.start, rows.stop)
+        return self.pitches[rows], self.times[frames], self.coords[frames]
+
+    def get_game_rows(self, sched_id: int) -> np.ndarray:
+        """Get the pitch rows for every pitcher in a game.
+
+        Args:
+            sched_id (int): schedule id
+
+        Returns:
+            np.ndarray: pitch rows
+        """
+        sorted_ids = self.pitches['sched_id'][self.sched_order]
+        first, last = np.searchsorted(sorted_ids, sched_id, 'left'), np.searchsorted(sorted_ids, sched_id, 'right')
+        return np.sort(self.sched_order[first:last])
+
+    def to_frame(self, rows=None) -> pd.DataFrame:
+        """Convert pitches back to the processed pitcher dataframe schema.
+
+        Args:
+            rows (optional): pitch rows to convert, e.g. from `get_pitcher_rows` or `get_game_rows`. Defaults to every pitch.
+
+        Returns:
+            pd.DataFrame: processed pitcher dataframe
+        """
+        pitches = self.pitches if rows is None else np.atleast_1d(self.pitches[rows])
+        lengths = pitches['length']
+        frame_rows, local_positions, _ = pp.get_segment_rows(pitches['offset'], pitches['offset'] + lengths - 1)
+
+        df = pd.DataFrame({col: np.repeat(pitches[col], lengths) for col in ['astros_pitch_id', 'sched_id', 'pitcher_id', 'bats', 'throws']})
+        df['bats'] = df['bats'].astype(object)
+        df['throws'] = df['throws'].astype(object)
+        df['time'] = self.times[frame_rows]
+        df[self.joint_cols] = self.coords[frame_rows].astype(np.float64)
+        df['start'] = (local_positions == 0).astype(np.float64)
+        df['release'] = (local_positions == np.repeat(lengths, lengths) - 1).astype(np.int64)
+        for col in pp.PERCENTILE_COLS:
+            df[col] = (local_positions == np.repeat(pitches[col], lengths)).astype(np.int64)
+        return df
@@ -13,4 +13,17 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=required,
+    entry_points={
+        'console_scripts': [
+            'pitch-path-process=pitch_path.scripts.process_pitchers:main',
+            'pitch-path-serve=pitch_path.scripts.serve_model:main',
+            'pitch-path-benchmark=pitch_path.scripts.benchmark:main',
+            'pitch-path-replay=pitch_path.scripts.replay_online:main',
+            'pitch-path-select-model=pitch_path.scripts.select_model:main',
+            'pitch-path-update-model=pitch_path.scripts.update_model:main',
+            'pitch-path-similar=pitch_path.scripts.similar_pitches:main',
+            'pitch-path-import-time=pitch_path.scripts.import_time:main',
+            'pitch-path-render=pitch_path.scripts.render_reports:main',
+        ],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import stat
+import pandas as pd
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.utils.cache import FeatureCache, get_umask, write_atomic
+from pitch_path.utils.synthetic import generate_raw_pitcher_df
+
+
+def write_raw_file(tmp_path) -> str:
+    file_name = str(tmp_path / "sched_id1000_pitcher500000.feather")
+    generate_raw_pitcher_df(n_pitches=2, sched_id=1000, pitcher_id=500000, seed=3).to_feather(file_name)
+    return file_name
+
+
+def test_write_atomic_uses_umask_permissions(tmp_path):
+    path = str(tmp_path / "file.json")
+    write_atomic(path, lambda p: open(p, 'w').close())
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~get_umask()
+
+def test_get_missing_entry(tmp_path):
+    assert FeatureCache(str(tmp_path)).get("missing") is None
+
+def test_cache_hit_and_window_invalidation(tmp_path):
+    file_name = write_raw_file(tmp_path)
+    cache = FeatureCache(str(tmp_path / "cache"))
+
+    first = PitcherDataProcessor(file_name, cache=cache)
+    assert first.pitcher_features_df is None
+    features_df = first.get_pitcher_features_df()
+
+    hit = PitcherDataProcessor(file_name, cache=cache)
+    assert hit.pitcher_df is not None and hit.pitcher_features_df is not None
+    pd.testing.assert_frame_equal(hit.pitcher_features_df, features_df)
+
+    miss = PitcherDataProcessor(file_name, cache=cache, leg_lift_window=20)
+    assert miss.get_cache_keys()['processed'] != hit.get_cache_keys()['processed']
+    assert miss.pitcher_df is None and miss.pitcher_features_df is None
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    df = pd.DataFrame({'x': range(10)})
+    cache = FeatureCache(str(tmp_path))
+    cache.put("a", df)
+    cache.max_bytes = os.path.getsize(cache.get_path("a"))
+    os.utime(cache.get_path("a"), (0, 0))
+    cache.put("b", df)
+    assert cache.get("a") is None
+    pd.testing.assert_frame_equal(cache.get("b"), df)
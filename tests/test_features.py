@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+import pitch_path.utils.features as feat
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.utils.synthetic import generate_raw_pitcher_df
+
+SCHED_ID = 1000
+PITCHER_ID = 500000
+JOINTS = ['wrist', 'elbow', 'shoulder']
+JOINT_COLS = [f"{joint}_{axis}" for joint in JOINTS for axis in feat.AXES]
+
+
+def get_processed_pitcher_df(tmp_path, throws: str) -> pd.DataFrame:
+    """Helper function to run a small synthetic raw file through the processor and return the start to release pitcher df."""
+    raw_df = generate_raw_pitcher_df(n_pitches=3, sched_id=SCHED_ID, pitcher_id=PITCHER_ID, throws=throws, seed=7)
+    file_name = str(tmp_path / f"sched_id{SCHED_ID}_pitcher{PITCHER_ID}.feather")
+    raw_df.to_feather(file_name)
+    return PitcherDataProcessor(file_name).get_pitcher_df()
+
+def interleave_pitches(df: pd.DataFrame) -> pd.DataFrame:
+    """Helper function to interleave the rows of different pitches while keeping the frame order within each pitch."""
+    frame = df.groupby('astros_pitch_id').cumcount()
+    return df.assign(frame=frame).sort_values(['frame', 'astros_pitch_id'], kind='stable').drop(columns=['frame'])
+
+def assert_features_match(df: pd.DataFrame) -> None:
+    expected = feat.generate_features_from_pitch_df(df.copy(), PITCHER_ID, SCHED_ID, JOINT_COLS, JOINTS)
+    actual = feat.generate_features(df, PITCHER_ID, SCHED_ID, JOINTS)
+
+    # the legacy version concats one row frames so every row has index 0
+    expected = expected.reset_index(drop=True)
+    assert list(actual.columns) == list(expected.columns)
+    assert actual.dtypes.equals(expected.dtypes)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.filterwarnings('ignore::pandas.errors.SettingWithCopyWarning')
+@pytest.mark.parametrize('throws', ['R', 'L'])
+def test_generate_features_matches_legacy(tmp_path, throws):
+    assert_features_match(get_processed_pitcher_df(tmp_path, throws))
+
+@pytest.mark.filterwarnings('ignore::pandas.errors.SettingWithCopyWarning')
+@pytest.mark.parametrize('throws', ['R', 'L'])
+def test_generate_features_matches_legacy_interleaved(tmp_path, throws):
+    df = interleave_pitches(get_processed_pitcher_df(tmp_path, throws))
+    assert df['astros_pitch_id'].iloc[0] != df['astros_pitch_id'].iloc[1]
+    assert_features_match(df)
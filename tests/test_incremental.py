@@ -0,0 +1,84 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from pitch_path.model import inference as inf
+from pitch_path.model.incremental import (get_partition_sched_ids, load_version, match_centroids, read_training_partitions,
+                                          rescale_centroids, update_model)
+from pitch_path.processing.data_processing import process_pitcher_file
+from pitch_path.utils.synthetic import write_synthetic_raw_files
+
+
+@pytest.fixture(scope='module')
+def features_dfs(tmp_path_factory):
+    raw_dir = str(tmp_path_factory.mktemp("raw"))
+    return [process_pitcher_file(f) for f in write_synthetic_raw_files(raw_dir, n_files=3, n_pitches=20, seed=3)]
+
+@pytest.fixture
+def model_dir(tmp_path):
+    model_dir = str(tmp_path / "model")
+    os.makedirs(model_dir)
+    for f in (inf.MODEL_FILE, inf.SCALER_FILE, inf.ARRAYS_FILE):
+        shutil.copy(os.path.join(inf.MODEL_DIR, f), model_dir)
+    return model_dir
+
+
+def test_match_centroids_recovers_permutation():
+    rng = np.random.default_rng(0)
+    old = rng.random((6, 4))
+    perm = rng.permutation(6)
+    new = old[perm] + rng.normal(0, 0.01, old.shape)
+    order = match_centroids(old, new)
+    np.testing.assert_array_equal(perm[order], np.arange(6))
+
+def test_updates_are_versioned(tmp_path, model_dir, features_dfs):
+    training_dir = str(tmp_path / "training")
+    assert update_model(features_dfs[0], training_dir, model_dir) == "v0001"
+    assert update_model(features_dfs[1], training_dir, model_dir) == "v0002"
+    assert inf.get_latest_version(model_dir) == "v0002"
+
+    _, _, state = load_version(model_dir)
+    assert state['parent'] == "v0001"
+    assert state['added_sched_ids'] == features_dfs[1]['sched_id'].unique().tolist()
+    assert state['n_samples'] == sum(df.shape[0] for df in features_dfs[:2]) == sum(state['counts'])
+
+    # serving picks up the latest version
+    served = inf.PitchPathModel.from_dir(model_dir)
+    latest = inf.PitchPathModel.from_dir(inf.get_version_dir(model_dir, "v0002"))
+    np.testing.assert_array_equal(served.centroids, latest.centroids)
+
+def test_duplicate_games_leave_model_unchanged(tmp_path, model_dir, features_dfs):
+    training_dir = str(tmp_path / "training")
+    update_model(features_dfs[0], training_dir, model_dir)
+    assert update_model(features_dfs[0], training_dir, model_dir) is None
+    assert inf.get_latest_version(model_dir) == "v0001"
+
+def test_games_without_features_are_not_written(tmp_path, model_dir, features_dfs):
+    training_dir = str(tmp_path / "training")
+    update_model(features_dfs[0], training_dir, model_dir)
+    missing_df = features_dfs[1].copy()
+    missing_df[inf.FEATURE_COLS] = np.nan
+    assert update_model(missing_df, training_dir, model_dir) is None
+    assert get_partition_sched_ids(training_dir) == features_dfs[0]['sched_id'].unique().tolist()
+
+def test_refit_without_training_data_raises(tmp_path, model_dir, features_dfs):
+    training_dir = str(tmp_path / "training")
+    with pytest.raises(Exception, match="needs at least"):
+        update_model(features_dfs[0].iloc[:0], training_dir, model_dir, force_refit=True)
+    assert get_partition_sched_ids(training_dir) == []
+
+def test_refit_keeps_cluster_ids(tmp_path, model_dir, features_dfs):
+    training_dir = str(tmp_path / "training")
+    old_model, old_scaler, _ = load_version(model_dir)
+    update_model(pd.concat(features_dfs), training_dir, model_dir, force_refit=True)
+    model, scaler, state = load_version(model_dir)
+
+    # every refit centroid is already in the slot of the old centroid it is matched to
+    old_centroids = rescale_centroids(old_model.cluster_centers_.astype(np.float64), old_scaler, scaler)
+    np.testing.assert_array_equal(match_centroids(old_centroids, model.cluster_centers_), np.arange(len(state['counts'])))
+
+    # the labels and counts were reordered with the centroids
+    X = scaler.transform(read_training_partitions(training_dir, columns=inf.FEATURE_COLS).dropna())
+    np.testing.assert_array_equal(model.predict(X), model.labels_)
+    np.testing.assert_array_equal(np.bincount(model.labels_, minlength=len(state['counts'])), state['counts'])
@@ -0,0 +1,31 @@
+import numpy as np
+from pitch_path.utils.instrumentation import Instrumentation, MemoryCollector, get_rss_bytes, stage
+
+
+def test_stages_only_recorded_when_active():
+    collector = MemoryCollector()
+    instrumentation = Instrumentation([collector])
+    with stage('outside') as record:
+        record['rows_out'] = 1
+    with instrumentation.activate(file='a'):
+        with stage('inside', rows_in=3) as record:
+            record['rows_out'] = 2
+    assert [r['stage'] for r in collector.records] == ['inside']
+    assert collector.records[0]['file'] == 'a'
+    assert (collector.records[0]['rows_in'], collector.records[0]['rows_out']) == (3, 2)
+
+def test_stage_memory_is_per_stage():
+    collector = MemoryCollector()
+    with Instrumentation([collector], trace_memory=True).activate():
+        with stage('big'):
+            big = np.ones(50 * 1024 ** 2 // 8)
+        with stage('small'):
+            small = np.ones(10)
+    del big, small
+    big_record, small_record = collector.records
+    assert big_record['peak_alloc_bytes'] >= 50 * 1024 ** 2
+    assert small_record['peak_alloc_bytes'] < 1024 ** 2
+    assert small_record['process_max_rss_bytes'] >= big_record['process_max_rss_bytes']
+    if get_rss_bytes() is not None:
+        assert big_record['rss_delta_bytes'] >= 40 * 1024 ** 2
+        assert small_record['rss_delta_bytes'] < 10 * 1024 ** 2
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from scipy.signal import savgol_coeffs, savgol_filter
+from pitch_path.utils import kinematics as kin
+
+# pitch lengths including ones shorter than the window and than half the window
+LENGTHS = [40, 7, 5, 2, 1, 25]
+
+
+def get_signal(seed: int=0) -> tuple:
+    rng = np.random.default_rng(seed)
+    offsets = np.concatenate([[0], np.cumsum(LENGTHS)])
+    values = np.cumsum(rng.normal(0, 0.1, (offsets[-1], 3)), axis=0) + rng.normal(0, 5, 3)
+    return values, offsets
+
+
+# higher polyorders aren't compared, scipy's own least squares loses digits there (about 2e-14 off the exact (11, 4) coefficients)
+@pytest.mark.parametrize('window,polyorder', [(7, 2), (5, 3), (9, 2), (15, 3), (3, 0), (1, 0)])
+def test_savgol_coefficients_match_scipy(window, polyorder):
+    np.testing.assert_allclose(kin.get_savgol_coefficients(window, polyorder), savgol_coeffs(window, polyorder), rtol=0, atol=2e-15)
+
+@pytest.mark.parametrize('window,polyorder', [(7, 2), (5, 3), (9, 2)])
+def test_smooth_segments_matches_scipy(window, polyorder):
+    values, offsets = get_signal()
+    smoothed = kin.smooth_segments(values, offsets, window, polyorder)
+    expected = np.concatenate([savgol_filter(values[start:end], window, polyorder, axis=0, mode='nearest')
+                               for start, end in zip(offsets[:-1], offsets[1:])])
+    # within 2e-15 relative to the size of the signal
+    np.testing.assert_allclose(smoothed, expected, rtol=0, atol=2e-15 * np.abs(values).max())
+
+def test_smoothing_stays_within_pitch():
+    values, offsets = get_signal()
+    smoothed = kin.smooth_segments(values, offsets)
+    # changing one pitch doesn't change the smoothing of its neighbours
+    values[offsets[1]:offsets[2]] += 100
+    changed = kin.smooth_segments(values, offsets)
+    unchanged = np.r_[0:offsets[1], offsets[2]:offsets[-1]]
+    np.testing.assert_array_equal(changed[unchanged], smoothed[unchanged])
+
+def test_savgol_coefficients_validation():
+    with pytest.raises(Exception, match="odd"):
+        kin.get_savgol_coefficients(6, 2)
+    with pytest.raises(Exception, match="less than the window"):
+        kin.get_savgol_coefficients(5, 5)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pitch_path.processing.data_processing import PitcherDataProcessor
+from pitch_path.utils.pitch_batch import FLAG_DTYPES, JOINTS_OF_INTEREST
+from pitch_path.utils.synthetic import write_synthetic_raw_files
+
+ID_COLS = ['pitcher_id', 'sched_id', 'astros_pitch_id']
+
+
+def get_processors(tmp_path, streaming: bool) -> tuple:
+    file_name = write_synthetic_raw_files(str(tmp_path), n_files=1, n_pitches=10, seed=4)[0]
+    return PitcherDataProcessor(file_name, streaming=streaming), PitcherDataProcessor(file_name, streaming=streaming, lean=True)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_lean_pitcher_df_matches_default(tmp_path, streaming):
+    processor, lean_processor = get_processors(tmp_path, streaming)
+    df, lean_df = processor.get_pitcher_df(), lean_processor.get_pitcher_df()
+    assert list(lean_df.columns) == list(df.columns)
+
+    # same segmentation, only the coordinates are rounded to float32
+    for col in ['astros_pitch_id', 'time'] + list(FLAG_DTYPES):
+        np.testing.assert_array_equal(lean_df[col].to_numpy(), df[col].to_numpy())
+    coord_cols = [col for col in df.columns if col[-2:] in ('_x', '_y', '_z')]
+    assert (lean_df[coord_cols].dtypes == np.float32).all()
+    np.testing.assert_allclose(lean_df[coord_cols].to_numpy(np.float64), df[coord_cols].to_numpy(), rtol=2 ** -24, atol=0)
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_lean_features_within_documented_tolerance(tmp_path, streaming):
+    processor, lean_processor = get_processors(tmp_path, streaming)
+    features_df, lean_features_df = processor.get_pitcher_features_df(), lean_processor.get_pitcher_features_df()
+    assert lean_features_df.dtypes.equals(features_df.dtypes)
+    assert (lean_features_df[ID_COLS].dtypes == np.int64).all()
+    pd.testing.assert_frame_equal(lean_features_df[ID_COLS], features_df[ID_COLS])
+
+    distance_cols = [f"distance_traveled_{joint}" for joint in JOINTS_OF_INTEREST]
+    checkpoint_cols = [col for col in features_df.columns if col not in distance_cols + ID_COLS]
+    np.testing.assert_allclose(lean_features_df[checkpoint_cols], features_df[checkpoint_cols], rtol=2 ** -24, atol=0)
+
+    # distance bound: 2**-23 * sqrt(3) * frames * the largest absolute coordinate of the pitch
+    df = processor.get_pitcher_df()
+    coord_cols = [col for col in df.columns if col[-2:] in ('_x', '_y', '_z')]
+    pitches = df[coord_cols].abs().max(axis=1).groupby(df['astros_pitch_id']).agg(['size', 'max'])
+    pitches = pitches.loc[features_df['astros_pitch_id']]
+    bound = 2 ** -23 * np.sqrt(3) * pitches['size'].to_numpy() * pitches['max'].to_numpy()
+    errors = (lean_features_df[distance_cols] - features_df[distance_cols]).abs().to_numpy()
+    assert (errors <= bound[:, None]).all()
+    assert errors.max() < 1e-4
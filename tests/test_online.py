@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from pitch_path.processing.online import OnlinePitchClassifier
+from pitch_path.scripts.replay_online import check_parity, replay_file
+from pitch_path.utils.synthetic import generate_raw_pitcher_df
+
+
+@pytest.mark.parametrize('throws', ['R', 'L'])
+def test_online_matches_batch(tmp_path, throws):
+    file_name = str(tmp_path / "sched_id1000_pitcher500000.feather")
+    generate_raw_pitcher_df(n_pitches=4, sched_id=1000, pitcher_id=500000, throws=throws, seed=4).to_feather(file_name)
+    processor, results, _, _ = replay_file(file_name)
+    parity = check_parity(processor, results)
+
+    assert parity['batch_pitches'] == parity['online_pitches'] == 4
+    assert parity['batch_only'] == [] and parity['online_only'] == []
+    assert parity['columns_match'] and parity['features_match']
+    assert parity['mismatched_labels'] == []
+
+def test_finished_pitches_are_bounded():
+    classifier = OnlinePitchClassifier(1, 1, 'R', max_finished_pitches=5)
+    coords = np.zeros((len(classifier.tracked_joints), 3))
+    for pitch_id in range(20):
+        classifier.update_frame(pitch_id, -0.1, coords)
+        classifier.update_frame(pitch_id, 0.0, coords)
+    assert sorted(classifier.finished_pitches) == [15, 16, 17, 18, 19]
+    assert classifier.pitches == {}
+    # late frames of a recently finished pitch are still ignored
+    assert classifier.update_frame(19, 0.01, coords) is None
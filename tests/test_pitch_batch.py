@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+import pitch_path.utils.features as feat
+import pitch_path.utils.preprocessing as pp
+from pitch_path.files.joints import JOINT_IDS
+from pitch_path.scripts.benchmark import legacy_pivot_to_wide
+from pitch_path.utils.pitch_batch import JOINTS_OF_INTEREST, METADATA_COLS, PitchBatch, get_handed_joints
+from pitch_path.utils.synthetic import generate_raw_pitcher_df
+
+SCHED_ID = 1000
+PITCHER_ID = 500000
+JOINT_COLS = [f"{joint}_{axis}" for joint in JOINTS_OF_INTEREST for axis in feat.AXES]
+
+
+def get_segmented(throws: str) -> tuple:
+    """Helper function to segment the same synthetic raw data with the legacy dataframe stages and with a `PitchBatch`."""
+    raw_df = generate_raw_pitcher_df(n_pitches=4, sched_id=SCHED_ID, pitcher_id=PITCHER_ID, throws=throws, seed=5)
+    joints = get_handed_joints(throws)
+
+    df = legacy_pivot_to_wide(raw_df)[METADATA_COLS + [f"{joint}_{axis}" for joint in joints for axis in feat.AXES]]
+    df = pp.set_release_point(pp.set_leg_lift_time(df, 'lKnee_z'))
+    legacy_df = pp.rename_handedness_cols(pp.filter_df_to_start_release(df)).reset_index(drop=True)
+
+    batch = PitchBatch.from_raw_frame(raw_df, [JOINT_IDS[joint] for joint in joints]).segment()
+    return legacy_df, batch
+
+
+@pytest.mark.filterwarnings('ignore::pandas.errors.SettingWithCopyWarning')
+@pytest.mark.parametrize('throws', ['R', 'L'])
+def test_segment_matches_legacy(throws):
+    legacy_df, batch = get_segmented(throws)
+    pd.testing.assert_frame_equal(batch.to_frame(), legacy_df)
+
+@pytest.mark.filterwarnings('ignore::pandas.errors.SettingWithCopyWarning')
+@pytest.mark.parametrize('throws', ['R', 'L'])
+def test_batch_features_match_legacy(throws):
+    legacy_df, batch = get_segmented(throws)
+    expected = feat.generate_features_from_pitch_df(legacy_df, PITCHER_ID, SCHED_ID, JOINT_COLS, JOINTS_OF_INTEREST)
+    pd.testing.assert_frame_equal(batch.generate_features(JOINTS_OF_INTEREST), expected.reset_index(drop=True))
+
+def test_frame_round_trip():
+    _, batch = get_segmented('R')
+    df = batch.to_frame()
+    pd.testing.assert_frame_equal(PitchBatch.from_frame(df).to_frame(), df)
@@ -0,0 +1,50 @@
+import os
+import pandas as pd
+from pitch_path.scripts.process_pitchers import FEATURES_DIR, TRAINING_DIR, TRAINING_FILE, run_batch
+from pitch_path.utils.cache import FeatureCache
+from pitch_path.utils.synthetic import write_synthetic_raw_files
+
+
+def get_statuses(results: list) -> list:
+    return sorted(r['status'] for r in results)
+
+
+def test_cached_rerun_skips_unchanged_files(tmp_path):
+    input_dir, output_dir = str(tmp_path / "raw"), str(tmp_path / "out")
+    write_synthetic_raw_files(input_dir, n_files=2, n_pitches=2, seed=1)
+    cache = FeatureCache(str(tmp_path / "cache"))
+    training_path = os.path.join(output_dir, TRAINING_DIR, TRAINING_FILE)
+
+    assert get_statuses(run_batch(input_dir, output_dir, workers=1, cache=cache)) == ['processed', 'processed']
+    training_mtime = os.stat(training_path).st_mtime_ns
+
+    # touching the raw files doesn't change their contents, so nothing is recomputed or rewritten
+    for f in os.listdir(input_dir):
+        os.utime(os.path.join(input_dir, f))
+    assert get_statuses(run_batch(input_dir, output_dir, workers=1, cache=cache)) == ['skipped', 'skipped']
+    assert os.stat(training_path).st_mtime_ns == training_mtime
+
+def test_parameter_change_reprocesses(tmp_path):
+    input_dir, output_dir = str(tmp_path / "raw"), str(tmp_path / "out")
+    write_synthetic_raw_files(input_dir, n_files=1, n_pitches=2, seed=2)
+
+    assert get_statuses(run_batch(input_dir, output_dir, workers=1)) == ['processed']
+    assert get_statuses(run_batch(input_dir, output_dir, workers=1)) == ['skipped']
+    assert get_statuses(run_batch(input_dir, output_dir, workers=1, leg_lift_window=20)) == ['processed']
+    assert len(os.listdir(os.path.join(output_dir, FEATURES_DIR))) == 1
+
+def test_failed_reprocess_drops_old_outputs(tmp_path):
+    input_dir, output_dir = str(tmp_path / "raw"), str(tmp_path / "out")
+    file_names = write_synthetic_raw_files(input_dir, n_files=2, n_pitches=2, seed=3)
+    run_batch(input_dir, output_dir, workers=1)
+    training_path = os.path.join(output_dir, TRAINING_DIR, TRAINING_FILE)
+    assert pd.read_feather(training_path)['sched_id'].nunique() == 2
+
+    # the file changes and can no longer be processed, its old features shouldn't stay in the training data
+    broken_df = pd.read_feather(file_names[0]).drop(columns=['time'])
+    broken_df.to_feather(file_names[0])
+    results = run_batch(input_dir, output_dir, workers=1)
+    assert get_statuses(results) == ['failed', 'skipped']
+    assert len(os.listdir(os.path.join(output_dir, FEATURES_DIR))) == 1
+    good_sched_id = pd.read_feather(file_names[1], columns=['sched_id'])['sched_id'][0]
+    assert pd.read_feather(training_path)['sched_id'].unique().tolist() == [good_sched_id]
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pandas as pd
+from pitch_path.model.incremental import load_version, save_version, make_state
+from pitch_path.model.inference import MODEL_FILE, PitchPathModel, get_latest_version
+from pitch_path.model.selection import save_model
+
+FEATURE_COLS = ['wrist_x_release', 'wrist_z_release', 'elbow_x_release', 'elbow_z_release']
+
+
+def get_training_features(n: int=60, seed: int=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 2, (3, len(FEATURE_COLS)))
+    return pd.DataFrame(centers[rng.integers(0, 3, n)] + rng.normal(0, 0.1, (n, len(FEATURE_COLS))), columns=FEATURE_COLS)
+
+
+def test_save_model_unversioned_dir(tmp_path):
+    save_model(get_training_features(), str(tmp_path), k=3, seed=1)
+    assert os.path.exists(tmp_path / MODEL_FILE)
+    assert get_latest_version(str(tmp_path)) is None
+
+def test_save_model_into_versioned_dir(tmp_path):
+    model_dir = str(tmp_path)
+    old_model, old_scaler = save_model(get_training_features(seed=1), model_dir, k=2, seed=1)
+    X = get_training_features(seed=1)
+    save_version(model_dir, old_model, old_scaler, make_state(model_dir, FEATURE_COLS, np.bincount(old_model.labels_), X.shape[0],
+                                                              (old_model.cluster_centers_ - old_scaler.min_) / old_scaler.scale_,
+                                                              full_refit=True))
+    assert get_latest_version(model_dir) == "v0001"
+
+    model, scaler = save_model(get_training_features(seed=2), model_dir, k=3, seed=1)
+    assert get_latest_version(model_dir) == "v0002"
+    served = PitchPathModel.from_dir(model_dir)
+    np.testing.assert_array_equal(served.centroids, model.cluster_centers_)
+
+    _, _, state = load_version(model_dir)
+    assert state['parent'] == "v0001" and state['full_refit']
+    assert sum(state['counts']) == state['n_samples'] == 60